@@ -0,0 +1,49 @@
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.session import get_db
+from app.db.models import Document
+from app.services.collections import CollectionExistsError, collection_dirs, create_collection, list_collections
+from app.services.vector_store import read_manifest
+
+router = APIRouter(prefix="/v1/collections", tags=["collections"])
+
+
+class CreateCollectionRequest(BaseModel):
+    name: str = Field(min_length=1, max_length=64)
+    shards: int = Field(default=1, ge=1, le=settings.COLLECTION_MAX_SHARDS)
+
+
+def _vector_count(name: str) -> int:
+    # From the shard manifests alone, so listing never loads index data
+    total = 0
+    for path in collection_dirs(name):
+        manifest = read_manifest(path) or {}
+        total += sum(int(seg.get("count") or 0) for seg in manifest.get("segments", []))
+    return total
+
+
+@router.get("")
+def get_collections(db: Session = Depends(get_db)):
+    docs = dict(db.query(Document.collection, func.count(Document.id)).group_by(Document.collection).all())
+    return [
+        {**c, "documents": docs.get(c["name"], 0), "vectors": _vector_count(c["name"])}
+        for c in list_collections()
+    ]
+
+
+@router.post("", status_code=201)
+def post_collection(req: CreateCollectionRequest):
+    """
+    Registers an empty collection split into `shards` hash partitions. Upload into it
+    with the `collection` form field and query it with the `collection` body field.
+    """
+    try:
+        return create_collection(req.name, req.shards)
+    except CollectionExistsError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -1,166 +1,243 @@
 import os
 import shutil
 import time
+import uuid
 
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
 from app.core.config import settings
 from app.db.session import get_db
-from app.db.models import Document, Chunk
-from app.services.extractor import extract_text, SUPPORTED_EXTS
-from app.services.chunker import chunk_text
-from app.services.embedder import embed_texts, persist_embedding_dim
-from app.services.vector_store import FaissStore
+from app.db.models import Document
+from app.services.collections import DEFAULT_COLLECTION, CollectionNotFoundError, collection_dirs
+from app.services.extractor import SUPPORTED_EXTS
+from app.services.jobs import create_job, is_ingesting, reserved_slots, QueueFullError
+from app.services.ingest import delete_document
 
 router = APIRouter(prefix="/v1/documents", tags=["documents"])
 
 
 @router.get("")
-def list_documents(db: Session = Depends(get_db)):
-    docs = db.query(Document).order_by(Document.created_at.desc()).all()
+def list_documents(collection: str | None = None, db: Session = Depends(get_db)):
+    q = db.query(Document)
+    if collection is not None:
+        q = q.filter(Document.collection == collection)
+    docs = q.order_by(Document.created_at.desc()).all()
     return [
         {
             "document_id": d.id,
             "filename": d.filename,
             "source_type": d.source_type,
+            "collection": d.collection,
             "created_at": d.created_at.isoformat(),
         }
         for d in docs
     ]
 
 
-@router.post("/upload")
-async def upload_documents(files: list[UploadFile] = File(...), db: Session = Depends(get_db)):
+def _validate_ext(f: UploadFile) -> None:
+    _, ext = os.path.splitext(f.filename or "")
+    ext = (ext or "").lower()
+    if ext not in SUPPORTED_EXTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported file type '{ext}'. Supported: {sorted(SUPPORTED_EXTS)}",
+        )
+
+
+def _write_upload(doc: Document, f: UploadFile) -> str:
+    # Save file to disk: copied to a temp name first, then moved over the target, so a
+    # failed copy never truncates an upload already there (same-name replacement)
+    safe_name = f"{doc.id}_{os.path.basename(f.filename)}"
+    file_path = os.path.join(settings.UPLOAD_DIR, safe_name)
+    tmp_path = os.path.join(settings.UPLOAD_DIR, f".upload-{uuid.uuid4().hex}.tmp")
+
+    t = time.perf_counter()
+    try:
+        with open(tmp_path, "wb") as out:
+            shutil.copyfileobj(f.file, out)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    print(f"[UPLOAD] Saved file in {time.perf_counter() - t:.2f}s path={file_path}")
+    return file_path
+
+
+def _save_uploads(db: Session, files: list[UploadFile], collection: str) -> list[dict]:
+    """
+    Blocking part of an upload that must happen before the request returns:
+    validate extensions, create Document rows and copy the streams to disk.
+    Runs in the threadpool so it does not stall the event loop.
+    """
+    for f in files:
+        _validate_ext(f)
+
+    # Ids are assigned up front so files are copied before the (single, short) write
+    # transaction for all doc records opens
+    docs = [
+        Document(id=str(uuid.uuid4()), filename=f.filename, source_type="upload", collection=collection)
+        for f in files
+    ]
+
+    saved: list[dict] = []
+    try:
+        for doc, f in zip(docs, files):
+            file_path = _write_upload(doc, f)
+            saved.append({"document_id": doc.id, "filename": f.filename, "path": file_path})
+        db.add_all(docs)
+        db.commit()
+    except Exception:
+        db.rollback()
+        for item in saved:
+            try:
+                os.remove(item["path"])
+            except OSError:
+                pass
+        raise
+
+    return saved
+
+
+def _save_replacement(db: Session, doc: Document, f: UploadFile) -> dict:
+    _validate_ext(f)
+
+    # The new file first: the old one stays if copying fails (a same-name upload is only
+    # replaced once fully copied); chunks are swapped by the job
+    file_path = _write_upload(doc, f)
+    doc.filename = f.filename
+    db.commit()
+
+    # Then drop the previous upload files of this document
+    prefix = f"{doc.id}_"
+    for name in os.listdir(settings.UPLOAD_DIR):
+        path = os.path.join(settings.UPLOAD_DIR, name)
+        if name.startswith(prefix) and path != file_path:
+            os.remove(path)
+    return {"document_id": doc.id, "filename": f.filename, "path": file_path, "replace": True}
+
+
+@router.post("/upload", status_code=202)
+async def upload_documents(
+    files: list[UploadFile] = File(...),
+    collection: str = Form(DEFAULT_COLLECTION),
+    db: Session = Depends(get_db),
+):
+    """
+    Saves the files and queues them for background ingestion into `collection`.
+    Poll GET /v1/jobs/{job_id} for per-file stage progress.
+    """
     if not files:
         raise HTTPException(status_code=400, detail="No files provided.")
+    try:
+        collection_dirs(collection)
+    except CollectionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
     os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
     os.makedirs(settings.FAISS_DIR, exist_ok=True)
 
-    uploaded: list[dict] = []
-
-    store: FaissStore | None = None
-
-    # Safety limits (prevents huge RAM usage / long calls)
-    MAX_TEXT_CHARS = int(os.getenv("MAX_TEXT_CHARS", "60000"))
-    MAX_CHUNKS = int(os.getenv("MAX_CHUNKS", "25"))
+    # Queue capacity is reserved before anything is written, so a full queue leaves no
+    # Document rows or files behind
+    try:
+        with reserved_slots(len(files)):
+            try:
+                saved = await run_in_threadpool(_save_uploads, db, files, collection)
+            except HTTPException:
+                # pass FastAPI errors through
+                raise
+            except Exception as e:
+                # rollback to avoid DB lock/partial writes
+                db.rollback()
+                print(f"[UPLOAD][ERROR] error={e}")
+                raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+            finally:
+                # Close upload streams
+                for f in files:
+                    try:
+                        await f.close()
+                    except Exception:
+                        pass
+
+            job_id = create_job(saved, reserved=True)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/v1/jobs/{job_id}",
+        "collection": collection,
+        "documents": [{"document_id": d["document_id"], "filename": d["filename"]} for d in saved],
+    }
+
+
+@router.put("/{document_id}", status_code=202)
+async def replace_document(document_id: str, file: UploadFile = File(...), db: Session = Depends(get_db)):
+    """
+    Re-uploads a document under the same id. The old version's vectors are tombstoned
+    when the new version is indexed; poll GET /v1/jobs/{job_id} for progress.
+    """
+    doc = db.get(Document, document_id)
+    if doc is None:
+        raise HTTPException(status_code=404, detail=f"Document '{document_id}' not found.")
 
-    for f in files:
-        overall_start = time.perf_counter()
+    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
 
-        try:
-            _, ext = os.path.splitext(f.filename or "")
-            ext = (ext or "").lower()
-            if ext not in SUPPORTED_EXTS:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Unsupported file type '{ext}'. Supported: {sorted(SUPPORTED_EXTS)}",
-                )
-
-            # Create doc record
-            doc = Document(filename=f.filename, source_type="upload")
-            db.add(doc)
-            db.commit()
-            db.refresh(doc)
-
-            print(f"[UPLOAD] Start doc_id={doc.id} file={f.filename}")
-
-            # Save file to disk
-            safe_name = f"{doc.id}_{os.path.basename(f.filename)}"
-            file_path = os.path.join(settings.UPLOAD_DIR, safe_name)
-
-            t = time.perf_counter()
-            with open(file_path, "wb") as out:
-                shutil.copyfileobj(f.file, out)
-
-            # Close upload stream
+    # Reserve queue capacity before the document is touched (see upload_documents)
+    try:
+        with reserved_slots(1):
             try:
-                await f.close()
-            except Exception:
-                pass
-
-            print(f"[UPLOAD] Saved file in {time.perf_counter() - t:.2f}s path={file_path}")
-
-            # Extract
-            t = time.perf_counter()
-            text = extract_text(file_path)
-            print(f"[UPLOAD] Extracted chars={len(text)} in {time.perf_counter() - t:.2f}s")
-
-            # Trim huge docs (demo-safe)
-            if len(text) > MAX_TEXT_CHARS:
-                print(f"[UPLOAD] Trimming text {len(text)} -> {MAX_TEXT_CHARS}")
-                text = text[:MAX_TEXT_CHARS]
-
-            # Chunk
-            print("[UPLOAD] Chunking start...")
-            t = time.perf_counter()
-            chunks = chunk_text(text)
-            print(f"[UPLOAD] Chunking done chunks={len(chunks)} in {time.perf_counter() - t:.2f}s")
-
-            if not chunks:
-                uploaded.append({"document_id": doc.id, "filename": f.filename, "chunks": 0})
-                print(f"[UPLOAD] Done (no chunks). total={time.perf_counter() - overall_start:.2f}s")
-                continue
-
-            # Limit chunks (demo-safe)
-            if len(chunks) > MAX_CHUNKS:
-                print(f"[UPLOAD] Limiting chunks {len(chunks)} -> {MAX_CHUNKS}")
-                chunks = chunks[:MAX_CHUNKS]
-
-            # Embed
-            print("[UPLOAD] Embedding start...")
-            t = time.perf_counter()
-            vectors = embed_texts(chunks)  # (n, dim)
-            print(f"[UPLOAD] Embedding done shape={vectors.shape} in {time.perf_counter() - t:.2f}s")
-
-            embedding_dim = int(vectors.shape[1])
-            persist_embedding_dim(embedding_dim)
-
-            # Load FAISS store once we know dim
-            if store is None:
-                t = time.perf_counter()
-                store = FaissStore(dim=embedding_dim).load_or_create()
-                print(f"[UPLOAD] FAISS load_or_create in {time.perf_counter() - t:.2f}s")
-
-            # Add to FAISS
-            t = time.perf_counter()
-            faiss_ids = store.add(vectors)
-            print(f"[UPLOAD] FAISS add vectors={len(faiss_ids)} in {time.perf_counter() - t:.2f}s")
-
-            # Store chunks in DB with faiss_id mapping
-            t = time.perf_counter()
-            for idx, (chunk_val, fid) in enumerate(zip(chunks, faiss_ids)):
-                db.add(
-                    Chunk(
-                        document_id=doc.id,
-                        chunk_index=idx,
-                        text=chunk_val,
-                        faiss_id=fid,
-                    )
-                )
-            db.commit()
-            print(f"[UPLOAD] DB commit chunks={len(faiss_ids)} in {time.perf_counter() - t:.2f}s")
-
-            # Save FAISS index
-            t = time.perf_counter()
-            store.save()
-            print(f"[UPLOAD] FAISS save in {time.perf_counter() - t:.2f}s")
-
-            # Free memory sooner
-            del vectors
-            del chunks
-
-            uploaded.append({"document_id": doc.id, "filename": f.filename, "chunks": len(faiss_ids)})
-            print(f"[UPLOAD] Done doc_id={doc.id} total={time.perf_counter() - overall_start:.2f}s")
-
-        except HTTPException:
-            # pass FastAPI errors through
-            raise
-        except Exception as e:
-            # rollback to avoid DB lock/partial writes
-            db.rollback()
-            print(f"[UPLOAD][ERROR] file={getattr(f, 'filename', None)} error={e}")
-            raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
-
-    return {"uploaded": uploaded}
+                saved = await run_in_threadpool(_save_replacement, db, doc, file)
+            except HTTPException:
+                raise
+            except Exception as e:
+                db.rollback()
+                print(f"[UPLOAD][ERROR] replace doc_id={document_id} error={e}")
+                raise HTTPException(status_code=500, detail=f"Replace failed: {str(e)}")
+            finally:
+                try:
+                    await file.close()
+                except Exception:
+                    pass
+
+            job_id = create_job([saved], reserved=True)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/v1/jobs/{job_id}",
+        "documents": [{"document_id": doc.id, "filename": saved["filename"]}],
+    }
+
+
+@router.delete("/{document_id}")
+def remove_document(document_id: str, db: Session = Depends(get_db)):
+    """
+    Deletes the document and tombstones its vectors (no re-embedding); space is
+    reclaimed by background compaction. Refused (409) while an ingest job for the
+    document is queued or running, since it would index vectors the delete cannot see.
+    """
+    doc = db.get(Document, document_id)
+    if doc is None:
+        raise HTTPException(status_code=404, detail=f"Document '{document_id}' not found.")
+    if is_ingesting(document_id):
+        raise HTTPException(
+            status_code=409,
+            detail=f"Document '{document_id}' is being ingested; retry when its job has finished.",
+        )
+
+    try:
+        removed = delete_document(db, doc)
+    except Exception as e:
+        db.rollback()
+        print(f"[DELETE][ERROR] doc_id={document_id} error={e}")
+        raise HTTPException(status_code=500, detail=f"Delete failed: {str(e)}")
+
+    return {"document_id": document_id, "deleted": True, "chunks_removed": removed}
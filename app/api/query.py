@@ -1,31 +1,180 @@
+import json
+import time
+from datetime import datetime
+from typing import Annotated, Iterator, Literal
+
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
 from app.core.config import settings
 from app.db.session import get_db
-from app.services.vector_store import FaissStore
-from app.services.rag import answer_question
+from app.services.collections import DEFAULT_COLLECTION, Collection, CollectionNotFoundError, get_collection
+from app.services.rag import (
+    answer_batch,
+    answer_question,
+    filter_vector_ids,
+    search_chunks,
+    lookup_cached_answer,
+    prepare_context,
+    remember_answer,
+    replay_answer,
+    stream_answer,
+)
 from app.services.embedder import get_embedding_dim
+from app.services.metrics import span, trace
 
 router = APIRouter(prefix="/v1", tags=["query"])
 
 class QueryRequest(BaseModel):
     question: str = Field(min_length=3, max_length=5000)
+    collection: str = DEFAULT_COLLECTION
     top_k: int | None = None
+    # Answer pipeline override: "multi" | "fast" (default RAG_PIPELINE_MODE)
+    mode: Literal["multi", "fast"] | None = None
+    # Same as POST /v1/query/stream
+    stream: bool = False
+    # Add a per-stage timing breakdown ("timings") to the response
+    debug: bool = False
 
-@router.post("/query")
-def query(req: QueryRequest, db: Session = Depends(get_db)):
+
+class BatchQueryRequest(BaseModel):
+    questions: list[Annotated[str, Field(min_length=3, max_length=5000)]] = Field(min_length=1, max_length=settings.QUERY_BATCH_MAX_QUESTIONS)
+    collection: str = DEFAULT_COLLECTION
+    top_k: int | None = None
+    mode: Literal["multi", "fast"] | None = None
+    # Skip the LLM: return only the retrieved citations per question
+    retrieval_only: bool = False
+    # LLM answers generated at once (default QUERY_BATCH_CONCURRENCY)
+    concurrency: int | None = Field(default=None, ge=1, le=64)
+
+
+class SearchRequest(BaseModel):
+    query: str = Field(min_length=1, max_length=5000)
+    collection: str = DEFAULT_COLLECTION
+    top_k: int | None = None
+    # Filters (combined with AND); applied inside the FAISS search, not after it
+    document_ids: list[str] | None = None
+    source_types: list[str] | None = None
+    created_from: datetime | None = None
+    created_to: datetime | None = None
+    debug: bool = False
+
+
+def _resolve(req: QueryRequest | BatchQueryRequest | SearchRequest) -> tuple[Collection, int]:
     top_k = req.top_k or settings.TOP_K_DEFAULT
     if top_k < 1:
         top_k = 1
     if top_k > settings.MAX_TOP_K:
         top_k = settings.MAX_TOP_K
 
+    # Shared, process-resident shard indexes (reloaded only when ingestion writes a new version)
     dim = get_embedding_dim()
-    store = FaissStore(dim=dim).load_or_create()
+    try:
+        store = get_collection(req.collection, dim)
+    except CollectionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
     if store.count() == 0:
-        raise HTTPException(status_code=400, detail="No documents indexed yet. Upload documents first.")
+        raise HTTPException(status_code=400, detail=f"No documents indexed in collection '{req.collection}' yet. Upload documents first.")
+    return store, top_k
+
+
+def _sse(events: Iterator[tuple[str, dict]]) -> Iterator[str]:
+    for event, payload in events:
+        yield f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def _stream_response(req: QueryRequest, db: Session) -> StreamingResponse:
+    store, top_k = _resolve(req)
+    # Streaming always runs the multi-call answer, so it shares that mode's cache entries
+    cached, qvec, scope = lookup_cached_answer(store, req.question, top_k, "multi")
+    if cached is not None:
+        events = replay_answer(cached)
+    else:
+        # Retrieval and citation lookups happen here, before the response starts, so the
+        # generator never touches the DB session (it is closed once the handler returns).
+        ctx = prepare_context(db, store, req.question, top_k, qvec=qvec)
+        events = stream_answer(
+            req.question,
+            ctx,
+            on_result=lambda result: remember_answer(scope, req.question, result, qvec),
+        )
+    return StreamingResponse(
+        _sse(events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/query")
+def query(req: QueryRequest, db: Session = Depends(get_db)):
+    if req.stream:
+        return _stream_response(req, db)
+
+    store, top_k = _resolve(req)
+    with trace() as tr:
+        result = answer_question(db, store, req.question, top_k, mode=req.mode)
+    if req.debug:
+        result = {**result, "timings": tr.breakdown()}
+    return result
+
+
+@router.post("/query/stream")
+def query_stream(req: QueryRequest, db: Session = Depends(get_db)):
+    """
+    Server-sent events: `citations` as soon as retrieval finishes, then `token` events
+    with answer deltas, then `answer`, `assessment` and `done` (or `error`).
+    """
+    return _stream_response(req, db)
+
+
+@router.post("/query/batch")
+def query_batch(req: BatchQueryRequest, db: Session = Depends(get_db)):
+    """
+    Many questions in one request (evaluation runs, cache pre-warming): one embedding
+    pass and one matrix search for all of them, then LLM stages with bounded concurrency.
+    Results come back in request order; a failed item carries "error" instead of "result".
+    """
+    store, top_k = _resolve(req)
+    t = time.perf_counter()
+    results = answer_batch(
+        db, store, req.questions, top_k,
+        mode=req.mode, retrieval_only=req.retrieval_only, concurrency=req.concurrency,
+    )
+    return {
+        "results": results,
+        "count": len(results),
+        "cached": sum(1 for r in results if r.get("cached")),
+        "errors": sum(1 for r in results if "error" in r),
+        "latency_ms": round((time.perf_counter() - t) * 1000, 1),
+    }
+
 
-    return answer_question(db, store, req.question, top_k)
+@router.post("/search")
+def search(req: SearchRequest, db: Session = Depends(get_db)):
+    """
+    Retrieval only, no LLM call: ranked chunks with scores and document info.
+    Filters on document_ids / source_types / created_at range restrict the vector search
+    itself (FAISS ID selector), so top_k is always filled from matching chunks.
+    """
+    store, top_k = _resolve(req)
+    with trace() as tr, span("search.total") as total:
+        with span("search.filter"):
+            allowed = filter_vector_ids(
+                db, store,
+                document_ids=req.document_ids,
+                source_types=req.source_types,
+                created_from=req.created_from,
+                created_to=req.created_to,
+            )
+        results = search_chunks(db, store, req.query, top_k, allowed_ids=allowed)
+    out = {
+        "results": results,
+        "count": len(results),
+        "latency_ms": round(total.seconds * 1000, 1),
+    }
+    if req.debug:
+        out["timings"] = tr.breakdown()
+    return out
@@ -0,0 +1,80 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.core import startup
+from app.services import metrics
+from app.services.answer_cache import answer_cache
+from app.services.collections import collection_dirs, list_collections
+from app.services.context_assembly import assembly_stats
+from app.services.embed_cache import embedding_cache
+from app.services.pipeline_stats import pipeline_stats
+from app.services.vector_store import read_manifest
+
+router = APIRouter(prefix="/v1/stats", tags=["stats"])
+metrics_router = APIRouter(tags=["stats"])
+
+
+@router.get("")
+def stats():
+    return {
+        "embed_cache": embedding_cache.stats(),
+        "answer_pipeline": pipeline_stats.stats(),
+        "answer_cache": answer_cache.stats(),
+        "context_assembly": assembly_stats.stats(),
+        "startup": startup.report(),
+    }
+
+
+def _cache_metrics():
+    embed = embedding_cache.stats()
+    answer = answer_cache.stats()
+    return [
+        ("kb_embed_cache_lookups_total", "counter", "Embedding cache lookups by result.", [
+            ({"result": "memory_hit"}, embed["memory_hits"]),
+            ({"result": "db_hit"}, embed["db_hits"]),
+            ({"result": "miss"}, embed["misses"]),
+        ]),
+        ("kb_answer_cache_lookups_total", "counter", "Answer cache lookups by result.", [
+            ({"result": "exact_hit"}, answer["exact_hits"]),
+            ({"result": "semantic_hit"}, answer["semantic_hits"]),
+            ({"result": "miss"}, answer["misses"]),
+        ]),
+        ("kb_answer_cache_items", "gauge", "Answers currently cached.", [({}, answer["items"])]),
+    ]
+
+
+def _index_metrics():
+    # From the manifests alone, so a scrape never loads index data
+    segments, vectors = [], []
+    for c in list_collections():
+        labels = {"collection": c["name"]}
+        segs = [seg for path in collection_dirs(c["name"]) for seg in (read_manifest(path) or {}).get("segments", [])]
+        segments.append((labels, len(segs)))
+        vectors.append((labels, sum(int(seg.get("count") or 0) for seg in segs)))
+    return [
+        ("kb_index_segments", "gauge", "Index segments listed in the manifests, per collection.", segments),
+        ("kb_index_vectors", "gauge", "Vectors stored in index segments (tombstoned ones included), per collection.",
+         vectors),
+    ]
+
+
+def _startup_metrics():
+    phases = startup.report()["phases"]
+    return [
+        ("kb_startup_phase_seconds", "gauge", "Duration of cold-start phases (import, startup, warmup steps).",
+         [({"phase": name}, p["seconds"]) for name, p in phases.items()]),
+    ]
+
+
+metrics.register_collector(_cache_metrics)
+metrics.register_collector(_index_metrics)
+metrics.register_collector(_startup_metrics)
+
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """
+    Prometheus text format: per-stage latency histograms (kb_stage_seconds), LLM call and
+    token counters, query/ingest counters, cache hit counters and index gauges.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,314 @@
+"""
+Maintenance commands for the FAISS index.
+
+    python -m app.cli rebuild-index [--type flat|ivf|hnsw] [--collection NAME]
+    python -m app.cli compact-index
+    python -m app.cli merge-segments [--all]
+    python -m app.cli quantize-index --quant sq8|fp16|pq|none [--type flat|ivf|hnsw] [--collection NAME] [--queries 200] [--k 10]
+    python -m app.cli eval-index [--types ivf hnsw] [--quant none sq8] [--queries 200] [--k 10] [--synthetic N]
+    python -m app.cli create-collection NAME [--shards 1]
+    python -m app.cli reshard-collection NAME --shards N
+    python -m app.cli startup-report [--top 15] [--max-import-ms N]
+
+Commands that write the index take the same writer lock as ingestion, so a running
+server's uploads wait for them (and vice versa).
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.lazy import lazy_import
+from app.services.collections import (
+    DEFAULT_COLLECTION,
+    collection_dirs,
+    create_collection,
+    list_collections,
+    read_registry,
+    reshard_collection,
+)
+from app.services.embedder import get_embedding_dim
+from app.services.index_eval import compare_to_exact, exact_neighbors, sample_queries, store_recall
+from app.services.index_writer import compact_index, db_chunk_lookup, merge_segments
+from app.services.vector_store import INDEX_TYPES, QUANTIZATIONS, FaissStore, build_index, index_kind, writer_lock
+
+faiss = lazy_import("faiss")
+
+
+def _shard_stores(collection: str) -> list[FaissStore]:
+    try:
+        dirs = collection_dirs(collection)
+    except LookupError as e:
+        raise SystemExit(str(e))
+    dim = get_embedding_dim()
+    return [FaissStore(dim=dim, path=path).load_or_create() for path in dirs]
+
+
+def cmd_rebuild_index(args: argparse.Namespace) -> None:
+    with writer_lock:
+        for store in _shard_stores(args.collection):
+            before = store.kinds()
+
+            t = time.perf_counter()
+            store.rebuild(args.type, lookup=db_chunk_lookup)
+            store.save()
+            print(
+                f"[FAISS] Rebuilt {store.count()} vectors of {store.path}: {before} -> {store.kinds()} "
+                f"in {time.perf_counter() - t:.2f}s"
+            )
+
+
+def cmd_compact_index(args: argparse.Namespace) -> None:
+    reclaimed = compact_index()
+    print(f"[FAISS] Reclaimed {reclaimed} tombstoned vectors")
+
+
+def cmd_merge_segments(args: argparse.Namespace) -> None:
+    merged = merge_segments(all_segments=args.all)
+    dim = get_embedding_dim()
+    print(f"[FAISS] Merged {merged} segments")
+    for name in read_registry():
+        for path in collection_dirs(name):
+            store = FaissStore(dim=dim, path=path).load_or_create(load_segments=False)
+            print(f"[FAISS]   {name} {path}: {len(store.segments)} segments {store.kinds()}")
+
+
+def _disk_usage(store: FaissStore) -> dict:
+    # Index files are what a query process loads into RAM; float32 copies stay on disk (mmap)
+    stored = sum(seg.count for seg in store.segments)
+    index_bytes = sum(os.path.getsize(os.path.join(store.path, seg.file)) for seg in store.segments if seg.file)
+    return {
+        "kinds": store.kinds(),
+        "index_bytes": index_bytes,
+        "bytes_per_vector": round(index_bytes / stored, 1) if stored else 0.0,
+        "float32_on_disk_bytes": sum(
+            os.path.getsize(os.path.join(store.path, seg.vectors_file))
+            for seg in store.segments if seg.vectors_file
+        ),
+    }
+
+
+def cmd_quantize_index(args: argparse.Namespace) -> None:
+    with writer_lock:
+        stores = [store for store in _shard_stores(args.collection) if store.count()]
+        if not stores:
+            raise SystemExit("No vectors indexed yet. Upload documents first.")
+        for store in stores:
+            _quantize_store(store, args)
+    if args.quant != settings.FAISS_QUANTIZATION:
+        print(f"[FAISS][WARN] Set FAISS_QUANTIZATION={args.quant} so background merges keep this codec")
+
+
+def _quantize_store(store: FaissStore, args: argparse.Namespace) -> None:
+    ids, vectors = store.id_vectors()
+
+    # Ground truth from the current vectors (exact unless the index is already compressed)
+    queries = sample_queries(vectors, args.queries)
+    truth = exact_neighbors(vectors, ids, queries, args.k)
+    before = {**_disk_usage(store), **store_recall(store, truth, queries, args.k)}
+
+    t = time.perf_counter()
+    store.rebuild(args.type, lookup=db_chunk_lookup, quant=args.quant)
+    store.save()
+    build_s = time.perf_counter() - t
+
+    after = _disk_usage(store)
+    rescore = settings.FAISS_RESCORE
+    try:
+        settings.FAISS_RESCORE = False
+        after["recall_quantized"] = store_recall(store, truth, queries, args.k)
+        settings.FAISS_RESCORE = True
+        after["recall_rescored"] = store_recall(store, truth, queries, args.k)
+    finally:
+        settings.FAISS_RESCORE = rescore
+
+    saved = 1 - after["index_bytes"] / before["index_bytes"] if before["index_bytes"] else 0.0
+    print(
+        f"[FAISS] Quantized {store.count()} vectors of {store.path} {before['kinds']} -> {after['kinds']} in {build_s:.2f}s: "
+        f"{before['index_bytes'] / 1e6:.1f} MB -> {after['index_bytes'] / 1e6:.1f} MB in RAM ({saved:.0%} saved)"
+    )
+    print(json.dumps({
+        "path": store.path,
+        "vectors": int(vectors.shape[0]),
+        "queries": int(queries.shape[0]),
+        "k": int(args.k),
+        "before": before,
+        "after": after,
+        "settings": {"FAISS_PQ_M": settings.FAISS_PQ_M, "FAISS_RESCORE_FACTOR": settings.FAISS_RESCORE_FACTOR},
+    }, indent=2))
+
+
+def _synthetic_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    # Clustered data behaves more like real embeddings than uniform noise
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // 100), dim)).astype(np.float32)
+    assign = rng.integers(0, centers.shape[0], size=n)
+    vecs = centers[assign] + 0.3 * rng.standard_normal((n, dim)).astype(np.float32)
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+def cmd_eval_index(args: argparse.Namespace) -> None:
+    if args.synthetic:
+        vectors = _synthetic_vectors(args.synthetic, get_embedding_dim())
+    else:
+        _, vectors = FaissStore(dim=get_embedding_dim()).load_or_create().id_vectors()  # default collection
+    if vectors.shape[0] == 0:
+        raise SystemExit("No vectors indexed yet. Upload documents or pass --synthetic N.")
+
+    candidates = {}
+    for index_type in args.types:
+        for quant in args.quant:
+            name = index_type if quant == "none" else f"{index_type}+{quant}"
+            t = time.perf_counter()
+            index = build_index(vectors.shape[1], index_type, vectors, quant=quant)
+            print(f"[EVAL] Built {index_kind(index)} for '{name}' in {time.perf_counter() - t:.2f}s")
+            candidates[name] = index
+
+    queries = sample_queries(vectors, args.queries)
+    report = compare_to_exact(candidates, vectors, queries, args.k)
+    # Raw index recall (no rescoring); see quantize-index for the rescored numbers
+    for name, index in candidates.items():
+        report["results"][name]["bytes_per_vector"] = round(faiss.serialize_index(index).nbytes / index.ntotal, 1)
+    report["settings"] = {
+        "FAISS_IVF_NLIST": settings.FAISS_IVF_NLIST,
+        "FAISS_IVF_NPROBE": settings.FAISS_IVF_NPROBE,
+        "FAISS_HNSW_M": settings.FAISS_HNSW_M,
+        "FAISS_HNSW_EF_SEARCH": settings.FAISS_HNSW_EF_SEARCH,
+        "FAISS_PQ_M": settings.FAISS_PQ_M,
+    }
+    print(json.dumps(report, indent=2))
+
+
+def cmd_create_collection(args: argparse.Namespace) -> None:
+    try:
+        create_collection(args.name, args.shards)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    print(json.dumps(list_collections(), indent=2))
+
+
+def cmd_reshard_collection(args: argparse.Namespace) -> None:
+    t = time.perf_counter()
+    try:
+        collection = reshard_collection(args.name, get_embedding_dim(), args.shards, lookup=db_chunk_lookup)
+    except (LookupError, ValueError) as e:
+        raise SystemExit(str(e))
+    counts = [store.count() for store in collection.stores]
+    print(f"[COLLECTION] '{args.name}' per-shard vectors {counts} in {time.perf_counter() - t:.2f}s")
+
+
+# Deferred in app code (app.core.lazy / inside functions); importing app.main must not load them
+_DEFERRED_MODULES = ("faiss", "pypdf", "docx", "openai")
+# Imported at startup on purpose (see app.main); reported with their cumulative cost
+_EAGER_MODULES = ("numpy",)
+
+
+def _import_times(module: str) -> list[tuple[str, int, int]]:
+    # Fresh interpreter, so nothing is cached in sys.modules: [(module, self us, cumulative us)]
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = re.match(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)", line)
+        if m:
+            rows.append((m.group(4), int(m.group(1)), int(m.group(2))))
+    return rows
+
+
+def cmd_startup_report(args: argparse.Namespace) -> None:
+    rows = _import_times("app.main")
+    total_us = next((cum for name, _, cum in rows if name == "app.main"), 0)
+
+    by_package: dict[str, int] = {}
+    for name, self_us, _ in rows:
+        top = name.split(".")[0]
+        by_package[top] = by_package.get(top, 0) + self_us
+    eager = sorted({name.split(".")[0] for name, _, _ in rows} & set(_DEFERRED_MODULES))
+
+    report = {
+        "app_main_import_ms": round(total_us / 1000, 1),
+        "modules_imported": len(rows),
+        "top_packages_ms": {
+            pkg: round(us / 1000, 1)
+            for pkg, us in sorted(by_package.items(), key=lambda kv: -kv[1])[:args.top]
+        },
+        "eagerly_imported_deferred_modules": eager,
+        "eager_modules_ms": {
+            name: round(cum / 1000, 1) for name, _, cum in rows if name in _EAGER_MODULES
+        },
+    }
+    print(json.dumps(report, indent=2))
+
+    failed = []
+    if eager:
+        failed.append(f"deferred modules imported at startup: {eager}")
+    if args.max_import_ms and report["app_main_import_ms"] > args.max_import_ms:
+        failed.append(f"import took {report['app_main_import_ms']} ms > {args.max_import_ms} ms")
+    if failed:
+        raise SystemExit("[STARTUP][REGRESSION] " + "; ".join(failed))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("rebuild-index", help="Re-create the index as one segment of the configured (or given) type")
+    p.add_argument("--type", choices=INDEX_TYPES, default=None)
+    p.add_argument("--collection", default=DEFAULT_COLLECTION)
+    p.set_defaults(func=cmd_rebuild_index)
+
+    p = sub.add_parser("compact-index", help="Drop tombstoned (deleted/replaced) vectors from the index")
+    p.set_defaults(func=cmd_compact_index)
+
+    p = sub.add_parser("merge-segments", help="Merge small index segments (or all with --all) into one")
+    p.add_argument("--all", action="store_true", help="merge every segment, not just small ones")
+    p.set_defaults(func=cmd_merge_segments)
+
+    p = sub.add_parser("quantize-index", help="Convert the index (incl. a legacy index.faiss) to compressed vectors")
+    p.add_argument("--quant", choices=QUANTIZATIONS, required=True)
+    p.add_argument("--type", choices=INDEX_TYPES, default=None)
+    p.add_argument("--collection", default=DEFAULT_COLLECTION)
+    p.add_argument("--queries", type=int, default=200, help="queries for the recall check (per shard)")
+    p.add_argument("--k", type=int, default=10)
+    p.set_defaults(func=cmd_quantize_index)
+
+    p = sub.add_parser("eval-index", help="Recall@k and latency of index types vs exact flat search")
+    p.add_argument("--types", nargs="+", choices=INDEX_TYPES, default=["ivf", "hnsw"])
+    p.add_argument("--quant", nargs="+", choices=QUANTIZATIONS, default=["none"])
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--k", type=int, default=10)
+    p.add_argument("--synthetic", type=int, default=0, help="evaluate on N synthetic vectors instead")
+    p.set_defaults(func=cmd_eval_index)
+
+    p = sub.add_parser("create-collection", help="Register an empty collection of N hash-partitioned shards")
+    p.add_argument("name")
+    p.add_argument("--shards", type=int, default=1)
+    p.set_defaults(func=cmd_create_collection)
+
+    p = sub.add_parser("reshard-collection", help="Re-partition a collection's vectors into N shards")
+    p.add_argument("name")
+    p.add_argument("--shards", type=int, required=True)
+    p.set_defaults(func=cmd_reshard_collection)
+
+    p = sub.add_parser("startup-report", help="Import-time breakdown of app.main (exit 1 on regressions)")
+    p.add_argument("--top", type=int, default=15, help="packages to list, by import time")
+    p.add_argument("--max-import-ms", type=float, default=0, help="fail when importing app.main takes longer")
+    p.set_defaults(func=cmd_startup_report)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
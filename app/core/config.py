@@ -11,15 +11,120 @@ class Settings(BaseModel):
     UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", os.path.join("data", "uploads"))
     FAISS_DIR: str = os.getenv("FAISS_DIR", os.path.join("data", "faiss_index"))
     DB_URL: str = os.getenv("DB_URL", "sqlite:///./data/app.db")
+    # SQLite tuning: WAL lets queries read while ingestion writes; NORMAL sync is safe under WAL
+    SQLITE_JOURNAL_MODE: str = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS: str = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_CACHE_MB: int = int(os.getenv("SQLITE_CACHE_MB", "64"))
+    SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "8"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "16"))
 
     OPENAI_API_KEY: str | None = os.getenv("OPENAI_API_KEY")
+    # Optional OpenAI-compatible endpoint (e.g. a local stub server for benchmarks)
+    OPENAI_BASE_URL: str | None = os.getenv("OPENAI_BASE_URL") or None
     EMBED_MODEL: str = os.getenv("EMBED_MODEL", "text-embedding-3-small")
     CHAT_MODEL: str = os.getenv("CHAT_MODEL", "gpt-4o-mini")
+    # Output dim of the offline engine (EMBED_MODEL=local-hash-v1 and API fallback)
+    LOCAL_EMBED_DIM: int = int(os.getenv("LOCAL_EMBED_DIM", "1536"))
 
-    CHUNK_SIZE_CHARS: int = int(os.getenv("CHUNK_SIZE_CHARS", "2500"))
-    CHUNK_OVERLAP_CHARS: int = int(os.getenv("CHUNK_OVERLAP_CHARS", "250"))
+    # Embedding batching: per-request budgets, parallel requests, per-batch retries
+    EMBED_BATCH_MAX_TOKENS: int = int(os.getenv("EMBED_BATCH_MAX_TOKENS", "60000"))
+    EMBED_BATCH_MAX_ITEMS: int = int(os.getenv("EMBED_BATCH_MAX_ITEMS", "256"))
+    EMBED_CONCURRENCY: int = int(os.getenv("EMBED_CONCURRENCY", "4"))
+    EMBED_MAX_RETRIES: int = int(os.getenv("EMBED_MAX_RETRIES", "2"))
+
+    # Embedding cache: in-memory LRU (bounded by MB) in front of the DB table
+    EMBED_CACHE_ENABLED: bool = os.getenv("EMBED_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+    EMBED_CACHE_MEMORY_MB: int = int(os.getenv("EMBED_CACHE_MEMORY_MB", "64"))
+
+    # Chunk token budget and sentence overlap (the older *_CHARS settings still set the default, ~4 chars/token)
+    CHUNK_MAX_TOKENS: int = int(os.getenv("CHUNK_MAX_TOKENS", str(int(os.getenv("CHUNK_SIZE_CHARS", "2500")) // 4)))
+    CHUNK_OVERLAP_TOKENS: int = int(os.getenv("CHUNK_OVERLAP_TOKENS", str(int(os.getenv("CHUNK_OVERLAP_CHARS", "250")) // 4)))
+    # PDF extraction: page ranges fan out to a process pool for documents with at least
+    # EXTRACT_PARALLEL_MIN_PAGES pages (workers: 0 = min(4, CPUs)); a page exceeding
+    # EXTRACT_PAGE_TIMEOUT_S is skipped instead of stalling the document
+    EXTRACT_WORKERS: int = int(os.getenv("EXTRACT_WORKERS", "0"))
+    EXTRACT_PARALLEL_MIN_PAGES: int = int(os.getenv("EXTRACT_PARALLEL_MIN_PAGES", "24"))
+    EXTRACT_PAGES_PER_TASK: int = int(os.getenv("EXTRACT_PAGES_PER_TASK", "16"))
+    EXTRACT_PAGE_TIMEOUT_S: float = float(os.getenv("EXTRACT_PAGE_TIMEOUT_S", "20"))
+
+    # Chunks handed to the embedder at a time while a document streams through ingestion
+    INGEST_EMBED_GROUP: int = int(os.getenv("INGEST_EMBED_GROUP", "512"))
 
     TOP_K_DEFAULT: int = int(os.getenv("TOP_K_DEFAULT", "6"))
     MAX_TOP_K: int = int(os.getenv("MAX_TOP_K", "12"))
+    # Context assembly before the answer prompts: retrieved chunks are reordered by MMR
+    # (lambda 1.0 = relevance only, lower = more diverse), adjacent chunks of a document are
+    # merged without their overlap, and the result is packed into CONTEXT_TOKEN_BUDGET
+    # tokens (0 = no limit; the best chunk is always kept)
+    CONTEXT_ASSEMBLY_ENABLED: bool = os.getenv("CONTEXT_ASSEMBLY_ENABLED", "true").lower() in ("1", "true", "yes")
+    CONTEXT_MMR_LAMBDA: float = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+    CONTEXT_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+
+    # Answer pipeline: "multi" (answer, completeness check, enrichment: up to 3 calls)
+    # or "fast" (one structured-JSON call, falls back to "multi" if the output is invalid)
+    RAG_PIPELINE_MODE: str = os.getenv("RAG_PIPELINE_MODE", "multi").lower()
+
+    # POST /v1/query/batch: max questions per request, LLM answers generated at once
+    QUERY_BATCH_MAX_QUESTIONS: int = int(os.getenv("QUERY_BATCH_MAX_QUESTIONS", "2000"))
+    QUERY_BATCH_CONCURRENCY: int = int(os.getenv("QUERY_BATCH_CONCURRENCY", "8"))
+
+    # Answer cache: exact (normalized question) + semantic (question-embedding cosine) tiers,
+    # scoped to the index content version so document changes invalidate it
+    ANSWER_CACHE_ENABLED: bool = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+    ANSWER_CACHE_MAX_ITEMS: int = int(os.getenv("ANSWER_CACHE_MAX_ITEMS", "1000"))
+    ANSWER_CACHE_TTL_S: float = float(os.getenv("ANSWER_CACHE_TTL_S", "3600"))
+    ANSWER_CACHE_SEMANTIC_THRESHOLD: float = float(os.getenv("ANSWER_CACHE_SEMANTIC_THRESHOLD", "0.95"))
+
+    # FAISS index type: flat (exact) | ivf (IVF-flat) | hnsw
+    FAISS_INDEX_TYPE: str = os.getenv("FAISS_INDEX_TYPE", "flat").lower()
+    # IVF: nlist=0 picks ~4*sqrt(n); stays flat until the corpus reaches the threshold
+    FAISS_IVF_NLIST: int = int(os.getenv("FAISS_IVF_NLIST", "0"))
+    FAISS_IVF_NPROBE: int = int(os.getenv("FAISS_IVF_NPROBE", "16"))
+    FAISS_IVF_TRAIN_THRESHOLD: int = int(os.getenv("FAISS_IVF_TRAIN_THRESHOLD", "20000"))
+    # HNSW graph degree and build/search beam widths
+    FAISS_HNSW_M: int = int(os.getenv("FAISS_HNSW_M", "32"))
+    FAISS_HNSW_EF_CONSTRUCTION: int = int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", "80"))
+    FAISS_HNSW_EF_SEARCH: int = int(os.getenv("FAISS_HNSW_EF_SEARCH", "64"))
+
+    # Vector compression of built (merged/rebuilt) segments: none | sq8 (4x) | fp16 (2x) | pq.
+    # sq8/pq are trained per segment, so segments below FAISS_QUANTIZE_MIN_VECTORS stay
+    # float32; PQ uses FAISS_PQ_M bytes per vector (0 picks dim/16; must divide the dim)
+    FAISS_QUANTIZATION: str = os.getenv("FAISS_QUANTIZATION", "none").lower()
+    FAISS_QUANTIZE_MIN_VECTORS: int = int(os.getenv("FAISS_QUANTIZE_MIN_VECTORS", "10000"))
+    FAISS_PQ_M: int = int(os.getenv("FAISS_PQ_M", "0"))
+    # Quantized segments keep float32 copies on disk (memory-mapped, not held in RAM);
+    # with rescoring, top_k * FAISS_RESCORE_FACTOR candidates are re-ranked by exact score
+    FAISS_RESCORE: bool = os.getenv("FAISS_RESCORE", "true").lower() in ("1", "true", "yes")
+    FAISS_RESCORE_FACTOR: int = int(os.getenv("FAISS_RESCORE_FACTOR", "4"))
+
+    # Query-side stores map segment files read-only instead of reading them into RAM:
+    # uvicorn workers share the OS page cache and (re)load in milliseconds
+    FAISS_MMAP: bool = os.getenv("FAISS_MMAP", "true").lower() in ("1", "true", "yes")
+
+    # Deleted vectors are tombstoned; compact in the background past this fraction
+    FAISS_COMPACT_RATIO: float = float(os.getenv("FAISS_COMPACT_RATIO", "0.2"))
+    # Segmented persistence: each save appends a segment; once FAISS_SEGMENT_MERGE_MIN
+    # segments are below FAISS_SEGMENT_SMALL_VECTORS, they are merged in the background
+    FAISS_SEGMENT_SMALL_VECTORS: int = int(os.getenv("FAISS_SEGMENT_SMALL_VECTORS", "50000"))
+    FAISS_SEGMENT_MERGE_MIN: int = int(os.getenv("FAISS_SEGMENT_MERGE_MIN", "4"))
+
+    # Sharded collections: queries fan out over the shards on this many threads
+    # (0 = min(32, CPUs)); FAISS releases the GIL while it searches
+    FAISS_SEARCH_THREADS: int = int(os.getenv("FAISS_SEARCH_THREADS", "0"))
+    COLLECTION_MAX_SHARDS: int = int(os.getenv("COLLECTION_MAX_SHARDS", "64"))
+
+    # Background ingestion: worker threads and max files waiting/running at once
+    INGEST_WORKERS: int = int(os.getenv("INGEST_WORKERS", "2"))
+    INGEST_MAX_PENDING: int = int(os.getenv("INGEST_MAX_PENDING", "64"))
+    # Index writes (adds/deletes) go through one writer thread, which applies whatever
+    # queued up meanwhile as one batch (up to MAX_BATCH commands); WAIT_MS > 0 lingers
+    # that long after the first command for more to arrive
+    INDEX_WRITER_MAX_BATCH: int = int(os.getenv("INDEX_WRITER_MAX_BATCH", "32"))
+    INDEX_WRITER_BATCH_WAIT_MS: float = float(os.getenv("INDEX_WRITER_BATCH_WAIT_MS", "0"))
+
+    # After startup, preload deferred imports (faiss, parsers, openai), API clients and
+    # every collection's index on a background thread, so the first requests skip it
+    WARMUP_ON_STARTUP: bool = os.getenv("WARMUP_ON_STARTUP", "true").lower() in ("1", "true", "yes")
 
 settings = Settings()
@@ -0,0 +1,60 @@
+import importlib
+import threading
+import time
+from types import ModuleType
+
+
+class LazyModule(ModuleType):
+    """
+    Stand-in for a heavy module (faiss, pypdf, python-docx) bound at import time but
+    only imported on first attribute access, so the app can serve /health before
+    they load. Not registered in sys.modules: a plain `import` elsewhere still gets
+    the real module.
+    """
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._module: ModuleType | None = None
+        self._lock = threading.Lock()
+        self.load_seconds: float | None = None
+
+    def load(self) -> ModuleType:
+        module = self._module
+        if module is not None:
+            return module
+        with self._lock:
+            if self._module is None:
+                t = time.perf_counter()
+                self._module = importlib.import_module(self.__name__)
+                self.load_seconds = time.perf_counter() - t
+                print(f"[STARTUP] Imported {self.__name__} on first use in {self.load_seconds:.3f}s")
+            return self._module
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def __getattr__(self, attr: str):
+        # Only called for names ModuleType itself does not have
+        if attr.startswith("__") and attr.endswith("__"):
+            raise AttributeError(attr)
+        return getattr(self.load(), attr)
+
+
+_modules: dict[str, LazyModule] = {}
+_modules_lock = threading.Lock()
+
+
+def lazy_import(name: str) -> LazyModule:
+    with _modules_lock:
+        module = _modules.get(name)
+        if module is None:
+            module = _modules[name] = LazyModule(name)
+        return module
+
+
+def lazy_modules() -> dict[str, float | None]:
+    """
+    {module: seconds its deferred import took, or None while still unloaded}.
+    """
+    with _modules_lock:
+        return {name: m.load_seconds for name, m in sorted(_modules.items())}
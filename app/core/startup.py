@@ -0,0 +1,57 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from app.core.lazy import lazy_modules
+
+# Imported first by app.main, so phase offsets are measured from (roughly) the start
+# of the app's own imports
+_T0 = time.perf_counter()
+
+_lock = threading.Lock()
+# phase -> (start offset s, duration s), in the order phases finished
+_phases: dict[str, tuple[float, float]] = {}
+
+
+def record(phase: str, start: float, seconds: float) -> None:
+    with _lock:
+        _phases[phase] = (start - _T0, seconds)
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, start, time.perf_counter() - start)
+
+
+def since_start() -> float:
+    return time.perf_counter() - _T0
+
+
+def mark_imported() -> None:
+    """
+    Records the "import" phase: everything from this module's import until now.
+    """
+    record("import", _T0, since_start())
+
+
+def report() -> dict:
+    """
+    Cold-start breakdown: app import, startup hook, background warmup, and each
+    deferred import (None while a module is still unloaded).
+    """
+    with _lock:
+        phases = {
+            name: {"start_s": round(start, 4), "seconds": round(seconds, 4)}
+            for name, (start, seconds) in _phases.items()
+        }
+    return {
+        "phases": phases,
+        "deferred_imports": {
+            name: (round(seconds, 4) if seconds is not None else None) for name, seconds in lazy_modules().items()
+        },
+    }
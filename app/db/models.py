@@ -1,7 +1,7 @@
 import uuid
 from datetime import datetime
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import String, Integer, Text, DateTime, ForeignKey, Index
+from sqlalchemy import String, Integer, BigInteger, Text, DateTime, ForeignKey, Index, LargeBinary
 
 class Base(DeclarativeBase):
     pass
@@ -12,6 +12,8 @@ class Document(Base):
     id: Mapped[str] = mapped_column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     filename: Mapped[str] = mapped_column(String(255), nullable=False)
     source_type: Mapped[str] = mapped_column(String(50), default="upload")
+    # Knowledge base the document is indexed in (see app.services.collections)
+    collection: Mapped[str] = mapped_column(String(64), default="default", server_default="default", index=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
 class Chunk(Base):
@@ -22,7 +24,36 @@ class Chunk(Base):
     chunk_index: Mapped[int] = mapped_column(Integer, nullable=False)
     text: Mapped[str] = mapped_column(Text, nullable=False)
 
-    # Mapping into FAISS index row
-    faiss_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+    # Stable 64-bit vector id in the FAISS IndexIDMap2 (legacy rows: positional row id)
+    faiss_id: Mapped[int] = mapped_column(BigInteger, nullable=False, index=True)
 
 Index("ix_chunks_doc_chunk", Chunk.document_id, Chunk.chunk_index, unique=True)
+
+class IngestJob(Base):
+    __tablename__ = "ingest_jobs"
+
+    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    # queued | running | completed | failed
+    status: Mapped[str] = mapped_column(String(20), default="queued", index=True)
+    total_files: Mapped[int] = mapped_column(Integer, default=0)
+    processed_files: Mapped[int] = mapped_column(Integer, default=0)
+
+    # JSON list with one entry per file: document_id, filename, stage, chunks, timings, error
+    files_json: Mapped[str] = mapped_column(Text, default="[]")
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+class EmbeddingCacheEntry(Base):
+    """
+    Content-addressed embedding cache: one row per (embed model, sha256 of chunk text).
+    """
+    __tablename__ = "embedding_cache"
+
+    embed_model: Mapped[str] = mapped_column(String(100), primary_key=True)
+    text_hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    dim: Mapped[int] = mapped_column(Integer, nullable=False)
+    # Raw float32 bytes (dim * 4)
+    vector: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
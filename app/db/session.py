@@ -1,11 +1,33 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
 
-engine = create_engine(
-    settings.DB_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.DB_URL else {}
-)
+_is_sqlite = settings.DB_URL.startswith("sqlite")
+_is_memory = _is_sqlite and (":memory:" in settings.DB_URL or settings.DB_URL.rstrip("/") in ("sqlite:", "sqlite:/"))
+
+engine_kwargs = {}
+if _is_sqlite:
+    engine_kwargs["connect_args"] = {
+        "check_same_thread": False,
+        "timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000.0,
+    }
+if not _is_memory:
+    # Pooled connections: API requests, ingestion workers and job updates each hold one briefly
+    engine_kwargs.update(pool_size=settings.DB_POOL_SIZE, max_overflow=settings.DB_MAX_OVERFLOW, pool_pre_ping=True)
+
+engine = create_engine(settings.DB_URL, **engine_kwargs)
+
+if _is_sqlite:
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_conn, connection_record) -> None:
+        cur = dbapi_conn.cursor()
+        if not _is_memory:
+            cur.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+        cur.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+        cur.execute(f"PRAGMA cache_size=-{settings.SQLITE_CACHE_MB * 1024}")  # negative = KiB
+        cur.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}")
+        cur.execute("PRAGMA temp_store=MEMORY")
+        cur.close()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -15,3 +37,27 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# Columns added to existing tables after their first release: create_all() only creates
+# missing tables, so databases from older versions get these via ALTER TABLE
+_ADDED_COLUMNS = {
+    "documents": [
+        ("collection", "VARCHAR(64) NOT NULL DEFAULT 'default'", "CREATE INDEX IF NOT EXISTS ix_documents_collection ON documents (collection)"),
+    ],
+}
+
+
+def upgrade_schema() -> None:
+    insp = inspect(engine)
+    for table, columns in _ADDED_COLUMNS.items():
+        if not insp.has_table(table):
+            continue
+        existing = {c["name"] for c in insp.get_columns(table)}
+        for name, ddl, index_ddl in columns:
+            if name in existing:
+                continue
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+                conn.execute(text(index_ddl))
+            print(f"[DB] Added column {table}.{name}")
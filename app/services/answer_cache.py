@@ -0,0 +1,206 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from app.core.config import settings
+
+_SPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCT_RE = re.compile(r"[\s?.!]+$")
+
+# (collection, its index content version, pipeline mode, top_k): answers only match within one scope
+Scope = tuple[str, int, str, int]
+
+
+def normalize_question(question: str) -> str:
+    text = _SPACE_RE.sub(" ", (question or "").lower()).strip()
+    return _TRAILING_PUNCT_RE.sub("", text)
+
+
+class _Entry:
+    __slots__ = ("scope", "result", "expires_at", "slot")
+
+    def __init__(self, scope: Scope, result: dict, expires_at: float, slot: int | None):
+        self.scope = scope
+        self.result = result
+        self.expires_at = expires_at
+        self.slot = slot
+
+
+class AnswerCache:
+    """
+    Two-tier cache of /v1/query results:
+    - exact: (scope, normalized question) -> result, LRU with a TTL
+    - semantic: cosine similarity of the question embedding against the embeddings of
+      cached questions in the same scope; >= `threshold` counts as a near-duplicate
+
+    The scope includes the collection's index content version, so adding/replacing/deleting
+    documents invalidates that collection's cached answers; its entries of older versions
+    are purged on first sight of a new one. Thread-safe.
+    """
+    def __init__(self, max_items: int, ttl_s: float, threshold: float):
+        self.max_items = max(1, int(max_items))
+        self.ttl_s = float(ttl_s)
+        self.threshold = float(threshold)
+
+        self._lru: OrderedDict[tuple[Scope, str], _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+        # Latest content version seen per collection
+        self._versions: dict[str, int] = {}
+
+        # Question embeddings live in one preallocated matrix; entries own a row ("slot")
+        self._vecs: np.ndarray | None = None
+        self._slot_keys: list[tuple[Scope, str] | None] = []
+        self._free: list[int] = []
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    # -------------------------
+    # Internals (caller holds self._lock)
+    # -------------------------
+    def _check_version(self, scope: Scope) -> None:
+        collection, version = scope[0], scope[1]
+        known = self._versions.get(collection)
+        if known is not None and known != version:
+            stale = [key for key in self._lru if key[0][0] == collection]
+            for key in stale:
+                self._drop(key)
+            if stale:
+                self.invalidations += 1
+        self._versions[collection] = version
+
+    def _clear(self) -> None:
+        self._lru.clear()
+        self._vecs = None
+        self._slot_keys = []
+        self._free = []
+
+    def _drop(self, key: tuple[Scope, str]) -> None:
+        entry = self._lru.pop(key, None)
+        if entry is not None and entry.slot is not None:
+            self._slot_keys[entry.slot] = None
+            self._free.append(entry.slot)
+
+    def _alloc_slot(self, key: tuple[Scope, str], vec: np.ndarray) -> int | None:
+        if self._vecs is None or self._vecs.shape[1] != vec.shape[0]:
+            # First vector (or the embedding dim changed): start a fresh matrix
+            self._vecs = np.zeros((self.max_items, vec.shape[0]), dtype=np.float32)
+            self._slot_keys = [None] * self.max_items
+            self._free = list(range(self.max_items - 1, -1, -1))
+            for entry in self._lru.values():
+                entry.slot = None
+        if not self._free:
+            return None
+        slot = self._free.pop()
+        self._vecs[slot] = vec
+        self._slot_keys[slot] = key
+        return slot
+
+    # -------------------------
+    # Public API
+    # -------------------------
+    def get(self, scope: Scope, question: str) -> dict | None:
+        """
+        Exact-tier lookup (no embedding needed). Misses are not counted here:
+        call get_similar() next, which counts the final hit/miss.
+        """
+        key = (scope, normalize_question(question))
+        now = time.time()
+        with self._lock:
+            self._check_version(scope)
+            entry = self._lru.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at < now:
+                self._drop(key)
+                self.expirations += 1
+                return None
+            self._lru.move_to_end(key)
+            self.exact_hits += 1
+            return entry.result
+
+    def get_similar(self, scope: Scope, query_vec: np.ndarray) -> dict | None:
+        """
+        Semantic-tier lookup: best cached question in `scope` with cosine >= threshold.
+        """
+        q = np.asarray(query_vec, dtype=np.float32).reshape(-1)
+        q = q / max(float(np.linalg.norm(q)), 1e-12)
+        now = time.time()
+        with self._lock:
+            self._check_version(scope)
+            if self._vecs is None or self._vecs.shape[1] != q.shape[0] or not self._lru:
+                self.misses += 1
+                return None
+
+            scores = self._vecs @ q
+            for slot in np.argsort(-scores):
+                if scores[slot] < self.threshold:
+                    break
+                key = self._slot_keys[slot]
+                if key is None or key[0] != scope:
+                    continue
+                entry = self._lru[key]
+                if entry.expires_at < now:
+                    self._drop(key)
+                    self.expirations += 1
+                    continue
+                self._lru.move_to_end(key)
+                self.semantic_hits += 1
+                return entry.result
+
+            self.misses += 1
+            return None
+
+    def put(self, scope: Scope, question: str, result: dict, query_vec: np.ndarray | None = None) -> None:
+        key = (scope, normalize_question(question))
+        with self._lock:
+            self._check_version(scope)
+            self._drop(key)
+            while len(self._lru) >= self.max_items:
+                oldest = next(iter(self._lru))
+                self._drop(oldest)
+                self.evictions += 1
+
+            slot = None
+            if query_vec is not None:
+                q = np.asarray(query_vec, dtype=np.float32).reshape(-1)
+                slot = self._alloc_slot(key, q / max(float(np.linalg.norm(q)), 1e-12))
+            self._lru[key] = _Entry(scope, result, time.time() + self.ttl_s, slot)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            if self._lru:
+                self.invalidations += 1
+            self._clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            lookups = hits + self.misses
+            return {
+                "enabled": settings.ANSWER_CACHE_ENABLED,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "items": len(self._lru),
+                "max_items": self.max_items,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "index_versions": dict(self._versions),
+            }
+
+
+answer_cache = AnswerCache(
+    max_items=settings.ANSWER_CACHE_MAX_ITEMS,
+    ttl_s=settings.ANSWER_CACHE_TTL_S,
+    threshold=settings.ANSWER_CACHE_SEMANTIC_THRESHOLD,
+)
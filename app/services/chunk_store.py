@@ -0,0 +1,126 @@
+import json
+import os
+import shutil
+from typing import NamedTuple
+
+import numpy as np
+
+# Files inside one sidecar directory
+_IDS = "ids.npy"              # int64[n], sorted vector ids
+_OFFSETS = "offsets.npy"      # int64[n+1], byte offsets into text.bin
+_TEXT = "text.bin"            # utf-8 chunk texts, back to back
+_DOC_IDX = "doc_idx.npy"      # int32[n], row into docs.json
+_CHUNK_INDEX = "chunk_index.npy"  # int32[n]
+_CHUNK_IDS = "chunk_ids.npy"  # S36[n], Chunk.id
+_DOCS = "docs.json"           # [[document_id, filename], ...]
+
+
+class ChunkRecord(NamedTuple):
+    """
+    What retrieval needs to cite a vector hit, without touching the DB.
+    """
+    chunk_id: str
+    document_id: str
+    filename: str
+    chunk_index: int
+    text: str
+
+
+class ChunkSidecar:
+    """
+    Read-optimized, immutable chunk text store for one index segment, keyed by vector id:
+    - sorted ids + offsets arrays and a flat utf-8 text blob, all memory-mapped
+    - per-row document metadata inline (doc table index), so no Document lookup either
+
+    A lookup is a searchsorted over the ids plus one slice of the blob per hit.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.ids = np.load(os.path.join(path, _IDS), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, _OFFSETS), mmap_mode="r")
+        self.doc_idx = np.load(os.path.join(path, _DOC_IDX), mmap_mode="r")
+        self.chunk_index = np.load(os.path.join(path, _CHUNK_INDEX), mmap_mode="r")
+        self.chunk_ids = np.load(os.path.join(path, _CHUNK_IDS), mmap_mode="r")
+        size = os.path.getsize(os.path.join(path, _TEXT))
+        self.text = np.memmap(os.path.join(path, _TEXT), dtype=np.uint8, mode="r") if size else np.zeros(0, np.uint8)
+        with open(os.path.join(path, _DOCS), "r", encoding="utf-8") as f:
+            self.docs = [tuple(d) for d in json.load(f)]
+
+    def __len__(self) -> int:
+        return int(self.ids.shape[0])
+
+    def positions(self, ids: np.ndarray) -> np.ndarray:
+        """
+        Row of each id in this sidecar, or -1.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(self) == 0 or ids.size == 0:
+            return np.full(ids.shape, -1, dtype=np.int64)
+        pos = np.searchsorted(self.ids, ids)
+        pos = np.minimum(pos, len(self) - 1)
+        return np.where(self.ids[pos] == ids, pos, -1)
+
+    def record(self, row: int) -> ChunkRecord:
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        document_id, filename = self.docs[int(self.doc_idx[row])]
+        return ChunkRecord(
+            chunk_id=self.chunk_ids[row].decode("ascii"),
+            document_id=document_id,
+            filename=filename,
+            chunk_index=int(self.chunk_index[row]),
+            text=self.text[start:end].tobytes().decode("utf-8"),
+        )
+
+    def ids_for_documents(self, document_ids: set[str]) -> np.ndarray:
+        rows = [i for i, (document_id, _) in enumerate(self.docs) if document_id in document_ids]
+        if not rows:
+            return np.zeros(0, dtype=np.int64)
+        return np.asarray(self.ids[np.isin(self.doc_idx, rows)])
+
+    def records(self, ids: np.ndarray) -> dict[int, ChunkRecord]:
+        out = {}
+        for vid, row in zip(np.asarray(ids, dtype=np.int64).tolist(), self.positions(ids).tolist()):
+            if row >= 0:
+                out[vid] = self.record(row)
+        return out
+
+
+def write_sidecar(path: str, ids: np.ndarray, records: list[ChunkRecord]) -> None:
+    """
+    Writes the sidecar for (ids[i], records[i]) pairs into directory `path`
+    (via a temp dir + rename, so a crash never leaves a half-written sidecar).
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    order = np.argsort(ids, kind="stable")
+
+    docs: dict[tuple[str, str], int] = {}
+    blobs: list[bytes] = []
+    doc_idx = np.empty(len(records), dtype=np.int32)
+    chunk_index = np.empty(len(records), dtype=np.int32)
+    chunk_ids = np.empty(len(records), dtype="S36")
+    for out_row, src in enumerate(order.tolist()):
+        rec = records[src]
+        doc_idx[out_row] = docs.setdefault((rec.document_id, rec.filename), len(docs))
+        chunk_index[out_row] = rec.chunk_index
+        chunk_ids[out_row] = rec.chunk_id.encode("ascii")
+        blobs.append(rec.text.encode("utf-8"))
+
+    offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in blobs], out=offsets[1:])
+
+    tmp = f"{path}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    np.save(os.path.join(tmp, _IDS), ids[order])
+    np.save(os.path.join(tmp, _OFFSETS), offsets)
+    np.save(os.path.join(tmp, _DOC_IDX), doc_idx)
+    np.save(os.path.join(tmp, _CHUNK_INDEX), chunk_index)
+    np.save(os.path.join(tmp, _CHUNK_IDS), chunk_ids)
+    with open(os.path.join(tmp, _TEXT), "wb") as f:
+        for b in blobs:
+            f.write(b)
+        f.flush()
+        os.fsync(f.fileno())
+    with open(os.path.join(tmp, _DOCS), "w", encoding="utf-8") as f:
+        json.dump([list(d) for d in docs], f)
+    os.replace(tmp, path)
@@ -1,41 +1,151 @@
+import re
+from typing import Iterable, Iterator
+
 from app.core.config import settings
+from app.services.embedder import estimate_tokens
 
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?:;])\s+")
+# "2.1 Scope", "IV. Results", "Chapter 3 ...": short section numbers, then a capitalized title
+_NUMBERED_HEADING_RE = re.compile(
+    r"^(\d{1,3}(\.\d{1,3})*\.?|[IVXLC]+\.|(Chapter|CHAPTER|Section|SECTION|Appendix|APPENDIX|Part|PART)\s+[\dIVXLCA-Z]+\.?)"
+    r"\s+[A-Z\d]"
+)
+_MAX_HEADING_CHARS = 100
+_MAX_HEADING_WORDS = 12
 
-def chunk_text(text: str) -> list[str]:
+
+def _is_heading(line: str, continues: bool = False) -> bool:
     """
-    Safe char-based chunking for MVP speed and reliability.
+    Markdown headings, numbered/"Chapter" titles and short ALL-CAPS lines; a heading
+    never ends with sentence punctuation. Apart from Markdown ones, a line that
+    `continues` an unfinished sentence (PDF wrapping) is never a heading.
+    """
+    if not line or len(line) > _MAX_HEADING_CHARS:
+        return False
+    if line.startswith("#"):
+        return True
+    if continues or line[-1] in ".,;:!?" or len(line.split()) > _MAX_HEADING_WORDS:
+        return False
+    if _NUMBERED_HEADING_RE.match(line):
+        return True
+    letters = [c for c in line if c.isalpha()]
+    return len(letters) >= 3 and all(c.isupper() for c in letters)
+
 
-    Fixes infinite-loop cases when overlap >= size or when the window doesn't progress.
-    Guarantees forward progress by using a positive step size.
+def _units(blocks: Iterable[str]) -> Iterator[tuple[str, str]]:
     """
-    size = int(settings.CHUNK_SIZE_CHARS)
-    overlap = int(settings.CHUNK_OVERLAP_CHARS)
+    Yields ("heading", line) and ("sentence", text) units from a stream of pages/paragraphs.
+    Lines inside a paragraph are re-joined first (PDF text wraps mid-sentence).
+    """
+    for block in blocks:
+        paragraph: list[str] = []
+
+        def flush() -> Iterator[tuple[str, str]]:
+            if paragraph:
+                text = " ".join(paragraph)
+                paragraph.clear()
+                for sentence in _SENTENCE_END_RE.split(text):
+                    if sentence.strip():
+                        yield "sentence", sentence.strip()
 
-    text = (text or "").strip()
-    if not text:
-        return []
+        for raw in (block or "").splitlines():
+            line = raw.strip()
+            if not line:
+                yield from flush()
+            elif _is_heading(line, continues=bool(paragraph) and paragraph[-1][-1] not in ".!?:;"):
+                yield from flush()
+                yield "heading", line
+            else:
+                paragraph.append(line)
+        yield from flush()
 
-    # Safety: ensure overlap is not >= size
-    if overlap >= size:
-        overlap = max(0, size // 10)  # default to 10% overlap
 
-    step = size - overlap
-    if step <= 0:
-        step = size  # guarantee progress
+def _split_long(text: str, max_tokens: int) -> Iterator[str]:
+    # A single sentence over budget: cut on word boundaries (or hard, for unbroken text)
+    max_chars = max(1, max_tokens * 4)
+    while estimate_tokens(text) > max_tokens:
+        cut = text.rfind(" ", 0, max_chars)
+        if cut <= 0:
+            cut = max_chars
+        yield text[:cut].strip()
+        text = text[cut:].strip()
+    if text:
+        yield text
 
-    chunks: list[str] = []
-    n = len(text)
 
-    start = 0
-    while start < n:
-        end = min(n, start + size)
-        chunk = text[start:end].strip()
-        if chunk:
-            chunks.append(chunk)
+def iter_chunks(
+    blocks: Iterable[str],
+    max_tokens: int | None = None,
+    overlap_tokens: int | None = None,
+) -> Iterator[str]:
+    """
+    Lazily packs a stream of pages/paragraphs into chunks of at most `max_tokens`
+    (default CHUNK_MAX_TOKENS), splitting only on sentence boundaries:
+    - a heading starts a new chunk (once the current one is a quarter full), so
+      sections are not glued to the tail of the previous one; consecutive headings
+      ("Chapter 1", "1.1 Scope") stay together
+    - consecutive chunks share up to `overlap_tokens` (CHUNK_OVERLAP_TOKENS) of
+      trailing whole sentences; no overlap is carried across a heading
+    - sentences longer than the budget are cut on word boundaries
 
-        if end >= n:
-            break
+    Only the chunk being built is held in memory, whatever the document size.
+    """
+    max_tokens = max(16, int(max_tokens or settings.CHUNK_MAX_TOKENS))
+    overlap_tokens = int(settings.CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens)
+    # Safety: overlap must leave room for new content
+    if overlap_tokens >= max_tokens // 2:
+        overlap_tokens = max_tokens // 10
 
-        start += step  # always moves forward
+    current: list[str] = []
+    tokens = 0
+    fresh = False  # does `current` hold anything beyond carried-over overlap?
+    headed = False  # without fresh content: does `current` hold pending headings (not overlap)?
 
-    return chunks
+    def emit() -> Iterator[str]:
+        nonlocal current, tokens, fresh, headed
+        if fresh:
+            yield "\n".join(current)
+        # Carry trailing sentences as overlap into the next chunk
+        carry: list[str] = []
+        carried = 0
+        for part in reversed(current):
+            t = estimate_tokens(part)
+            if carried + t > overlap_tokens:
+                break
+            carry.insert(0, part)
+            carried += t
+        current, tokens, fresh, headed = carry, carried, False, False
+
+    for kind, text in _units(blocks):
+        if kind == "heading":
+            if fresh and tokens >= max_tokens // 4:
+                yield from emit()
+                current, tokens = [], 0
+            elif not fresh and not headed:
+                current, tokens = [], 0  # drop carried overlap; stacked headings stay
+            current.append(text)
+            tokens += estimate_tokens(text)
+            headed = True
+            continue
+
+        for piece in _split_long(text, max_tokens):
+            t = estimate_tokens(piece)
+            if tokens + t > max_tokens and fresh:
+                yield from emit()
+                # Drop overlap that would not leave room for this piece
+                while current and tokens + t > max_tokens:
+                    tokens -= estimate_tokens(current.pop(0))
+            current.append(piece)
+            tokens += t
+            fresh = True
+
+    # A trailing heading-only chunk (or a document made only of headings) is kept too
+    if fresh or headed:
+        yield "\n".join(current)
+
+
+def chunk_text(text: str) -> list[str]:
+    """
+    Chunks one fully materialized string; ingestion streams pages through iter_chunks instead.
+    """
+    return list(iter_chunks([text or ""]))
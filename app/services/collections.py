@@ -0,0 +1,406 @@
+import heapq
+import json
+import os
+import re
+import shutil
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.chunk_store import ChunkRecord
+from app.services.vector_store import (
+    INDEX_FILE,
+    MANIFEST_FILE,
+    SEGMENTS_SUBDIR,
+    TOMBSTONES_FILE,
+    VERSION_FILE,
+    ChunkLookup,
+    FaissStore,
+    get_store,
+    new_vector_ids,
+    writer_lock,
+)
+
+DEFAULT_COLLECTION = "default"
+
+# {"collections": {name: {"shards": n, "dirs": [index dir relative to FAISS_DIR, ...]}}}
+REGISTRY_PATH = os.path.join(settings.FAISS_DIR, "collections.json")
+COLLECTIONS_SUBDIR = "collections"
+
+_NAME_RE = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")
+
+
+class CollectionNotFoundError(LookupError):
+    pass
+
+
+class CollectionExistsError(ValueError):
+    pass
+
+
+# -------------------------
+# Registry
+# -------------------------
+_registry_lock = threading.Lock()
+# (registry file mtime/size, entries): re-read only when another process changed it
+_registry_cache: tuple[tuple | None, dict] | None = None
+
+
+def _registry_sig() -> tuple | None:
+    try:
+        st = os.stat(REGISTRY_PATH)
+        return (st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        return None
+
+
+def _read_entries() -> dict[str, dict]:
+    global _registry_cache
+    sig = _registry_sig()
+    cached = _registry_cache
+    if cached is None or cached[0] != sig:
+        entries: dict[str, dict] = {}
+        if sig is not None:
+            with open(REGISTRY_PATH, "r", encoding="utf-8") as f:
+                entries = json.load(f).get("collections", {})
+        cached = _registry_cache = (sig, entries)
+    return dict(cached[1])
+
+
+def _write_entries(entries: dict[str, dict]) -> None:
+    os.makedirs(settings.FAISS_DIR, exist_ok=True)
+    tmp_path = f"{REGISTRY_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"collections": entries}, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, REGISTRY_PATH)
+
+
+def read_registry() -> dict[str, dict]:
+    """
+    {name: {"shards": n, "dirs": [...]}} for every collection. The default collection
+    is implicit (FAISS_DIR itself, one shard), so pre-collection indexes keep working.
+    """
+    registry = {DEFAULT_COLLECTION: {"shards": 1, "dirs": ["."]}}
+    registry.update(_read_entries())
+    return registry
+
+
+def validate_name(name: str) -> str:
+    if not _NAME_RE.match(name or ""):
+        raise ValueError(
+            f"Invalid collection name '{name}': use 1-64 of a-z, 0-9, '_' and '-', starting with a letter or digit."
+        )
+    return name
+
+
+def _validate_shards(shards: int) -> int:
+    if not 1 <= int(shards) <= settings.COLLECTION_MAX_SHARDS:
+        raise ValueError(f"Shard count must be between 1 and {settings.COLLECTION_MAX_SHARDS}.")
+    return int(shards)
+
+
+def _layout_dirs(name: str, shards: int) -> list[str]:
+    # A fresh directory per layout, so a reshard never writes into the dirs it replaces
+    base = os.path.join(COLLECTIONS_SUBDIR, name, f"{shards}x-{uuid.uuid4().hex[:8]}")
+    return [os.path.join(base, f"shard-{i:02d}") for i in range(shards)]
+
+
+def collection_dirs(name: str) -> list[str]:
+    """
+    Absolute index dirs of `name`'s shards, in shard order.
+    """
+    entry = read_registry().get(name)
+    if entry is None:
+        raise CollectionNotFoundError(f"Collection '{name}' not found.")
+    return [os.path.normpath(os.path.join(settings.FAISS_DIR, d)) for d in entry["dirs"]]
+
+
+def list_collections() -> list[dict]:
+    return [{"name": name, "shards": entry["shards"]} for name, entry in sorted(read_registry().items())]
+
+
+def create_collection(name: str, shards: int = 1) -> dict:
+    """
+    Registers a new, empty collection of `shards` hash partitions.
+    """
+    validate_name(name)
+    shards = _validate_shards(shards)
+    with writer_lock, _registry_lock:
+        if name in read_registry():
+            raise CollectionExistsError(f"Collection '{name}' already exists.")
+        entries = _read_entries()
+        entries[name] = {"shards": shards, "dirs": _layout_dirs(name, shards)}
+        _write_entries(entries)
+    print(f"[COLLECTION] Created '{name}' shards={shards}")
+    return {"name": name, "shards": shards}
+
+
+# -------------------------
+# Sharded view
+# -------------------------
+_pool_lock = threading.Lock()
+_search_pool: ThreadPoolExecutor | None = None
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _search_pool
+    if _search_pool is None:
+        with _pool_lock:
+            if _search_pool is None:
+                workers = settings.FAISS_SEARCH_THREADS or min(32, os.cpu_count() or 1)
+                _search_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="faiss-search")
+    return _search_pool
+
+
+def _merge_topk(results: list[tuple[np.ndarray, np.ndarray]], nq: int, top_k: int) -> tuple[np.ndarray, np.ndarray]:
+    scores = np.full((nq, top_k), -np.inf, dtype=np.float32)
+    ids = np.full((nq, top_k), -1, dtype=np.int64)
+    for r in range(nq):
+        # Every shard's row is sorted by score, so a k-way heap merge yields the global order
+        rows = [zip(s[r].tolist(), i[r].tolist()) for s, i in results]
+        merged = heapq.merge(*rows, key=lambda hit: -hit[0])
+        for j, (score, vid) in enumerate(islice((hit for hit in merged if hit[1] >= 0), top_k)):
+            scores[r, j] = score
+            ids[r, j] = vid
+    return scores, ids
+
+
+class Collection:
+    """
+    A named knowledge base backed by one FaissStore per shard (index dir).
+
+    Vectors are hash-partitioned by their id (id % shards): ids are random 63-bit values,
+    so shards fill evenly and adds/removes/lookups route without a mapping table.
+    Searches fan out over the shards on a shared thread pool (FAISS releases the GIL
+    while it searches) and the per-shard top-k lists are merged with a heap.
+    Exposes the FaissStore read/write calls used by retrieval and ingestion.
+    """
+    def __init__(self, name: str, stores: list[FaissStore]):
+        self.name = name
+        self.stores = stores
+        self._dirty: set[int] = set()
+
+    @property
+    def dim(self) -> int:
+        return self.stores[0].dim
+
+    @property
+    def content_version(self) -> int:
+        # Shard versions only ever grow, so their sum changes whenever any shard's content does
+        return sum(store.content_version for store in self.stores)
+
+    def _shard_of(self, ids: np.ndarray) -> np.ndarray:
+        return np.asarray(ids, dtype=np.int64) % len(self.stores)
+
+    def count(self) -> int:
+        return sum(store.count() for store in self.stores)
+
+    # -------------------------
+    # Reads
+    # -------------------------
+    def search(
+        self,
+        query_vec: np.ndarray,
+        top_k: int,
+        allowed_ids: np.ndarray | None = None,
+    ) -> tuple[list[int], list[float]]:
+        q = query_vec.astype(np.float32).reshape(1, -1)
+        scores, ids = self.search_matrix(q, top_k, allowed_ids=allowed_ids)
+        return ids[0].tolist(), scores[0].tolist()
+
+    def search_matrix(
+        self,
+        queries: np.ndarray,
+        top_k: int,
+        allowed_ids: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        FaissStore.search_matrix over every shard in parallel, merged to the global top-k.
+        `allowed_ids` is split by shard, so each shard only gets its own ids.
+        """
+        if len(self.stores) == 1:
+            return self.stores[0].search_matrix(queries, top_k, allowed_ids=allowed_ids)
+
+        if allowed_ids is not None:
+            allowed_ids = np.asarray(allowed_ids, dtype=np.int64)
+            shard = self._shard_of(allowed_ids)
+        futures = []
+        for i, store in enumerate(self.stores):
+            allowed = None if allowed_ids is None else allowed_ids[shard == i]
+            if allowed is not None and allowed.size == 0:
+                continue
+            futures.append(_pool().submit(store.search_matrix, queries, top_k, allowed))
+        return _merge_topk([f.result() for f in futures], int(np.asarray(queries).shape[0]), top_k)
+
+    def lookup_chunks(self, ids: list[int]) -> dict[int, ChunkRecord]:
+        if len(self.stores) == 1:
+            return self.stores[0].lookup_chunks(ids)
+        wanted = np.asarray([i for i in ids if i >= 0], dtype=np.int64)
+        shard = self._shard_of(wanted)
+        out: dict[int, ChunkRecord] = {}
+        for i, store in enumerate(self.stores):
+            part = wanted[shard == i]
+            if part.size:
+                out.update(store.lookup_chunks(part.tolist()))
+        return out
+
+    def lookup_vectors(self, ids: list[int]) -> dict[int, np.ndarray]:
+        if len(self.stores) == 1:
+            return self.stores[0].lookup_vectors(ids)
+        wanted = np.asarray([i for i in ids if i >= 0], dtype=np.int64)
+        shard = self._shard_of(wanted)
+        out: dict[int, np.ndarray] = {}
+        for i, store in enumerate(self.stores):
+            part = wanted[shard == i]
+            if part.size:
+                out.update(store.lookup_vectors(part.tolist()))
+        return out
+
+    def ids_for_documents(self, document_ids: set[str]) -> tuple[np.ndarray, bool]:
+        found, complete = [], True
+        for store in self.stores:
+            ids, shard_complete = store.ids_for_documents(document_ids)
+            complete = complete and shard_complete
+            if ids.size:
+                found.append(ids)
+        return (np.concatenate(found) if found else np.zeros(0, dtype=np.int64)), complete
+
+    # -------------------------
+    # Writes (in memory until save())
+    # -------------------------
+    def add(
+        self,
+        vectors: np.ndarray,
+        ids: np.ndarray | list[int] | None = None,
+        records: list[ChunkRecord] | None = None,
+    ) -> list[int]:
+        id_arr = new_vector_ids(vectors.shape[0]) if ids is None else np.asarray(ids, dtype=np.int64)
+        if id_arr.shape[0] != vectors.shape[0]:
+            raise ValueError(f"Got {id_arr.shape[0]} ids for {vectors.shape[0]} vectors")
+        shard = self._shard_of(id_arr)
+        for i, store in enumerate(self.stores):
+            rows = np.nonzero(shard == i)[0]
+            if rows.size:
+                store.add(vectors[rows], id_arr[rows], None if records is None else [records[r] for r in rows.tolist()])
+                self._dirty.add(i)
+        return id_arr.tolist()
+
+    def remove(self, ids: list[int]) -> int:
+        id_arr = np.asarray(ids, dtype=np.int64)
+        shard = self._shard_of(id_arr)
+        removed = 0
+        for i, store in enumerate(self.stores):
+            part = id_arr[shard == i]
+            if part.size:
+                removed += store.remove(part.tolist())
+                self._dirty.add(i)
+        return removed
+
+    def restore(self, ids: list[int]) -> int:
+        id_arr = np.asarray(ids, dtype=np.int64)
+        shard = self._shard_of(id_arr)
+        restored = 0
+        for i, store in enumerate(self.stores):
+            part = id_arr[shard == i]
+            if part.size:
+                restored += store.restore(part.tolist())
+                self._dirty.add(i)
+        return restored
+
+    def save(self) -> None:
+        """
+        Saves the shards changed through this view (each commits its own manifest).
+        """
+        for i in sorted(self._dirty):
+            self.stores[i].save()
+        self._dirty.clear()
+
+
+def get_collection(name: str, dim: int) -> Collection:
+    """
+    Read view over the process-wide shard stores (see get_store: loaded once, hot-reloaded).
+    """
+    return Collection(name, [get_store(dim, path) for path in collection_dirs(name)])
+
+
+def open_collection(name: str, dim: int, load_segments: bool = False) -> Collection:
+    """
+    A private copy for writers: freshly loaded shard stores (metadata only by default).
+    """
+    return Collection(
+        name,
+        [FaissStore(dim=dim, path=path).load_or_create(load_segments=load_segments) for path in collection_dirs(name)],
+    )
+
+
+def _remove_index_dir(path: str) -> None:
+    if os.path.normpath(path) == os.path.normpath(settings.FAISS_DIR):
+        # The implicit default layout shares FAISS_DIR with other files: only drop the index
+        for name in (MANIFEST_FILE, VERSION_FILE, INDEX_FILE, TOMBSTONES_FILE):
+            try:
+                os.remove(os.path.join(path, name))
+            except FileNotFoundError:
+                pass
+        shutil.rmtree(os.path.join(path, SEGMENTS_SUBDIR), ignore_errors=True)
+        return
+    shutil.rmtree(path, ignore_errors=True)
+    try:
+        os.rmdir(os.path.dirname(path))  # the layout dir, once its last shard is gone
+    except OSError:
+        pass
+
+
+def reshard_collection(name: str, dim: int, shards: int, lookup: ChunkLookup | None = None) -> Collection:
+    """
+    Re-partitions `name` into `shards` fresh index dirs: every live vector is copied with
+    its id and chunk record (from the sidecars, else `lookup`), each shard is built as
+    the configured index type, then the registry entry is swapped (the commit point)
+    and the old dirs are deleted. Ingestion and maintenance wait on `writer_lock`.
+    """
+    shards = _validate_shards(shards)
+    with writer_lock:
+        return _reshard(name, dim, shards, lookup)
+
+
+def _reshard(name: str, dim: int, shards: int, lookup: ChunkLookup | None) -> Collection:
+    old_dirs = collection_dirs(name)
+    old = open_collection(name, dim, load_segments=True)
+
+    layout = _layout_dirs(name, shards)
+    new = Collection(name, [
+        FaissStore(dim=dim, path=os.path.join(settings.FAISS_DIR, d)).load_or_create(load_segments=False)
+        for d in layout
+    ])
+    for store in old.stores:
+        ids, vectors = store.id_vectors()
+        if ids.size == 0:
+            continue
+        id_list = ids.tolist()
+        records = store.lookup_chunks(id_list)
+        missing = [i for i in id_list if i not in records]
+        if missing and lookup is not None:
+            records.update(lookup(missing))
+        complete = all(i in records for i in id_list)
+        new.add(vectors, ids, [records[i] for i in id_list] if complete else None)
+
+    # Answer caches key on the content version: keep it moving forward across the swap
+    version = old.content_version + 1
+    for store in new.stores:
+        store.merge(None)
+        store.content_version = version
+        store.save()
+
+    with _registry_lock:
+        entries = _read_entries()
+        entries[name] = {"shards": shards, "dirs": layout}
+        _write_entries(entries)
+    for path in old_dirs:
+        _remove_index_dir(path)
+    print(f"[COLLECTION] Resharded '{name}' into {shards} shards ({new.count()} vectors)")
+    return new
@@ -0,0 +1,168 @@
+import threading
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.chunk_store import ChunkRecord
+from app.services.embedder import estimate_tokens
+from app.services.metrics import counter
+
+# "\n\n---\n\nContext #N:\n" the prompts put around every context
+_CONTEXT_OVERHEAD_TOKENS = 5
+
+CONTEXT_TOKENS = counter(
+    "kb_context_tokens_total",
+    "Context tokens of answer prompts: retrieved (chunks as found) and packed (after assembly).",
+)
+
+
+@dataclass
+class ContextBlock:
+    """
+    One prompt context: a chunk, or a run of adjacent chunks of one document merged
+    into a single text (chunks in document order, scores aligned with them).
+    """
+    text: str
+    chunks: list[ChunkRecord] = field(default_factory=list)
+    scores: list[float] = field(default_factory=list)
+
+
+def mmr_order(scores: np.ndarray, vectors: np.ndarray, lambda_: float) -> list[int]:
+    """
+    Maximal marginal relevance order of the candidates: each step takes the one with
+    the best `lambda_ * relevance - (1 - lambda_) * max similarity to those already taken`.
+    `scores` are the query similarities from retrieval; `vectors` are L2-normalized.
+    """
+    n = int(scores.shape[0])
+    sim = vectors @ vectors.T
+    relevance = lambda_ * scores.astype(np.float32)
+    redundancy = np.zeros(n, dtype=np.float32)
+    taken = np.zeros(n, dtype=bool)
+    order: list[int] = []
+    for _ in range(n):
+        mmr = np.where(taken, -np.inf, relevance - (1.0 - lambda_) * redundancy)
+        best = int(np.argmax(mmr))
+        order.append(best)
+        taken[best] = True
+        redundancy = sim[best] if len(order) == 1 else np.maximum(redundancy, sim[best])
+    return order
+
+
+def _join(a: str, b: str) -> str:
+    # The chunker starts a chunk with up to CHUNK_OVERLAP_TOKENS of the previous one's
+    # trailing lines: keep them once (longest overlap first)
+    i = 0
+    while i < len(a):
+        if len(a) - i <= len(b) and b.startswith(a[i:]):
+            return a + b[len(a) - i:]
+        i = a.find("\n", i) + 1
+        if i == 0:
+            break
+    return f"{a}\n{b}"
+
+
+def merge_adjacent(chunks: list[ChunkRecord], scores: list[float]) -> list[ContextBlock]:
+    """
+    Blocks of `chunks` (best first), where consecutive chunks of the same document
+    become one block; blocks keep the rank of their best chunk.
+    """
+    rank = {c.chunk_id: r for r, c in enumerate(chunks)}
+    ordered = sorted(zip(chunks, scores), key=lambda cs: (cs[0].document_id, cs[0].chunk_index))
+    blocks: list[ContextBlock] = []
+    prev: ChunkRecord | None = None
+    for c, s in ordered:
+        if prev is not None and c.document_id == prev.document_id and c.chunk_index == prev.chunk_index + 1:
+            block = blocks[-1]
+            block.text = _join(block.text, c.text)
+        else:
+            block = ContextBlock(c.text)
+            blocks.append(block)
+        block.chunks.append(c)
+        block.scores.append(s)
+        prev = c
+    blocks.sort(key=lambda b: min(rank[c.chunk_id] for c in b.chunks))
+    return blocks
+
+
+def _tokens(blocks: list[ContextBlock]) -> int:
+    return sum(estimate_tokens(b.text) + _CONTEXT_OVERHEAD_TOKENS for b in blocks)
+
+
+class AssemblyStats:
+    """
+    Running totals of context assembly (retrieved vs packed tokens) for /v1/stats.
+    Thread-safe.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {"requests": 0, "chunks_retrieved": 0, "chunks_packed": 0, "tokens_retrieved": 0, "tokens_packed": 0}
+
+    def record(self, report: dict) -> None:
+        with self._lock:
+            self._totals["requests"] += 1
+            for key in ("chunks_retrieved", "chunks_packed", "tokens_retrieved", "tokens_packed"):
+                self._totals[key] += report[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._totals)
+        saved = out["tokens_retrieved"] - out["tokens_packed"]
+        out["tokens_saved"] = saved
+        out["saved_ratio"] = round(saved / out["tokens_retrieved"], 4) if out["tokens_retrieved"] else 0.0
+        return out
+
+
+assembly_stats = AssemblyStats()
+
+
+def assemble_context(
+    chunks: list[ChunkRecord],
+    scores: list[float],
+    vectors: np.ndarray | None = None,
+    token_budget: int | None = None,
+    lambda_: float | None = None,
+) -> tuple[list[ContextBlock], dict]:
+    """
+    Turns ranked retrieval hits into prompt contexts:
+    1) MMR reorders the hits when their `vectors` (rows aligned with `chunks`) are given,
+       so near-duplicates sink below chunks that add something new
+    2) hits are taken in that order while the merged contexts fit `token_budget`
+       (default CONTEXT_TOKEN_BUDGET, 0 = no limit); the first one always goes in
+    3) adjacent chunks of a document are merged, their shared overlap kept once
+
+    Returns (blocks, report) where report holds chunk and token counts before/after
+    (`tokens_saved` = retrieved - packed, overheads between contexts included).
+    """
+    budget = int(settings.CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget)
+    lambda_ = float(settings.CONTEXT_MMR_LAMBDA if lambda_ is None else lambda_)
+
+    order = list(range(len(chunks)))
+    use_mmr = vectors is not None and len(chunks) > 1 and lambda_ < 1.0
+    if use_mmr:
+        order = mmr_order(np.asarray(scores, dtype=np.float32), np.asarray(vectors, dtype=np.float32), lambda_)
+
+    picked: list[int] = []
+    blocks: list[ContextBlock] = []
+    for i in order:
+        trial = merge_adjacent([chunks[j] for j in picked + [i]], [scores[j] for j in picked + [i]])
+        if picked and budget > 0 and _tokens(trial) > budget:
+            continue  # a later, shorter (or adjacent) chunk may still fit
+        picked.append(i)
+        blocks = trial
+
+    retrieved = sum(estimate_tokens(c.text) + _CONTEXT_OVERHEAD_TOKENS for c in chunks)
+    packed = _tokens(blocks)
+    report = {
+        "mmr": use_mmr,
+        "chunks_retrieved": len(chunks),
+        "chunks_packed": len(picked),
+        "contexts": len(blocks),
+        "tokens_retrieved": retrieved,
+        "tokens_packed": packed,
+        "tokens_saved": retrieved - packed,
+    }
+    assembly_stats.record(report)
+    CONTEXT_TOKENS.inc(retrieved, kind="retrieved")
+    CONTEXT_TOKENS.inc(packed, kind="packed")
+    return blocks, report
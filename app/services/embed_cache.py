@@ -0,0 +1,172 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import settings
+from app.db.models import EmbeddingCacheEntry
+from app.db.session import SessionLocal
+
+# SQLite caps bound parameters per statement; look keys up in slices
+_DB_LOOKUP_BATCH = 500
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-tier content-addressed cache keyed by (embed model, sha256(text)):
+    - in-memory LRU, evicted by total vector bytes (EMBED_CACHE_MEMORY_MB)
+    - persistent `embedding_cache` table, shared across restarts and workers
+      (document chunks; query texts stay in memory, see `persistent`)
+
+    Thread-safe; the DB tier is best-effort (errors degrade to memory-only).
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = int(max_bytes)
+        self._lru: OrderedDict[tuple[str, str], np.ndarray] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    # -------------------------
+    # Memory tier
+    # -------------------------
+    def _remember(self, key: tuple[str, str], vec: np.ndarray) -> None:
+        # caller holds self._lock
+        old = self._lru.pop(key, None)
+        if old is not None:
+            self._bytes -= old.nbytes
+        if vec.nbytes > self.max_bytes:
+            return
+        self._lru[key] = vec
+        self._bytes += vec.nbytes
+        while self._bytes > self.max_bytes and self._lru:
+            _, evicted = self._lru.popitem(last=False)
+            self._bytes -= evicted.nbytes
+
+    # -------------------------
+    # Public API
+    # -------------------------
+    def get_many(self, model: str, hashes: list[str], persistent: bool = True) -> dict[str, np.ndarray]:
+        """
+        Returns {hash: vector} for every hash found in memory or (with `persistent`)
+        the DB. Counts one hit/miss per requested hash.
+        """
+        found: dict[str, np.ndarray] = {}
+        missing: list[str] = []
+
+        with self._lock:
+            for h in hashes:
+                vec = self._lru.get((model, h))
+                if vec is not None:
+                    self._lru.move_to_end((model, h))
+                    found[h] = vec
+                else:
+                    missing.append(h)
+            self.memory_hits += len(found)
+
+        from_db = self._db_get(model, list(dict.fromkeys(missing))) if missing and persistent else {}
+
+        with self._lock:
+            for h, vec in from_db.items():
+                self._remember((model, h), vec)
+            for h in missing:
+                if h in from_db:
+                    found[h] = from_db[h]
+                    self.db_hits += 1
+                else:
+                    self.misses += 1
+
+        return found
+
+    def put_many(self, model: str, items: dict[str, np.ndarray], persistent: bool = True) -> None:
+        """
+        Caches `items` in memory and, with `persistent`, in the DB (one write per call).
+        """
+        if not items:
+            return
+        items = {h: np.asarray(v, dtype=np.float32) for h, v in items.items()}
+        with self._lock:
+            for h, vec in items.items():
+                self._remember((model, h), vec)
+        if persistent:
+            self._db_put(model, items)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.db_hits + self.misses
+            return {
+                "enabled": settings.EMBED_CACHE_ENABLED,
+                "memory_hits": self.memory_hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.db_hits) / lookups, 4) if lookups else 0.0,
+                "memory_items": len(self._lru),
+                "memory_bytes": self._bytes,
+                "memory_max_bytes": self.max_bytes,
+            }
+
+    def clear_memory(self) -> None:
+        with self._lock:
+            self._lru.clear()
+            self._bytes = 0
+
+    # -------------------------
+    # DB tier
+    # -------------------------
+    def _db_get(self, model: str, hashes: list[str]) -> dict[str, np.ndarray]:
+        out: dict[str, np.ndarray] = {}
+        db = SessionLocal()
+        try:
+            for i in range(0, len(hashes), _DB_LOOKUP_BATCH):
+                batch = hashes[i:i + _DB_LOOKUP_BATCH]
+                rows = (
+                    db.query(EmbeddingCacheEntry.text_hash, EmbeddingCacheEntry.vector)
+                    .filter(
+                        EmbeddingCacheEntry.embed_model == model,
+                        EmbeddingCacheEntry.text_hash.in_(batch),
+                    )
+                    .all()
+                )
+                for h, blob in rows:
+                    out[h] = np.frombuffer(blob, dtype=np.float32).copy()
+        except Exception as e:
+            print(f"[WARN] Embedding cache lookup failed, continuing without DB tier. Reason: {e}")
+        finally:
+            db.close()
+        return out
+
+    def _db_put(self, model: str, items: dict[str, np.ndarray]) -> None:
+        rows = [
+            {"embed_model": model, "text_hash": h, "dim": int(vec.shape[0]), "vector": vec.tobytes()}
+            for h, vec in items.items()
+        ]
+        db = SessionLocal()
+        try:
+            if db.get_bind().dialect.name == "sqlite":
+                # One executemany; rows already cached (same content hash) are skipped
+                db.execute(sqlite_insert(EmbeddingCacheEntry).on_conflict_do_nothing(), rows)
+            else:
+                for row in rows:
+                    db.merge(EmbeddingCacheEntry(**row))
+            db.commit()
+        except IntegrityError:
+            # Another worker cached the same text concurrently; its row is equivalent
+            db.rollback()
+        except Exception as e:
+            db.rollback()
+            print(f"[WARN] Embedding cache write failed. Reason: {e}")
+        finally:
+            db.close()
+
+
+embedding_cache = EmbeddingCache(max_bytes=settings.EMBED_CACHE_MEMORY_MB * 1024 * 1024)
@@ -1,80 +1,194 @@
 import os
 import json
-import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import numpy as np
 from app.core.config import settings
+from app.services.embed_cache import embedding_cache, text_hash
+from app.services.local_embedder import LOCAL_EMBED_MODEL, get_local_embedder
 
 META_PATH = os.path.join(settings.FAISS_DIR, "meta.json")
 
 # Keep a stable dim for fallback so FAISS/indexing stays consistent
 DEFAULT_DIM = 1536
 
+# OpenAI rejects inputs above this many tokens, whatever the batch budget
+MAX_TOKENS_PER_INPUT = 8191
+
+
+@lru_cache(maxsize=4)
+def _openai_client(api_key: str, base_url: str | None):
+    from openai import OpenAI
+    # timeout prevents "infinite loading" behavior; retries are handled per batch below
+    return OpenAI(api_key=api_key, base_url=base_url, timeout=20.0, max_retries=0)
+
 
 def _client():
+    """
+    One client per key/base URL, reused across calls: `import openai` alone takes ~0.4s,
+    and a shared client keeps its HTTP connections alive between batches.
+    """
     if not settings.OPENAI_API_KEY:
         raise RuntimeError("OPENAI_API_KEY is not set.")
-    from openai import OpenAI
-    # timeout prevents "infinite loading" behavior
-    return OpenAI(api_key=settings.OPENAI_API_KEY, timeout=20.0, max_retries=1)
+    return _openai_client(settings.OPENAI_API_KEY, settings.OPENAI_BASE_URL)
+
+
+def _local_embed(texts: list[str], dim: int) -> np.ndarray:
+    """
+    Offline feature-hashing embeddings (see local_embedder): stateless, so documents and
+    queries embedded at any time stay comparable.
+    """
+    return get_local_embedder(dim).embed(texts)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate (~4 chars per token for English text); good enough for
+    packing requests under a budget without pulling in a tokenizer.
+    """
+    return max(1, len(text or "") // 4 + 1)
 
 
-def _local_fallback_embedding(text: str, dim: int = DEFAULT_DIM) -> np.ndarray:
+def pack_batches(texts: list[str], max_tokens: int, max_items: int) -> list[list[int]]:
     """
-    Deterministic local embedding fallback using hashing.
-    This is NOT semantically meaningful like real embeddings, but it:
-    - prevents the system from hanging
-    - keeps FAISS indexing/retrieval functional for demo
-    - keeps dimensions stable
+    Greedily packs consecutive texts into batches (lists of input positions) so each
+    batch stays under `max_tokens` estimated tokens and `max_items` inputs.
+    A single text larger than the budget gets a batch of its own.
     """
-    # sha256 -> 32 bytes; expand to dim by tiling
-    digest = hashlib.sha256((text or "").encode("utf-8")).digest()
-    base = np.frombuffer(digest, dtype=np.uint8).astype(np.float32)  # (32,)
-    vec = np.tile(base, (dim // base.size) + 1)[:dim]
+    max_items = max(1, int(max_items))
+    batches: list[list[int]] = []
+    current: list[int] = []
+    current_tokens = 0
+
+    for i, t in enumerate(texts):
+        n = min(estimate_tokens(t), MAX_TOKENS_PER_INPUT)
+        if current and (current_tokens + n > max_tokens or len(current) >= max_items):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += n
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _request_embeddings(client, texts: list[str]) -> np.ndarray:
+    resp = client.embeddings.create(
+        model=settings.EMBED_MODEL,
+        input=texts
+    )
+    # Responses carry an index per input; don't rely on ordering
+    data = sorted(resp.data, key=lambda item: item.index)
+    return np.array([item.embedding for item in data], dtype=np.float32)
+
+
+def _embed_batch_with_retry(client, texts: list[str]) -> np.ndarray | None:
+    retries = max(0, settings.EMBED_MAX_RETRIES)
+    for attempt in range(retries + 1):
+        try:
+            return _request_embeddings(client, texts)
+        except Exception as e:
+            if attempt >= retries:
+                # Handle quota/network issues gracefully
+                print(
+                    f"[WARN] OpenAI embeddings batch failed (size={len(texts)}), "
+                    f"using local fallback for it. Reason: {e}"
+                )
+                return None
+            time.sleep(0.5 * (2 ** attempt))
+    return None
+
+
+def _embed_openai(texts: list[str]) -> list[np.ndarray | None]:
+    """
+    Embeds `texts` through the API as token/item-budgeted batches, running up to
+    EMBED_CONCURRENCY requests at once. Returns one vector per input, in input order;
+    entries are None where their batch failed after retries.
+    """
+    out: list[np.ndarray | None] = [None] * len(texts)
+    batches = pack_batches(texts, settings.EMBED_BATCH_MAX_TOKENS, settings.EMBED_BATCH_MAX_ITEMS)
+
+    try:
+        client = _client()
+    except Exception as e:
+        print(f"[WARN] OpenAI embeddings unavailable, using local fallback. Reason: {e}")
+        return out
+
+    def run(batch: list[int]) -> tuple[list[int], np.ndarray | None]:
+        return batch, _embed_batch_with_retry(client, [texts[i] for i in batch])
+
+    workers = max(1, min(settings.EMBED_CONCURRENCY, len(batches)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed") as pool:
+        for batch, vectors in pool.map(run, batches):
+            if vectors is None:
+                continue
+            for pos, vec in zip(batch, vectors):
+                out[pos] = vec
+
+    # Persist dimension so FAISS can validate dim on next run
+    first = next((v for v in out if v is not None), None)
+    if first is not None:
+        persist_embedding_dim(int(first.shape[0]))
 
-    # Normalize to unit length for cosine/IP usage
-    norm = np.linalg.norm(vec)
-    if norm > 0:
-        vec = vec / norm
-    return vec.astype(np.float32)
+    return out
 
 
-def embed_texts(texts: list[str]) -> np.ndarray:
+def embed_texts(texts: list[str], is_query: bool = False) -> np.ndarray:
     """
     Returns: (n, dim) float32 embeddings.
     Uses OpenAI embeddings when available; falls back to deterministic local embeddings
-    when OpenAI is unavailable or quota-limited.
+    when OpenAI is unavailable or quota-limited. EMBED_MODEL=local-hash-v1 selects the
+    local engine explicitly (air-gapped deployments).
+
+    With EMBED_CACHE_ENABLED, vectors are looked up by (EMBED_MODEL, sha256(text)) first
+    and only distinct cache misses are sent to the API. Fallback vectors are never cached.
+    Queries (`is_query`) use the in-memory tier only: no DB round trip or write on the
+    query path, and user questions do not pile up in the `embedding_cache` table.
     """
     if not texts:
-        return np.zeros((0, DEFAULT_DIM), dtype=np.float32)
+        return np.zeros((0, get_embedding_dim()), dtype=np.float32)
 
-    # Try OpenAI embeddings
-    if settings.OPENAI_API_KEY:
-        try:
-            client = _client()
-            resp = client.embeddings.create(
-                model=settings.EMBED_MODEL,
-                input=texts
-            )
-            vectors = np.array([item.embedding for item in resp.data], dtype=np.float32)
+    if is_local_model():
+        return _local_embed(texts, dim=settings.LOCAL_EMBED_DIM)
 
-            # Persist dimension so FAISS can validate dim on next run
-            if vectors.size > 0:
-                persist_embedding_dim(int(vectors.shape[1]))
+    use_cache = settings.EMBED_CACHE_ENABLED and bool(settings.OPENAI_API_KEY)
+    model = settings.EMBED_MODEL
 
-            return vectors
+    hashes = [text_hash(t) for t in texts]
+    persistent = not is_query
+    known: dict[str, np.ndarray] = embedding_cache.get_many(model, hashes, persistent) if use_cache else {}
 
-        except Exception as e:
-            # Handle quota/network issues gracefully
-            print(f"[WARN] OpenAI embeddings unavailable, using local fallback. Reason: {e}")
+    # Distinct texts still needing an embedding (duplicates within the call are sent once)
+    todo: dict[str, str] = {}
+    for h, t in zip(hashes, texts):
+        if h not in known and h not in todo:
+            todo[h] = t
+
+    # Try OpenAI embeddings (batched + concurrent; failures fall back per batch)
+    if todo and settings.OPENAI_API_KEY:
+        vectors = _embed_openai(list(todo.values()))
+        fresh = {h: v for h, v in zip(todo.keys(), vectors) if v is not None}
+        if use_cache:
+            embedding_cache.put_many(model, fresh, persistent)
+        known.update(fresh)
+        todo = {h: t for h, t in todo.items() if h not in fresh}
 
     # Local fallback
-    dim = get_embedding_dim()
-    vectors = np.stack([_local_fallback_embedding(t, dim=dim) for t in texts], axis=0)
-    return vectors.astype(np.float32)
+    if todo:
+        dim = next(iter(known.values())).shape[0] if known else get_embedding_dim()
+        known.update(zip(todo.keys(), _local_embed(list(todo.values()), dim=dim)))
+
+    return np.stack([known[h] for h in hashes], axis=0).astype(np.float32)
 
 
 def embed_query(text: str) -> np.ndarray:
-    return embed_texts([text])[0]
+    return embed_texts([text], is_query=True)[0]
+
+
+def is_local_model() -> bool:
+    return settings.EMBED_MODEL == LOCAL_EMBED_MODEL
 
 
 def persist_embedding_dim(dim: int) -> None:
@@ -86,7 +200,8 @@ def persist_embedding_dim(dim: int) -> None:
 
 def get_embedding_dim() -> int:
     """
-    Uses persisted meta.json if present; otherwise returns DEFAULT_DIM.
+    Uses persisted meta.json if present; otherwise returns DEFAULT_DIM
+    (LOCAL_EMBED_DIM for the local engine).
     """
     if os.path.exists(META_PATH):
         try:
@@ -98,4 +213,4 @@ def get_embedding_dim() -> int:
         except Exception:
             pass
 
-    return DEFAULT_DIM
+    return settings.LOCAL_EMBED_DIM if is_local_model() else DEFAULT_DIM
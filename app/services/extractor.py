@@ -1,28 +1,304 @@
+import multiprocessing
+import os
+import signal
+import threading
+from collections import deque
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from pypdf import PdfReader
-from docx import Document as DocxDocument
+from typing import Iterator
+
+from app.core.config import settings
+from app.core.lazy import lazy_import
+
+# Parsers load on the first upload (or warmup); pool workers import them on their own
+pypdf = lazy_import("pypdf")
+docx = lazy_import("docx")
 
 SUPPORTED_EXTS = {".pdf", ".docx", ".txt", ".md"}
 
-def extract_text(file_path: str) -> str:
-    p = Path(file_path)
-    ext = p.suffix.lower()
+# Plain-text paragraphs longer than this are yielded in pieces (at line breaks)
+_MAX_TEXT_BLOCK_CHARS = 64 * 1024
+
+# DOCX files at least this large are parsed in the process pool (one XML tree, so no
+# page ranges; offloading keeps the GIL free for the API while it parses)
+_DOCX_OFFLOAD_BYTES = 2 * 1024 * 1024
 
+# Slack on top of the per-page budget before the parent gives up on a whole range
+_RANGE_GRACE_S = 10.0
+
+def _check_ext(file_path: str) -> str:
+    ext = Path(file_path).suffix.lower()
     if ext not in SUPPORTED_EXTS:
         raise ValueError(f"Unsupported file type: {ext}. Supported: {sorted(SUPPORTED_EXTS)}")
+    return ext
+
+def _iter_text_file(file_path: str) -> Iterator[str]:
+    # Blank-line separated paragraphs, read line by line
+    buf: list[str] = []
+    size = 0
+    with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            if not line.strip():
+                if buf:
+                    yield "".join(buf)
+                    buf, size = [], 0
+                continue
+            buf.append(line)
+            size += len(line)
+            if size >= _MAX_TEXT_BLOCK_CHARS:
+                yield "".join(buf)
+                buf, size = [], 0
+    if buf:
+        yield "".join(buf)
+
+def _docx_blocks(file_path: str) -> list[str]:
+    doc = docx.Document(file_path)
+    blocks = []
+    for para in doc.paragraphs:
+        # Keep Word heading styles visible to the chunker as markdown headings
+        style = (para.style.name if para.style is not None else "") or ""
+        if style.startswith("Heading") and para.text.strip():
+            blocks.append(f"# {para.text.strip()}")
+        else:
+            blocks.append(para.text)
+    return blocks
+
+# -------------------------
+# Worker side (runs in pool processes)
+# -------------------------
+class _PageTimeout(Exception):
+    pass
+
+def _on_alarm(signum, frame):
+    raise _PageTimeout()
+
+def _extract_page(reader: "pypdf.PdfReader", i: int, timeout_s: float) -> tuple[str, str | None]:
+    """
+    (text, error) for page i. The per-page timeout uses SIGALRM, which is only
+    available on POSIX and in a process's main thread (true for pool workers).
+    """
+    use_alarm = (
+        timeout_s > 0
+        and hasattr(signal, "SIGALRM")
+        and threading.current_thread() is threading.main_thread()
+    )
+    if use_alarm:
+        previous = signal.signal(signal.SIGALRM, _on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout_s)
+    try:
+        return reader.pages[i].extract_text() or "", None
+    except _PageTimeout:
+        return "", f"timed out after {timeout_s:g}s"
+    except Exception as e:
+        return "", f"{type(e).__name__}: {e}"
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+
+def _extract_page_range(file_path: str, start: int, end: int, timeout_s: float) -> list[tuple[str, str | None]]:
+    reader = pypdf.PdfReader(file_path)
+    return [_extract_page(reader, i, timeout_s) for i in range(start, end)]
+
+# -------------------------
+# Process pool
+# -------------------------
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+def extract_workers() -> int:
+    workers = settings.EXTRACT_WORKERS
+    return workers if workers > 0 else min(4, os.cpu_count() or 1)
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: the API process has threads (workers, FAISS, SQLite); forking it is unsafe
+            _pool = ProcessPoolExecutor(
+                max_workers=extract_workers(),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+def _reset_pool(pool: ProcessPoolExecutor) -> None:
+    """
+    Drops a pool with a stuck worker: the executor API cannot cancel a running task,
+    so its processes are terminated and the next call starts a fresh pool. Tasks of
+    other documents on it fail too; their callers resubmit them (see _was_reset).
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    for proc in list((getattr(pool, "_processes", None) or {}).values()):
+        proc.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _was_reset(pool: ProcessPoolExecutor) -> bool:
+    # The pool was dropped (by any document): a task failing on it is not at fault
+    with _pool_lock:
+        return _pool is not pool
+
+def _submit(fn, *args) -> tuple[ProcessPoolExecutor, Future]:
+    # Submits to the shared pool; moves on to a fresh one if another document just reset it
+    while True:
+        pool = _get_pool()
+        try:
+            return pool, pool.submit(fn, *args)
+        except RuntimeError:
+            if not _was_reset(pool):
+                raise
+
+def _result(fut: Future, timeout: float | None):
+    """
+    fut.result(timeout) where time spent queued behind other documents' tasks does not
+    count: a task that has not started yet is waited for again.
+    """
+    while True:
+        try:
+            return fut.result(timeout=timeout)
+        except FutureTimeout:
+            if fut.running() or fut.done():
+                raise
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+# -------------------------
+# Parent side
+# -------------------------
+def _iter_pdf_pages_parallel(file_path: str, n_pages: int) -> Iterator[str]:
+    """
+    Page ranges run on the process pool; pages are yielded strictly in order while up to
+    2x workers ranges are in flight. Failed or timed-out pages come back as "".
+    """
+    # Every task re-opens the PDF (cost of several pages on big files), so ranges grow
+    # with the document: ~4 ranges per worker, never below EXTRACT_PAGES_PER_TASK
+    per_task = max(1, settings.EXTRACT_PAGES_PER_TASK, -(-n_pages // (4 * extract_workers())))
+    timeout_s = float(settings.EXTRACT_PAGE_TIMEOUT_S)
+    ranges = deque((s, min(n_pages, s + per_task)) for s in range(0, n_pages, per_task))
+    in_flight: deque[tuple[int, int, ProcessPoolExecutor, Future]] = deque()
+
+    def submit_more() -> None:
+        while ranges and len(in_flight) < 2 * extract_workers():
+            s, e = ranges.popleft()
+            in_flight.append((s, e, *_submit(_extract_page_range, file_path, s, e, timeout_s)))
+
+    def requeue(head: list[tuple[int, int]]) -> None:
+        # Ranges still in flight go back in front of the queue, in page order
+        pending = head + [(s, e) for s, e, _, _ in in_flight]
+        for _, _, _, fut in in_flight:
+            fut.cancel()
+        in_flight.clear()
+        ranges.extendleft(reversed(pending))
+
+    try:
+        submit_more()
+        while in_flight:
+            start, end, pool, fut = in_flight.popleft()
+            try:
+                deadline = timeout_s * (end - start) + _RANGE_GRACE_S if timeout_s > 0 else None
+                results = _result(fut, deadline)
+            except (FutureTimeout, BrokenProcessPool, CancelledError) as e:
+                if not isinstance(e, FutureTimeout) and _was_reset(pool):
+                    # Another document reset the shared pool: run this range again on the new one
+                    print(f"[EXTRACT] pool was reset; resubmitting pages {start + 1}-{end} file={file_path}")
+                    requeue([(start, end)])
+                    submit_more()
+                    continue
+                if isinstance(e, FutureTimeout):
+                    # Worker is stuck beyond its own per-page alarm (e.g. no SIGALRM on Windows)
+                    print(f"[EXTRACT][WARN] pages {start + 1}-{end} timed out; skipping file={file_path}")
+                    results = [("", "timed out")] * (end - start)
+                else:
+                    # A worker died (crash/OOM); the pool is unusable from here on
+                    print(f"[EXTRACT][WARN] worker died on pages {start + 1}-{end}; retrying in-thread")
+                    reader = pypdf.PdfReader(file_path)
+                    results = [_extract_page(reader, i, 0) for i in range(start, end)]
+                _reset_pool(pool)
+                # Resubmit what was queued behind the failed range on the fresh pool
+                requeue([])
+            except Exception as e:
+                print(f"[EXTRACT][WARN] pages {start + 1}-{end} failed in worker ({e}); retrying in-thread")
+                reader = pypdf.PdfReader(file_path)
+                results = [_extract_page(reader, i, 0) for i in range(start, end)]
+
+            for offset, (text, error) in enumerate(results):
+                if error:
+                    print(f"[EXTRACT][WARN] page {start + offset + 1} skipped: {error} file={file_path}")
+                yield text
+            submit_more()
+    finally:
+        for _, _, _, fut in in_flight:
+            fut.cancel()
+
+def _iter_pdf_pages(file_path: str) -> Iterator[str]:
+    reader = pypdf.PdfReader(file_path)
+    n_pages = len(reader.pages)
+    if n_pages >= settings.EXTRACT_PARALLEL_MIN_PAGES and extract_workers() > 0:
+        del reader
+        yield from _iter_pdf_pages_parallel(file_path, n_pages)
+        return
+    # Small documents: pool round trips would cost more than they save
+    for page in reader.pages:
+        yield page.extract_text() or ""
+
+def _pooled_docx_blocks(file_path: str, size: int) -> list[str]:
+    """
+    Parses a large DOCX on the process pool under the page budget (one page per
+    _DOCX_OFFLOAD_BYTES). A stuck parse resets the pool and fails the document; one
+    lost to another document's pool reset is resubmitted.
+    """
+    timeout_s = float(settings.EXTRACT_PAGE_TIMEOUT_S)
+    deadline = timeout_s * max(1, size // _DOCX_OFFLOAD_BYTES) + _RANGE_GRACE_S if timeout_s > 0 else None
+    while True:
+        pool, fut = _submit(_docx_blocks, file_path)
+        try:
+            return _result(fut, deadline)
+        except (BrokenProcessPool, CancelledError):
+            if _was_reset(pool):
+                print(f"[EXTRACT] pool was reset; resubmitting file={file_path}")
+                continue
+            # A worker died (crash/OOM) on this file
+            _reset_pool(pool)
+            raise
+        except FutureTimeout:
+            _reset_pool(pool)
+            raise TimeoutError(f"DOCX parsing timed out after {deadline:g}s: {file_path}")
+
+def iter_blocks(file_path: str) -> Iterator[str]:
+    """
+    Streams a document as text blocks, in document order: PDF pages, DOCX paragraphs,
+    text-file paragraphs. Large PDFs are extracted in parallel page ranges on a process
+    pool (see _iter_pdf_pages_parallel).
+    """
+    ext = _check_ext(file_path)
 
     if ext in [".txt", ".md"]:
-        return p.read_text(encoding="utf-8", errors="ignore")
+        yield from _iter_text_file(file_path)
+        return
 
     if ext == ".pdf":
-        reader = PdfReader(file_path)
-        pages = []
-        for page in reader.pages:
-            pages.append(page.extract_text() or "")
-        return "\n".join(pages)
+        yield from _iter_pdf_pages(file_path)
+        return
 
     if ext == ".docx":
-        doc = DocxDocument(file_path)
-        return "\n".join([para.text for para in doc.paragraphs])
+        size = os.path.getsize(file_path)
+        if size >= _DOCX_OFFLOAD_BYTES and extract_workers() > 0:
+            yield from _pooled_docx_blocks(file_path, size)
+        else:
+            yield from _docx_blocks(file_path)
+        return
 
     raise ValueError(f"Unhandled file extension: {ext}")
+
+def extract_text(file_path: str) -> str:
+    _check_ext(file_path)
+    return "\n".join(iter_blocks(file_path))
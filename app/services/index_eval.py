@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import time
+
+import numpy as np
+
+from app.core.lazy import lazy_import
+
+faiss = lazy_import("faiss")
+
+
+def sample_queries(vectors: np.ndarray, n_queries: int, seed: int = 0) -> np.ndarray:
+    """
+    Picks stored vectors as queries and perturbs them slightly, so queries sit
+    near (not exactly on) the data like real questions do.
+    """
+    rng = np.random.default_rng(seed)
+    n = min(int(n_queries), int(vectors.shape[0]))
+    picks = rng.choice(vectors.shape[0], size=n, replace=False)
+    q = vectors[picks] + rng.normal(0, 0.01, size=(n, vectors.shape[1])).astype(np.float32)
+    q = q.astype(np.float32)
+    faiss.normalize_L2(q)
+    return q
+
+
+def _timed_search(index: faiss.Index, queries: np.ndarray, k: int) -> tuple[np.ndarray, list[float]]:
+    # One query at a time: that is how /v1/query hits the index
+    ids = np.empty((queries.shape[0], k), dtype=np.int64)
+    latencies_ms: list[float] = []
+    for i in range(queries.shape[0]):
+        t = time.perf_counter()
+        _, found = index.search(queries[i:i + 1], k)
+        latencies_ms.append((time.perf_counter() - t) * 1000.0)
+        ids[i] = found[0]
+    return ids, latencies_ms
+
+
+def recall_at_k(exact_ids: np.ndarray, approx_ids: np.ndarray) -> float:
+    hits = 0
+    total = 0
+    for truth, got in zip(exact_ids, approx_ids):
+        truth_set = {int(x) for x in truth if x >= 0}
+        hits += len(truth_set & {int(x) for x in got if x >= 0})
+        total += len(truth_set)
+    return hits / total if total else 1.0
+
+
+def _latency_summary(latencies_ms: list[float]) -> dict:
+    arr = np.asarray(latencies_ms, dtype=np.float64)
+    return {
+        "mean_ms": round(float(arr.mean()), 4),
+        "p50_ms": round(float(np.percentile(arr, 50)), 4),
+        "p95_ms": round(float(np.percentile(arr, 95)), 4),
+        "p99_ms": round(float(np.percentile(arr, 99)), 4),
+    }
+
+
+def compare_to_exact(
+    candidates: dict[str, faiss.Index],
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+) -> dict:
+    """
+    Runs `queries` against an exact IndexFlatIP over `vectors` and against each
+    candidate index; reports recall@k vs exact and per-query latency for all of them.
+    """
+    exact = faiss.IndexFlatIP(vectors.shape[1])
+    exact.add(vectors)
+    exact_ids, exact_lat = _timed_search(exact, queries, k)
+
+    report = {
+        "vectors": int(vectors.shape[0]),
+        "queries": int(queries.shape[0]),
+        "k": int(k),
+        "results": {"flat (exact)": {"recall_at_k": 1.0, **_latency_summary(exact_lat)}},
+    }
+    for name, index in candidates.items():
+        ids, lat = _timed_search(index, queries, k)
+        report["results"][name] = {
+            "recall_at_k": round(recall_at_k(exact_ids, ids), 4),
+            **_latency_summary(lat),
+        }
+    return report
+
+
+def exact_neighbors(vectors: np.ndarray, ids: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """
+    Ground-truth top-k ids (`ids[i]` belongs to `vectors[i]`) by exact inner product.
+    """
+    exact = faiss.IndexFlatIP(vectors.shape[1])
+    exact.add(np.ascontiguousarray(vectors, dtype=np.float32))
+    _, rows = exact.search(queries, k)
+    return np.where(rows >= 0, ids[np.maximum(rows, 0)], -1)
+
+
+def store_recall(store, truth: np.ndarray, queries: np.ndarray, k: int) -> dict:
+    """
+    recall@k vs `truth` and per-query latency of FaissStore.search, i.e. over all
+    segments, with tombstones and rescoring applied like in /v1/query.
+    """
+    found = np.empty((queries.shape[0], k), dtype=np.int64)
+    latencies_ms: list[float] = []
+    for i in range(queries.shape[0]):
+        t = time.perf_counter()
+        ids, _ = store.search(queries[i], k)
+        latencies_ms.append((time.perf_counter() - t) * 1000.0)
+        found[i] = ids
+    return {"recall_at_k": round(recall_at_k(truth, found), 4), **_latency_summary(latencies_ms)}
@@ -0,0 +1,505 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, Iterator
+
+import numpy as np
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.models import Chunk, Document
+from app.db.session import SessionLocal
+from app.services.chunk_store import ChunkRecord
+from app.services.collections import Collection, collection_dirs, open_collection, read_registry
+from app.services.embedder import get_embedding_dim
+from app.services.metrics import counter, histogram, span
+from app.services.vector_store import FaissStore, writer_lock
+
+WRITER_BATCHES = counter("kb_index_writer_batches_total", "Write batches applied by the index writer, by outcome.")
+WRITER_BATCH_SIZE = histogram(
+    "kb_index_writer_batch_commands", "Commands applied per index writer batch.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+
+
+@dataclass
+class _Command:
+    """
+    One queued index write: add a document's vectors with their chunk rows, or delete
+    (`vectors` is None: all of its vectors, or only `remove_ids`).
+    Replacements stream in groups: `retire` moves the current rows aside (their vectors
+    stay searchable), `drop_retired` tombstones and deletes the retired rows, and
+    `restore_retired` puts them back (a replacement that failed midway).
+    """
+    collection: str
+    document_id: str
+    vectors: np.ndarray | None = None
+    ids: list[int] | None = None
+    records: list[ChunkRecord] | None = None
+    retire: bool = False
+    drop_retired: bool = False
+    remove_ids: list[int] | None = None
+    restore_retired: bool = False
+    future: Future = field(default_factory=Future)
+    # Vectors this command tombstoned in the current attempt (revived if the batch fails)
+    tombstoned: list[int] = field(default_factory=list)
+
+
+@dataclass
+class _Task:
+    # Arbitrary work (maintenance) run on the writer thread between batches
+    fn: Callable[[], object]
+    future: Future = field(default_factory=Future)
+
+
+_STOP = object()
+
+
+class _PartialWriteError(RuntimeError):
+    # Some index changes of the batch were saved before it failed: not retried as a batch
+    pass
+
+
+def _retire_rows(db: Session, document_id: str, restore: bool = False) -> None:
+    """
+    Moves the document's chunk rows aside (chunk_index -> -1 - chunk_index), freeing the
+    indexes for the next version while the old one stays indexed; `restore` moves
+    retired rows back. Not committed.
+    """
+    rows = Chunk.chunk_index < 0 if restore else Chunk.chunk_index >= 0
+    db.query(Chunk).filter(Chunk.document_id == document_id, rows).update(
+        {Chunk.chunk_index: -1 - Chunk.chunk_index}, synchronize_session=False
+    )
+
+
+def _remove_document_vectors(
+    db: Session,
+    store: Collection,
+    document_id: str,
+    remove_ids: list[int] | None = None,
+    retired: bool = False,
+) -> list[int]:
+    """
+    Tombstones the document's vectors and deletes their chunk rows (not committed):
+    all of them, only those of `remove_ids`, or only the `retired` ones.
+    Returns the tombstoned ids.
+    """
+    q = db.query(Chunk.faiss_id).filter(Chunk.document_id == document_id)
+    if retired:
+        q = q.filter(Chunk.chunk_index < 0)
+    old_ids = [fid for (fid,) in q.all()]
+    if remove_ids is not None:
+        wanted = set(remove_ids)
+        old_ids = [fid for fid in old_ids if fid in wanted]
+    if not old_ids:
+        return []
+    store.remove(old_ids)
+    if remove_ids is None:
+        rows = db.query(Chunk).filter(Chunk.document_id == document_id)
+        if retired:
+            rows = rows.filter(Chunk.chunk_index < 0)
+        rows.delete(synchronize_session=False)
+    else:
+        for start in range(0, len(old_ids), 900):  # stay under SQLite's bound-parameter limit
+            db.query(Chunk).filter(
+                Chunk.document_id == document_id, Chunk.faiss_id.in_(old_ids[start:start + 900])
+            ).delete(synchronize_session=False)
+    return old_ids
+
+
+class IndexWriter:
+    """
+    The one owner of index writes in this process. Ingestion and deletes enqueue
+    commands; a dedicated thread drains the queue and applies whatever accumulated
+    as one batch:
+    - per collection: load the latest manifests, tombstone/add every command's vectors,
+      then one save() (one new segment per shard, one manifest swap)
+    - chunk rows of the whole batch in one DB transaction, committed after the saves;
+      if the commit fails, the batch's new vectors are tombstoned again
+    - each command's Future resolves once its vectors are durable and visible
+
+    The batch holds `writer_lock`, which also excludes writers in other processes
+    (uvicorn workers, CLI). Queries never wait on it: they search the last committed
+    manifest through get_store() and swap to the next one atomically. Maintenance runs
+    on its own thread and takes the lock only to swap in its result (see _rewrite_shard).
+    """
+    def __init__(self):
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._maintenance_pending = threading.Event()
+        self._maintenance_thread: threading.Thread | None = None
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="index-writer", daemon=True)
+                self._thread.start()
+
+    def _submit(self, item: _Command | _Task) -> Future:
+        self._ensure_started()
+        self._queue.put(item)
+        return item.future
+
+    # -------------------------
+    # Commands
+    # -------------------------
+    def add_document(
+        self,
+        collection: str,
+        document_id: str,
+        vectors: np.ndarray,
+        ids: list[int],
+        records: list[ChunkRecord],
+        replace: bool = False,
+        first: bool = True,
+        last: bool = True,
+    ) -> Future:
+        """
+        Indexes a document's vectors and chunk rows. With `replace`, its previous version
+        is tombstoned in the same write as the `last` group of the new one; until then
+        (from the `first` group on) it stays searchable. Resolves to the number of
+        tombstoned vectors.
+        """
+        return self._submit(_Command(
+            collection, document_id, vectors, ids, records,
+            retire=replace and first, drop_retired=replace and last,
+        ))
+
+    def delete_document(
+        self,
+        collection: str,
+        document_id: str,
+        remove_ids: list[int] | None = None,
+        restore_retired: bool = False,
+    ) -> Future:
+        """
+        Tombstones a document's vectors and deletes their chunk rows: all of them, or
+        only `remove_ids` (e.g. the groups of an ingest that failed midway). With
+        `restore_retired`, the previous version an unfinished replacement had retired
+        takes their place again. Resolves to the count.
+        """
+        return self._submit(_Command(collection, document_id, remove_ids=remove_ids, restore_retired=restore_retired))
+
+    def run(self, fn: Callable[[], object]) -> Future:
+        return self._submit(_Task(fn))
+
+    def stop(self, timeout: float | None = 30.0) -> None:
+        """
+        Applies what is already queued, then stops the thread (app shutdown).
+        A running maintenance pass gets the same `timeout` to finish.
+        """
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join(timeout)
+        maintenance = self._maintenance_thread
+        if maintenance is not None and maintenance.is_alive():
+            maintenance.join(timeout)
+
+    # -------------------------
+    # Writer thread
+    # -------------------------
+    def _next_batch(self, first: _Command) -> tuple[list[_Command], object | None]:
+        # Linger briefly so commands arriving together share one segment and manifest swap
+        batch = [first]
+        deadline = time.perf_counter() + settings.INDEX_WRITER_BATCH_WAIT_MS / 1000
+        while len(batch) < settings.INDEX_WRITER_MAX_BATCH:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if not isinstance(item, _Command):
+                return batch, item
+            batch.append(item)
+        return batch, None
+
+    def _loop(self) -> None:
+        pending = None
+        while True:
+            item = pending if pending is not None else self._queue.get()
+            pending = None
+            if item is _STOP:
+                return
+            if isinstance(item, _Task):
+                self._run_task(item)
+                continue
+            batch, pending = self._next_batch(item)
+            self._apply_batch(batch)
+
+    def _run_task(self, task: _Task) -> None:
+        try:
+            task.future.set_result(task.fn())
+        except Exception as e:
+            task.future.set_exception(e)
+
+    def _apply_batch(self, batch: list[_Command]) -> None:
+        try:
+            stores, removed = self._apply(batch)
+        except Exception as e:
+            WRITER_BATCHES.inc(outcome="failed")
+            if len(batch) > 1 and not isinstance(e, _PartialWriteError):
+                # Retry one by one, so a single bad command fails alone
+                print(f"[INDEX] Batch of {len(batch)} failed ({e}); retrying commands individually")
+                for cmd in batch:
+                    self._apply_batch([cmd])
+                return
+            for cmd in batch:
+                cmd.future.set_exception(e)
+            return
+
+        WRITER_BATCHES.inc(outcome="applied")
+        WRITER_BATCH_SIZE.observe(len(batch))
+        for cmd, n in zip(batch, removed):
+            cmd.future.set_result(n)
+        try:
+            self._maybe_schedule_maintenance(stores)
+        except Exception as e:
+            print(f"[FAISS][ERROR] Maintenance check failed: {e}")
+
+    def _apply(self, batch: list[_Command]) -> tuple[list[Collection], list[int]]:
+        removed: list[int] = []
+        stores: dict[str, Collection] = {}
+        with span("ingest.lock_wait"):
+            writer_lock.acquire()
+        try:
+            with SessionLocal() as db:
+                saved: list[Collection] = []
+                try:
+                    for cmd in batch:
+                        store = stores.get(cmd.collection)
+                        if store is None:
+                            # Latest manifests only: other processes may have saved since
+                            dim = int(cmd.vectors.shape[1]) if cmd.vectors is not None else get_embedding_dim()
+                            with span("ingest.index_load"):
+                                store = stores[cmd.collection] = open_collection(cmd.collection, dim)
+                        removed.append(self._apply_command(db, store, cmd))
+                    # Index first: append the new segments (+ their chunk sidecars) and commit
+                    # the manifests, so chunk rows never outlive vectors that were not saved
+                    with span("ingest.faiss_save"):
+                        for store in stores.values():
+                            store.save()
+                            saved.append(store)
+                    with span("ingest.db_write"):
+                        db.commit()
+                except Exception as e:
+                    db.rollback()
+                    if not saved:
+                        raise
+                    _undo_adds(saved, batch)
+                    raise _PartialWriteError(f"Index write failed after saving {len(saved)} collection(s): {e}") from e
+        finally:
+            writer_lock.release()
+        return list(stores.values()), removed
+
+    def _apply_command(self, db: Session, store: Collection, cmd: _Command) -> int:
+        cmd.tombstoned = []
+        if cmd.vectors is None:
+            if cmd.remove_ids is not None or not cmd.restore_retired:
+                cmd.tombstoned = _remove_document_vectors(db, store, cmd.document_id, cmd.remove_ids)
+            if cmd.restore_retired:
+                _retire_rows(db, cmd.document_id, restore=True)
+            return len(cmd.tombstoned)
+        if cmd.retire:
+            _retire_rows(db, cmd.document_id)
+        if cmd.drop_retired:
+            cmd.tombstoned = _remove_document_vectors(db, store, cmd.document_id, retired=True)
+        with span("ingest.faiss_add"):
+            store.add(cmd.vectors, cmd.ids, cmd.records)
+        # One executemany insert for all rows, committed with the rest of the batch
+        db.execute(
+            insert(Chunk),
+            [
+                {
+                    "id": rec.chunk_id,
+                    "document_id": rec.document_id,
+                    "chunk_index": rec.chunk_index,
+                    "text": rec.text,
+                    "faiss_id": fid,
+                }
+                for rec, fid in zip(cmd.records, cmd.ids)
+            ],
+        )
+        return len(cmd.tombstoned)
+
+    def _maybe_schedule_maintenance(self, stores: list[Collection]) -> bool:
+        """
+        Queues a maintenance pass when segments/tombstones/training call for it.
+        """
+        if self._maintenance_pending.is_set() or not any(needs_maintenance(s) for s in stores):
+            return False
+        self._maintenance_pending.set()
+
+        def task() -> None:
+            try:
+                run_maintenance()
+            except Exception as e:
+                print(f"[FAISS][ERROR] Maintenance failed: {e}")
+            finally:
+                self._maintenance_pending.clear()
+
+        # Off the writer thread: queued writes keep flowing while segments are rebuilt
+        self._maintenance_thread = threading.Thread(target=task, name="index-maintenance", daemon=True)
+        self._maintenance_thread.start()
+        return True
+
+
+def _undo_adds(saved: list[Collection], batch: list[_Command]) -> None:
+    """
+    Reverts the index changes of a batch in the already saved collections after the
+    rest of it failed (its chunk rows were rolled back): new vectors are tombstoned,
+    the vectors it tombstoned are revived, so the index matches the DB again.
+    """
+    for store in saved:
+        cmds = [cmd for cmd in batch if cmd.collection == store.name]
+        ids = [i for cmd in cmds if cmd.ids for i in cmd.ids]
+        revived = [i for cmd in cmds for i in cmd.tombstoned]
+        if not ids and not revived:
+            continue
+        try:
+            store.remove(ids)
+            store.restore(revived)
+            store.save()
+        except Exception as e:
+            print(f"[INDEX][ERROR] Could not revert {len(ids) + len(revived)} vectors of a failed batch in '{store.name}': {e}")
+
+
+index_writer = IndexWriter()
+
+
+# -------------------------
+# Maintenance (its own thread, or the CLI in its own process)
+# -------------------------
+def db_chunk_lookup(ids: list[int]) -> dict[int, ChunkRecord]:
+    """
+    Chunk records for vector `ids` from the DB; lets merges write sidecars for
+    segments indexed before they existed.
+    """
+    out: dict[int, ChunkRecord] = {}
+    with SessionLocal() as db:
+        for start in range(0, len(ids), 900):  # stay under SQLite's bound-parameter limit
+            rows = (
+                db.query(Chunk, Document.filename)
+                .join(Document, Document.id == Chunk.document_id)
+                .filter(Chunk.faiss_id.in_(ids[start:start + 900]))
+                .all()
+            )
+            for chunk, filename in rows:
+                out[int(chunk.faiss_id)] = ChunkRecord(
+                    chunk_id=chunk.id,
+                    document_id=chunk.document_id,
+                    filename=filename,
+                    chunk_index=chunk.chunk_index,
+                    text=chunk.text,
+                )
+    return out
+
+
+def _shard_paths() -> Iterator[tuple[str, str]]:
+    # (collection name, shard index dir)
+    for name in read_registry():
+        for path in collection_dirs(name):
+            yield name, path
+
+
+def _rewrite_shard(name: str, path: str, work: Callable[[FaissStore], object], what: str) -> object:
+    """
+    Runs `work` (merge/compact/train, returning a falsy value when there was nothing
+    to do) on a private copy of one shard without `writer_lock`, then takes the lock
+    only to rebase the result onto the latest manifest and save it. Writes committed
+    meanwhile are kept; if another writer rewrote the same segments, the result is
+    dropped (the next pass retries). Returns what `work` returned, or None if dropped.
+    """
+    t = time.perf_counter()
+    store = FaissStore(dim=get_embedding_dim(), path=path).load_or_create()
+    done = work(store)
+    if not done:
+        return done
+    with writer_lock:
+        if not store.rebase():
+            print(f"[FAISS] {what} of '{name}' dropped: its segments changed meanwhile")
+            return None
+        store.save()
+    print(f"[FAISS] {what} of '{name}' {done} in {time.perf_counter() - t:.2f}s")
+    return done
+
+
+def _gc_shard(path: str) -> int:
+    # Needs the current manifest: any file it lists must survive
+    with writer_lock:
+        return FaissStore(dim=get_embedding_dim(), path=path).load_or_create(load_segments=False).gc_orphans()
+
+
+def compact_index() -> int:
+    """
+    Rewrites the segments holding tombstoned vectors without them (every collection
+    and shard). Returns reclaimed count.
+    """
+    total = 0
+    for name, path in _shard_paths():
+        total += _rewrite_shard(name, path, lambda store: store.compact(lookup=db_chunk_lookup), "Compaction") or 0
+    return total
+
+
+def merge_segments(all_segments: bool = False) -> int:
+    """
+    Merges small segments (or, with `all_segments`, everything) of each shard into one.
+    Returns how many segments were folded together.
+    """
+    def merge(store: FaissStore) -> int:
+        files = [seg.file for seg in store.segments] if all_segments else store.merge_candidates()
+        if len(files) < 2:
+            return 0
+        store.merge(files, lookup=db_chunk_lookup)
+        return len(files)
+
+    total = 0
+    for name, path in _shard_paths():
+        total += _rewrite_shard(name, path, merge, "Merge") or 0
+    return total
+
+
+def _maintain(store: FaissStore) -> dict | None:
+    done = {"trained": False, "reclaimed": 0, "merged": 0}
+    if store.maybe_train(lookup=db_chunk_lookup):
+        done["trained"] = True
+    else:
+        if store.tombstone_ratio() >= settings.FAISS_COMPACT_RATIO:
+            done["reclaimed"] = store.compact(lookup=db_chunk_lookup)
+        files = store.merge_candidates()
+        if len(files) >= 2:
+            store.merge(files, lookup=db_chunk_lookup)
+            done["merged"] = len(files)
+    return done if (done["trained"] or done["reclaimed"] or done["merged"]) else None
+
+
+def run_maintenance() -> dict:
+    """
+    One maintenance pass over every collection shard: IVF training if due, else tombstone
+    compaction past FAISS_COMPACT_RATIO, then a merge of small segments; finally
+    stray-file cleanup. Segments are rebuilt without `writer_lock` (see _rewrite_shard).
+    """
+    done = {"trained": False, "reclaimed": 0, "merged": 0}
+    for name, path in _shard_paths():
+        shard_done = _rewrite_shard(name, path, _maintain, "Maintenance")
+        _gc_shard(path)
+        if shard_done:
+            done["trained"] = done["trained"] or shard_done["trained"]
+            done["reclaimed"] += shard_done["reclaimed"]
+            done["merged"] += shard_done["merged"]
+    return done
+
+
+def needs_maintenance(store: Collection) -> bool:
+    return any(
+        shard.tombstone_ratio() >= settings.FAISS_COMPACT_RATIO
+        or bool(shard.merge_candidates())
+        or shard.needs_training()
+        for shard in store.stores
+    )
@@ -0,0 +1,197 @@
+import os
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Callable
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.models import Document
+from app.services.extractor import iter_blocks
+from app.services.chunker import iter_chunks
+from app.services.embedder import embed_texts, persist_embedding_dim
+from app.services.chunk_store import ChunkRecord
+from app.services.collections import DEFAULT_COLLECTION
+from app.services.index_writer import index_writer
+from app.services.metrics import counter, record_stage, span, trace
+from app.services.vector_store import new_vector_ids
+
+StageCallback = Callable[[str], None]
+
+INGEST_DOCUMENTS = counter("kb_ingest_documents_total", "Documents ingested (including re-ingested replacements).")
+INGEST_CHUNKS = counter("kb_ingest_chunks_total", "Chunks indexed by ingestion.")
+
+
+def ingest_document(
+    db: Session,
+    doc: Document,
+    file_path: str,
+    on_stage: StageCallback | None = None,
+    replace: bool = False,
+) -> int:
+    """
+    Runs the blocking ingestion pipeline for one already-saved file:
+    extract -> chunk -> embed -> index writer (FAISS add/save + chunk rows).
+
+    Extraction, chunking, embedding and indexing are pipelined: pages/paragraphs
+    stream from the extractor into the chunker, chunks are embedded in groups of
+    INGEST_EMBED_GROUP as they are produced, and each embedded group goes to the
+    index writer while the next one is embedded. At most two groups of text and
+    vectors are held at a time (plus 8 bytes of vector id per chunk), whatever
+    the document size. If ingestion fails midway, the groups already indexed are
+    removed again.
+
+    With `replace`, the previous version stays searchable while the new one streams in
+    (the first group moves its chunk rows aside, chunk indexes being unique per
+    document) and is tombstoned in the same write as the last new group. If ingestion
+    fails midway, the previous version is restored.
+
+    Returns the number of indexed chunks. `on_stage` is called with the stage name
+    before each step so callers (the job runner) can report progress ("extracting"
+    lasts until the first group of chunks is ready; "embedding" covers the rest of
+    the stream, groups being indexed meanwhile; "indexing" is the wait for the last one).
+    """
+    def stage(name: str) -> None:
+        if on_stage is not None:
+            on_stage(name)
+
+    print(f"[UPLOAD] Start doc_id={doc.id} file={doc.filename}")
+    with trace() as tr, span("ingest.total") as total:
+        n = _ingest(db, doc, file_path, stage, replace)
+    INGEST_DOCUMENTS.inc()
+    INGEST_CHUNKS.inc(n)
+    stages = " ".join(f"{name.split('.', 1)[1]}={sec:.2f}s" for name, sec in tr.totals().items() if name != "ingest.total")
+    print(f"[UPLOAD] Done doc_id={doc.id} chunks={n} total={total.seconds:.2f}s {stages}")
+    return n
+
+
+def _ingest(db: Session, doc: Document, file_path: str, stage: StageCallback, replace: bool) -> int:
+    # Extract + chunk (lazily) -> embed per group -> index per group. Extraction and
+    # embedding interleave, so "ingest.extract" is the stream's wall time minus the
+    # embedding calls and waits on the index writer.
+    collection = doc.collection or DEFAULT_COLLECTION
+    stage("extracting")
+    group: list[str] = []
+    added: list[int] = []  # vector ids indexed so far (8 bytes per chunk)
+    pending: tuple[Future, list[int]] | None = None  # the group the writer is applying
+    removed = 0
+    other_s = 0.0
+
+    def wait_pending() -> None:
+        nonlocal pending, removed, other_s
+        if pending is None:
+            return
+        future, ids = pending
+        pending = None
+        with span("ingest.index_wait") as sp:
+            removed += future.result()
+        other_s += sp.seconds
+        added.extend(ids)
+
+    def index_group(last: bool = False) -> None:
+        nonlocal pending, other_s
+        first = len(added) + (len(pending[1]) if pending is not None else 0)  # chunk_index of group[0]
+        if first == 0:
+            stage("embedding")
+        with span("ingest.embed") as sp:
+            vectors = embed_texts(group)  # (n, dim)
+        other_s += sp.seconds
+        if first == 0:
+            persist_embedding_dim(int(vectors.shape[1]))
+
+        # Chunk rows and sidecar records share ids, so either can resolve a search hit
+        ids = new_vector_ids(len(group)).tolist()
+        records = [
+            ChunkRecord(
+                chunk_id=str(uuid.uuid4()),
+                document_id=doc.id,
+                filename=doc.filename,
+                chunk_index=first + i,
+                text=text,
+            )
+            for i, text in enumerate(group)
+        ]
+        group.clear()
+        # At most one group queued at the writer while the next one is embedded
+        wait_pending()
+        future = index_writer.add_document(
+            collection, doc.id, vectors, ids, records, replace=replace, first=first == 0, last=last,
+        )
+        pending = (future, ids)
+
+    t = time.perf_counter()
+    try:
+        for chunk in iter_chunks(iter_blocks(file_path)):
+            # A full group waits for the next chunk, so the last one is known as such
+            if len(group) >= settings.INGEST_EMBED_GROUP:
+                index_group()
+            group.append(chunk)
+        if group:
+            index_group(last=True)
+        record_stage("ingest.extract", time.perf_counter() - t - other_s)
+
+        # The writer batches groups with other pending writes; wait until all are searchable
+        stage("indexing")
+        wait_pending()
+    except Exception:
+        _discard_partial(collection, doc.id, added, pending, replace)
+        raise
+
+    if replace:
+        if not added:
+            removed = delete_document_chunks(doc.id, collection)
+        print(f"[UPLOAD] Replaced doc_id={doc.id}: tombstoned {removed} old vectors")
+    return len(added)
+
+
+def _discard_partial(
+    collection: str,
+    document_id: str,
+    added: list[int],
+    pending: tuple[Future, list[int]] | None,
+    replace: bool = False,
+) -> None:
+    # A failed ingest must not leave half a document searchable; a failed replacement
+    # gets the previous version back
+    if pending is not None:
+        future, ids = pending
+        try:
+            future.result()
+            added = added + ids
+        except Exception:
+            pass  # that group was never applied
+    if not added and not replace:
+        return
+    try:
+        index_writer.delete_document(collection, document_id, remove_ids=added, restore_retired=replace).result()
+    except Exception as e:
+        print(f"[UPLOAD][WARN] Could not remove {len(added)} partially indexed vectors of doc_id={document_id}: {e}")
+
+
+def delete_document_chunks(document_id: str, collection: str = DEFAULT_COLLECTION) -> int:
+    """
+    Removes a document's vectors (tombstones) and chunk rows through the index writer;
+    returns once both are committed. Returns the number of removed chunks.
+    """
+    return index_writer.delete_document(collection, document_id).result()
+
+
+def delete_document(db: Session, doc: Document) -> int:
+    """
+    Deletes the document, its chunks/vectors and its uploaded file.
+    """
+    removed = delete_document_chunks(doc.id, doc.collection)
+
+    prefix = f"{doc.id}_"
+    if os.path.isdir(settings.UPLOAD_DIR):
+        for name in os.listdir(settings.UPLOAD_DIR):
+            if name.startswith(prefix):
+                try:
+                    os.remove(os.path.join(settings.UPLOAD_DIR, name))
+                except OSError as e:
+                    print(f"[WARN] Could not delete upload file={name} error={e}")
+
+    db.delete(doc)
+    db.commit()
+    return removed
@@ -0,0 +1,219 @@
+import json
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator
+
+from app.core.config import settings
+from app.db.models import Document, IngestJob
+from app.db.session import SessionLocal
+from app.services.ingest import ingest_document
+
+# Bounded worker pool shared by all uploads. Each file is its own task, so files from
+# concurrent uploads interleave instead of waiting for a whole earlier upload to finish.
+_executor = ThreadPoolExecutor(
+    max_workers=max(1, settings.INGEST_WORKERS),
+    thread_name_prefix="ingest",
+)
+
+# Serializes read-modify-write of a job's JSON progress (several files update one row)
+_job_lock = threading.Lock()
+_pending_lock = threading.Lock()
+_pending_files = 0
+# Documents with a queued or running ingest task (a document can be queued twice)
+_active_docs: Counter[str] = Counter()
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+def _reserve(n: int) -> None:
+    global _pending_files
+    with _pending_lock:
+        if _pending_files + n > settings.INGEST_MAX_PENDING:
+            raise QueueFullError(
+                f"Ingestion queue is full ({_pending_files} files pending). Retry shortly."
+            )
+        _pending_files += n
+
+
+def _release(n: int = 1) -> None:
+    global _pending_files
+    with _pending_lock:
+        _pending_files = max(0, _pending_files - n)
+
+
+@contextmanager
+def reserved_slots(n: int) -> Iterator[None]:
+    """
+    Holds `n` queue slots while an upload saves its files, so a full queue is reported
+    (QueueFullError) before any Document row or file is written. create_job(...,
+    reserved=True) inside the block takes the slots over; they are released if it raises.
+    """
+    _reserve(n)
+    try:
+        yield
+    except BaseException:
+        _release(n)
+        raise
+
+
+def is_ingesting(document_id: str) -> bool:
+    with _pending_lock:
+        return _active_docs[document_id] > 0
+
+
+def _finish_doc(document_id: str) -> None:
+    with _pending_lock:
+        _active_docs[document_id] -= 1
+        if _active_docs[document_id] <= 0:
+            del _active_docs[document_id]
+
+
+def create_job(files: list[dict], reserved: bool = False) -> str:
+    """
+    Persists a queued job and hands each file to the worker pool.
+
+    `files` items: {"document_id", "filename", "path"} for files already saved to disk,
+    plus optional "replace": True to swap out an existing document's chunks.
+    With `reserved`, the queue slots were already taken (see reserved_slots).
+    """
+    if not reserved:
+        _reserve(len(files))
+
+    db = SessionLocal()
+    try:
+        job = IngestJob(
+            status="queued",
+            total_files=len(files),
+            processed_files=0,
+            files_json=json.dumps([
+                {
+                    "document_id": f["document_id"],
+                    "filename": f["filename"],
+                    "stage": "queued",
+                    "chunks": 0,
+                    "timings": {},
+                    "error": None,
+                }
+                for f in files
+            ]),
+        )
+        db.add(job)
+        db.commit()
+        job_id = job.id
+    except Exception:
+        if not reserved:
+            _release(len(files))
+        raise
+    finally:
+        db.close()
+
+    with _pending_lock:
+        _active_docs.update(f["document_id"] for f in files)
+    for i, f in enumerate(files):
+        _executor.submit(_run_file, job_id, i, f["document_id"], f["path"], f.get("replace", False))
+
+    return job_id
+
+
+def _update_file(job_id: str, file_idx: int, **fields) -> None:
+    """
+    Applies `fields` to one file entry of the job and rolls the job status forward.
+    """
+    with _job_lock:
+        db = SessionLocal()
+        try:
+            job = db.get(IngestJob, job_id)
+            if job is None:
+                return
+            entries = json.loads(job.files_json or "[]")
+            entries[file_idx].update(fields)
+
+            finished = [e for e in entries if e["stage"] in ("done", "failed")]
+            job.processed_files = len(finished)
+            if len(finished) == len(entries):
+                failed = [e for e in entries if e["stage"] == "failed"]
+                job.status = "failed" if failed else "completed"
+                if failed:
+                    job.error = "; ".join(f"{e['filename']}: {e['error']}" for e in failed)
+            else:
+                job.status = "running"
+
+            job.files_json = json.dumps(entries)
+            job.updated_at = datetime.utcnow()
+            db.commit()
+        finally:
+            db.close()
+
+
+def _run_file(job_id: str, file_idx: int, document_id: str, path: str, replace: bool = False) -> None:
+    timings: dict[str, float] = {}
+    current = {"stage": None, "t": time.perf_counter()}
+
+    def close_stage() -> None:
+        if current["stage"] is not None:
+            timings[current["stage"]] = round(time.perf_counter() - current["t"], 3)
+
+    def on_stage(name: str) -> None:
+        # Close the previous stage's timer, then publish the new stage
+        close_stage()
+        current["stage"], current["t"] = name, time.perf_counter()
+        _update_file(job_id, file_idx, stage=name, timings=dict(timings))
+
+    db = SessionLocal()
+    try:
+        try:
+            doc = db.get(Document, document_id)
+            if doc is None:
+                raise RuntimeError(f"Document {document_id} no longer exists.")
+
+            n_chunks = ingest_document(db, doc, path, on_stage=on_stage, replace=replace)
+        finally:
+            # Before the job turns terminal: a client that saw it finish may delete the document
+            _finish_doc(document_id)
+        close_stage()
+        _update_file(job_id, file_idx, stage="done", chunks=n_chunks, timings=timings)
+    except Exception as e:
+        db.rollback()
+        close_stage()
+        print(f"[UPLOAD][ERROR] job={job_id} doc_id={document_id} error={e}")
+        _update_file(job_id, file_idx, stage="failed", error=str(e), timings=timings)
+    finally:
+        db.close()
+        _release()
+
+
+def job_to_dict(job: IngestJob) -> dict:
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "total_files": job.total_files,
+        "processed_files": job.processed_files,
+        "files": json.loads(job.files_json or "[]"),
+        "error": job.error,
+        "created_at": job.created_at.isoformat(),
+        "updated_at": job.updated_at.isoformat(),
+    }
+
+
+def fail_interrupted_jobs() -> int:
+    """
+    Jobs still queued/running at startup were cut off by a restart; mark them failed
+    so clients polling /v1/jobs/{id} get a terminal answer.
+    """
+    db = SessionLocal()
+    try:
+        stale = db.query(IngestJob).filter(IngestJob.status.in_(["queued", "running"])).all()
+        for job in stale:
+            job.status = "failed"
+            job.error = "Interrupted by server restart."
+            job.updated_at = datetime.utcnow()
+        db.commit()
+        return len(stale)
+    finally:
+        db.close()
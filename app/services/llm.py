@@ -1,15 +1,50 @@
 import json
+from functools import lru_cache
+from typing import Iterator
+
 from app.core.config import settings
+from app.services.metrics import LLM_CALLS, LLM_TOKENS
 from app.services.prompts import ANSWER_SYSTEM
 
+# Optional per-request accumulator: {"calls", "prompt_tokens", "completion_tokens"}
+Usage = dict[str, int]
+
+
+def new_usage() -> Usage:
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+
+def _add_usage(usage: Usage | None, resp_usage) -> None:
+    prompt = int(getattr(resp_usage, "prompt_tokens", 0) or 0) if resp_usage is not None else 0
+    completion = int(getattr(resp_usage, "completion_tokens", 0) or 0) if resp_usage is not None else 0
+    LLM_CALLS.inc()
+    LLM_TOKENS.inc(prompt, kind="prompt")
+    LLM_TOKENS.inc(completion, kind="completion")
+    if usage is None:
+        return
+    usage["calls"] += 1
+    usage["prompt_tokens"] += prompt
+    usage["completion_tokens"] += completion
+
+@lru_cache(maxsize=4)
+def _openai_client(api_key: str, base_url: str | None):
+    from openai import OpenAI
+    return OpenAI(api_key=api_key, base_url=base_url)
+
 def _client():
+    # Shared per key/base URL (see embedder._client)
     if not settings.OPENAI_API_KEY:
         raise RuntimeError("OPENAI_API_KEY is not set.")
-    from openai import OpenAI
-    return OpenAI(api_key=settings.OPENAI_API_KEY)
+    return _openai_client(settings.OPENAI_API_KEY, settings.OPENAI_BASE_URL)
 
-def chat_text(user_prompt: str, system_prompt: str = ANSWER_SYSTEM) -> str:
+def chat_text(
+    user_prompt: str,
+    system_prompt: str = ANSWER_SYSTEM,
+    usage: Usage | None = None,
+    json_mode: bool = False,
+) -> str:
     client = _client()
+    extra = {"response_format": {"type": "json_object"}} if json_mode else {}
     resp = client.chat.completions.create(
         model=settings.CHAT_MODEL,
         messages=[
@@ -17,15 +52,46 @@ def chat_text(user_prompt: str, system_prompt: str = ANSWER_SYSTEM) -> str:
             {"role": "user", "content": user_prompt},
         ],
         temperature=0.2,
+        **extra,
     )
+    _add_usage(usage, resp.usage)
     return (resp.choices[0].message.content or "").strip()
 
-def chat_json(user_prompt: str) -> dict:
+def chat_text_stream(
+    user_prompt: str,
+    system_prompt: str = ANSWER_SYSTEM,
+    usage: Usage | None = None,
+) -> Iterator[str]:
     """
-    Best-effort strict JSON output.
+    Same request as chat_text, but yields content deltas as the model produces them.
+    """
+    client = _client()
+    stream = client.chat.completions.create(
+        model=settings.CHAT_MODEL,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+        temperature=0.2,
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    final_usage = None
+    for event in stream:
+        if getattr(event, "usage", None) is not None:
+            final_usage = event.usage
+        if not event.choices:
+            continue
+        delta = event.choices[0].delta.content
+        if delta:
+            yield delta
+    _add_usage(usage, final_usage)
+
+def parse_json_object(text: str) -> dict:
+    """
+    Best-effort strict JSON parsing.
     If model wraps JSON with extra text, we extract the first {...} block.
     """
-    text = chat_text(user_prompt)
     try:
         return json.loads(text)
     except Exception:
@@ -34,3 +100,9 @@ def chat_json(user_prompt: str) -> dict:
         if start != -1 and end != -1 and end > start:
             return json.loads(text[start:end+1])
         raise
+
+def chat_json(user_prompt: str, usage: Usage | None = None) -> dict:
+    """
+    Best-effort strict JSON output (see parse_json_object).
+    """
+    return parse_json_object(chat_text(user_prompt, usage=usage))
@@ -0,0 +1,205 @@
+import threading
+
+import numpy as np
+
+# Explicit EMBED_MODEL value that selects this engine (no API calls at all)
+LOCAL_EMBED_MODEL = "local-hash-v1"
+
+CHAR_NGRAMS = (3, 4, 5)
+# Relative weight of each feature group after per-group normalization
+GROUP_WEIGHTS = {"word": 1.0, "bigram": 0.6, "char": 0.8}
+# Texts per vectorized block: small enough that the per-feature scratch arrays stay
+# in CPU cache (much faster than one big block), large enough to amortize numpy calls
+BLOCK_SIZE = 32
+
+_M1 = np.uint64(0xFF51AFD7ED558CCD)
+_M2 = np.uint64(0xC4CEB9FE1A85EC53)
+# Multiplicative hashing: the high bits of h * _FIB depend on every bit of h
+_FIB = np.uint64(0x9E3779B97F4A7C15)
+_POLY = np.uint64(1000003)
+# Odd multiplier => invertible mod 2**64, which makes prefix hashes of arbitrary spans cheap
+_POLY_INV = np.uint64(pow(1000003, -1, 2 ** 64))
+_GROUP_SALT = {"word": np.uint64(0x9E3779B97F4A7C15), "bigram": np.uint64(0x632BE59BD9B4E019)}
+
+# ASCII word characters after lowercasing; every non-ASCII codepoint counts as a word char
+_ASCII_WORD = np.zeros(128, dtype=bool)
+for _c in "abcdefghijklmnopqrstuvwxyz0123456789_":
+    _ASCII_WORD[ord(_c)] = True
+
+
+def _mix(h: np.ndarray) -> np.ndarray:
+    """
+    64-bit finalizer (murmur3 fmix64), used where two hashes are combined (bigrams).
+    """
+    h = h ^ (h >> np.uint64(33))
+    h *= _M1
+    h ^= h >> np.uint64(33)
+    h *= _M2
+    h ^= h >> np.uint64(33)
+    return h
+
+
+def _normalize(text: str) -> str:
+    return " ".join((text or "").lower().split())
+
+
+class _Powers:
+    """
+    Grow-only tables of P^i and P^-i (mod 2**64) shared by all blocks, so prefix
+    hashing does not recompute them per call.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pos = np.ones(1, dtype=np.uint64)
+        self.neg = np.ones(1, dtype=np.uint64)
+
+    def get(self, n: int) -> tuple[np.ndarray, np.ndarray]:
+        pos, neg = self.pos, self.neg
+        if pos.size < n:
+            with self._lock:
+                size = max(n, 2 * self.pos.size)
+                pos = np.full(size, _POLY, dtype=np.uint64)
+                pos[0] = 1
+                neg = np.full(size, _POLY_INV, dtype=np.uint64)
+                neg[0] = 1
+                pos, neg = np.cumprod(pos, dtype=np.uint64), np.cumprod(neg, dtype=np.uint64)
+                self.pos, self.neg = pos, neg
+        return pos[:n], neg[:n]
+
+
+_powers = _Powers()
+
+
+def _block_features(texts: list[str]) -> dict[str, tuple[np.ndarray, np.ndarray, np.ndarray | None]]:
+    """
+    Returns {group: (rows, hashes, crossing)} for word unigrams, word bigrams and char
+    3/4/5-grams; `crossing` (None = none) lists the n-grams that span two texts.
+
+    The block is processed as one codepoint array (texts joined with a newline, which
+    is never a word char), so tokenization and hashing are plain array ops:
+    - words: polynomial prefix hashes give the hash of any span [s, e) in O(1)
+    - char n-grams: rolling hashes over shifted slices (no gathers), each kept in the
+      row of its first char
+    """
+    empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint64), None)
+    joined = "\n".join(texts) + "\n"
+    codes = np.frombuffer(joined.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    L = codes.size
+
+    lengths = np.fromiter((len(t) + 1 for t in texts), dtype=np.int64, count=len(texts))
+    owner = np.repeat(np.arange(len(texts), dtype=np.int64), lengths)
+    seps = np.cumsum(lengths) - 1
+
+    feats: dict[str, tuple[np.ndarray, np.ndarray, np.ndarray | None]] = {}
+
+    # Words: maximal runs of word chars
+    is_word = np.ones(L, dtype=bool)
+    ascii_pos = codes < 128
+    is_word[ascii_pos] = _ASCII_WORD[codes[ascii_pos].astype(np.int64)]
+    edges = np.diff(np.concatenate(([False], is_word, [False])).astype(np.int8))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    if starts.size:
+        # prefix[i] = sum_{j<i} c[j] * P^-j  =>  hash(s, e) = P^(e-1) * (prefix[e] - prefix[s])
+        pw, inv = _powers.get(L + 1)
+        prefix = np.zeros(L + 1, dtype=np.uint64)
+        np.cumsum(codes * inv[:L], dtype=np.uint64, out=prefix[1:])
+        word_h = pw[ends - 1] * (prefix[ends] - prefix[starts])
+        word_rows = owner[starts]
+        feats["word"] = (word_rows, word_h ^ _GROUP_SALT["word"], None)
+
+        same = word_rows[:-1] == word_rows[1:]
+        bigram_h = _mix(word_h[:-1][same]) * _POLY + word_h[1:][same]
+        feats["bigram"] = (word_rows[:-1][same], bigram_h ^ _GROUP_SALT["bigram"], None)
+    else:
+        feats["word"] = feats["bigram"] = empty
+
+    # Character n-grams (across word boundaries, within one text): h_k = h_(k-1) * P + c
+    h = codes
+    for k in range(2, max(CHAR_NGRAMS) + 1):
+        m = L - k + 1
+        if m <= 0:
+            break
+        h = h[:-1] * _POLY
+        h += codes[k - 1:]
+        if k in CHAR_NGRAMS:
+            # The n-gram at i reaches into the next text if a separator lies in [i, i + k - 1)
+            crossing = (seps[:, None] - np.arange(k - 1)).ravel()
+            feats[f"char{k}"] = (owner[:m], h ^ np.uint64(k), crossing[(crossing >= 0) & (crossing < m)])
+
+    return feats
+
+
+class LocalHashEmbedder:
+    """
+    Offline embedding engine: feature hashing of word unigrams/bigrams and
+    character 3-5 grams with sublinear TF weighting.
+
+    - Stateless: a text always maps to the same vector, whatever was ingested before,
+      so stored vectors and query vectors stay comparable (no corpus statistics).
+    - All hashing/folding is array math over the whole block of texts.
+    - Output is L2-normalized float32 of a fixed `dim`, so it is FAISS/IP ready.
+    """
+    def __init__(self, dim: int):
+        self.dim = int(dim)
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        """
+        Returns (n, dim) float32 unit vectors.
+        """
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for start in range(0, len(texts), BLOCK_SIZE):
+            block = [_normalize(t) for t in texts[start:start + BLOCK_SIZE]]
+            out[start:start + len(block)] = self._embed_block(block)
+        return out
+
+    def _counts(self, n: int, rows: np.ndarray, fh: np.ndarray, crossing: np.ndarray | None) -> np.ndarray:
+        # Signed counts per (row, bucket) of one feature kind: sign from the top bit of
+        # fh * _FIB, bucket from the 32 bits below it (multiply-shift, no modulo)
+        fh = fh * _FIB
+        sign = np.where(fh.view(np.int64) < 0, -1.0, 1.0)
+        if crossing is not None:
+            sign[crossing] = 0.0
+        fh <<= np.uint64(1)
+        fh >>= np.uint64(32)
+        fh *= np.uint64(self.dim)
+        fh >>= np.uint64(32)
+        idx = fh.view(np.int64)
+        idx += rows * self.dim
+        return np.bincount(idx, weights=sign, minlength=n * self.dim)
+
+    def _embed_block(self, texts: list[str]) -> np.ndarray:
+        n = len(texts)
+        feats = _block_features(texts)
+
+        counts: dict[str, np.ndarray] = {}
+        for name, (rows, fh, crossing) in feats.items():
+            if rows.size == 0:
+                continue
+            group = "char" if name.startswith("char") else name
+            c = self._counts(n, rows, fh, crossing)
+            counts[group] = counts[group] + c if group in counts else c
+
+        out = np.zeros((n, self.dim), dtype=np.float32)
+        for group, c in counts.items():
+            # Sublinear TF, normalized per group
+            mat = c.reshape(n, self.dim).astype(np.float32)
+            mat = np.sign(mat) * np.log1p(np.abs(mat))
+            norms = np.linalg.norm(mat, axis=1, keepdims=True)
+            out += GROUP_WEIGHTS[group] * mat / np.maximum(norms, 1e-12)
+
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.maximum(norms, 1e-12)
+
+
+_engines: dict[int, LocalHashEmbedder] = {}
+_engines_lock = threading.Lock()
+
+
+def get_local_embedder(dim: int) -> LocalHashEmbedder:
+    with _engines_lock:
+        engine = _engines.get(int(dim))
+        if engine is None:
+            engine = _engines[int(dim)] = LocalHashEmbedder(dim=dim)
+        return engine
@@ -0,0 +1,215 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator
+
+# Latency buckets (seconds): sub-ms FAISS/sidecar lookups up to multi-second LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _labels(labels: dict[str, str]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(labels: Labels, extra: tuple[tuple[str, str], ...] = ()) -> str:
+    items = labels + extra
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def _fmt_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values: dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_fmt_labels(labels)} {_fmt_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (per-bucket counts, sum, count)
+        self._values: dict[Labels, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _labels(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total, n) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, c in zip(self.buckets, counts):
+                    cumulative += c
+                    lines.append(f"{self.name}_bucket{_fmt_labels(labels, (('le', _fmt_value(bound)),))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_fmt_labels(labels, (('le', '+Inf'),))} {n}")
+                lines.append(f"{self.name}_sum{_fmt_labels(labels)} {_fmt_value(total)}")
+                lines.append(f"{self.name}_count{_fmt_labels(labels)} {n}")
+        return lines
+
+
+# Collectors render values owned elsewhere (e.g. cache hit counters) at scrape time:
+# () -> [(name, type, help, [(labels dict, value), ...]), ...]
+Collector = Callable[[], list[tuple[str, str, str, list[tuple[dict, float]]]]]
+
+_metrics: list[Counter | Histogram] = []
+_collectors: list[Collector] = []
+
+
+def counter(name: str, help_text: str) -> Counter:
+    metric = Counter(name, help_text)
+    _metrics.append(metric)
+    return metric
+
+
+def histogram(name: str, help_text: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    metric = Histogram(name, help_text, buckets)
+    _metrics.append(metric)
+    return metric
+
+
+def register_collector(fn: Collector) -> None:
+    _collectors.append(fn)
+
+
+def render() -> str:
+    """
+    All metrics in the Prometheus text exposition format (version 0.0.4).
+    """
+    lines: list[str] = []
+    for metric in _metrics:
+        lines += metric.render()
+    for fn in _collectors:
+        for name, kind, help_text, samples in fn():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            lines += [f"{name}{_fmt_labels(_labels(labels))} {_fmt_value(value)}" for labels, value in samples]
+    return "\n".join(lines) + "\n"
+
+
+# -------------------------
+# Stage timing (spans)
+# -------------------------
+STAGE_SECONDS = histogram("kb_stage_seconds", "Duration of pipeline stages (ingestion and query).")
+LLM_TOKENS = counter("kb_llm_tokens_total", "LLM tokens used, by kind (prompt/completion).")
+LLM_CALLS = counter("kb_llm_calls_total", "LLM chat completion calls.")
+
+
+class Trace:
+    """
+    Per-request span list, for the optional timing breakdown in API responses.
+    """
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.spans: list[tuple[str, float, float]] = []  # (stage, start offset s, duration s)
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, start: float, seconds: float) -> None:
+        with self._lock:
+            self.spans.append((stage, start - self.t0, seconds))
+
+    def totals(self) -> dict[str, float]:
+        """
+        {stage: summed seconds}, e.g. for one log line per request.
+        """
+        out: dict[str, float] = {}
+        with self._lock:
+            for stage, _, seconds in self.spans:
+                out[stage] = out.get(stage, 0.0) + seconds
+        return out
+
+    def breakdown(self) -> list[dict]:
+        with self._lock:
+            return [
+                {"stage": stage, "start_ms": round(start * 1000, 2), "ms": round(seconds * 1000, 2)}
+                for stage, start, seconds in sorted(self.spans, key=lambda s: s[1])
+            ]
+
+
+_current_trace: ContextVar[Trace | None] = ContextVar("kb_trace", default=None)
+
+
+@contextmanager
+def trace() -> Iterator[Trace]:
+    """
+    Collects the spans of everything run inside the block on this thread/context.
+    """
+    tr = Trace()
+    token = _current_trace.set(tr)
+    try:
+        yield tr
+    finally:
+        _current_trace.reset(token)
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """
+    Like span() for a duration measured elsewhere (e.g. a total minus nested stages).
+    """
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    tr = _current_trace.get()
+    if tr is not None:
+        tr.add(stage, time.perf_counter() - seconds, seconds)
+
+
+class _Span:
+    __slots__ = ("seconds",)
+
+    def __init__(self):
+        self.seconds = 0.0
+
+
+@contextmanager
+def span(stage: str) -> Iterator[_Span]:
+    """
+    Times a block: observed into kb_stage_seconds{stage} and, inside trace(), added to
+    the request's breakdown. The yielded object's `seconds` is set on exit (for logs).
+    """
+    s = _Span()
+    start = time.perf_counter()
+    try:
+        yield s
+    finally:
+        s.seconds = time.perf_counter() - start
+        STAGE_SECONDS.observe(s.seconds, stage=stage)
+        tr = _current_trace.get()
+        if tr is not None:
+            tr.add(stage, start, s.seconds)
@@ -0,0 +1,66 @@
+import threading
+from collections import deque
+
+import numpy as np
+
+# Latency percentiles are computed over the most recent answers per mode
+_LATENCY_WINDOW = 1000
+
+
+class PipelineStats:
+    """
+    Per answer-pipeline-mode counters ("multi", "fast", "stream"): requests, LLM calls,
+    prompt/completion tokens, fallbacks and latency, so the modes can be compared.
+    Thread-safe.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._modes: dict[str, dict] = {}
+
+    def _mode(self, mode: str) -> dict:
+        # caller holds self._lock
+        entry = self._modes.get(mode)
+        if entry is None:
+            entry = self._modes[mode] = {
+                "requests": 0,
+                "llm_calls": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "fallbacks": 0,
+                "latencies_ms": deque(maxlen=_LATENCY_WINDOW),
+            }
+        return entry
+
+    def record(self, mode: str, usage: dict, latency_s: float, fallback: bool = False) -> None:
+        with self._lock:
+            entry = self._mode(mode)
+            entry["requests"] += 1
+            entry["llm_calls"] += usage.get("calls", 0)
+            entry["prompt_tokens"] += usage.get("prompt_tokens", 0)
+            entry["completion_tokens"] += usage.get("completion_tokens", 0)
+            entry["fallbacks"] += int(fallback)
+            entry["latencies_ms"].append(latency_s * 1000.0)
+
+    def stats(self) -> dict:
+        out = {}
+        with self._lock:
+            for mode, entry in self._modes.items():
+                n = entry["requests"]
+                lat = np.asarray(entry["latencies_ms"], dtype=np.float64)
+                out[mode] = {
+                    "requests": n,
+                    "fallbacks": entry["fallbacks"],
+                    "llm_calls": entry["llm_calls"],
+                    "prompt_tokens": entry["prompt_tokens"],
+                    "completion_tokens": entry["completion_tokens"],
+                    "avg_llm_calls": round(entry["llm_calls"] / n, 3) if n else 0.0,
+                    "avg_prompt_tokens": round(entry["prompt_tokens"] / n, 1) if n else 0.0,
+                    "avg_completion_tokens": round(entry["completion_tokens"] / n, 1) if n else 0.0,
+                    "latency_mean_ms": round(float(lat.mean()), 1) if lat.size else 0.0,
+                    "latency_p50_ms": round(float(np.percentile(lat, 50)), 1) if lat.size else 0.0,
+                    "latency_p95_ms": round(float(np.percentile(lat, 95)), 1) if lat.size else 0.0,
+                }
+        return out
+
+
+pipeline_stats = PipelineStats()
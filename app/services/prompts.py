@@ -49,3 +49,26 @@ Return STRICT JSON with key:
   - type: "document" | "data" | "action" | "external_source"
   - suggestion: string
 """
+
+def build_structured_answer_prompt(question: str, contexts: list[str]) -> str:
+    joined = "\n\n---\n\n".join([f"Context #{i+1}:\n{c}" for i, c in enumerate(contexts)])
+    return f"""Question:
+{question}
+
+Context:
+{joined}
+
+Rules:
+- Use only the context above.
+- When you make a claim, add a citation like [Context #2].
+- Keep the answer concise but complete.
+- Then judge how fully the context supports your answer and what is missing.
+
+Return STRICT JSON with keys:
+- answer: string
+- confidence: number between 0 and 1 (how fully the context supports the answer)
+- missing_info: array of strings describing what is required to answer fully (empty if nothing)
+- enrichment_suggestions: array of objects (empty if nothing is missing) with:
+  - type: "document" | "data" | "action" | "external_source"
+  - suggestion: string
+"""
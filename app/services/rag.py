@@ -1,78 +1,284 @@
+import copy
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator
+
+import numpy as np
+
+from pydantic import BaseModel, Field, ValidationError
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
 from app.db.models import Chunk, Document
-from app.services.embedder import embed_query
-from app.services.vector_store import FaissStore
-from app.services.llm import chat_text, chat_json
+from app.services.answer_cache import Scope, answer_cache
+from app.services.chunk_store import ChunkRecord
+from app.services.collections import Collection
+from app.services.context_assembly import ContextBlock, assemble_context
+from app.services.embedder import embed_query, embed_texts
+from app.services.metrics import counter, span
+from app.services.llm import Usage, chat_text, chat_text_stream, chat_json, new_usage, parse_json_object
+from app.services.pipeline_stats import pipeline_stats
 from app.services.prompts import (
     build_answer_prompt,
     build_completeness_prompt,
     build_enrichment_prompt,
+    build_structured_answer_prompt,
 )
 
-def _retrieve_chunks(db: Session, store: FaissStore, question: str, top_k: int):
-    qvec = embed_query(question)
-    faiss_ids, scores = store.search(qvec, top_k=top_k)
-
-    # Filter invalid IDs (FAISS returns -1 if not enough results)
-    valid = [(fid, scores[i]) for i, fid in enumerate(faiss_ids) if fid is not None and fid >= 0]
-    if not valid:
-        return [], []
-
-    fids = [v[0] for v in valid]
-    score_map = {v[0]: float(v[1]) for v in valid}
-
-    chunks = db.query(Chunk).filter(Chunk.faiss_id.in_(fids)).all()
-    chunk_by_fid = {c.faiss_id: c for c in chunks}
-
-    ordered_chunks = [chunk_by_fid[fid] for fid in fids if fid in chunk_by_fid]
-    ordered_scores = [score_map.get(c.faiss_id, 0.0) for c in ordered_chunks]
-    return ordered_chunks, ordered_scores
-
-def answer_question(db: Session, store: FaissStore, question: str, top_k: int):
-    chunks, scores = _retrieve_chunks(db, store, question, top_k)
-    contexts = [c.text for c in chunks]
-
-    if not contexts:
-        return {
-            "answer": "I don’t have enough indexed context to answer that yet. Please upload relevant documents.",
-            "confidence": 0.0,
-            "citations": [],
-            "missing_info": ["Relevant documents or sections that contain the answer."],
-            "enrichment_suggestions": [
-                {"type": "document", "suggestion": "Upload documents that cover this topic (policies, SOPs, specs, FAQs)."}
-            ],
-        }
-
-    # Build filename map for better citations
-    doc_ids = list({c.document_id for c in chunks})
-    docs = db.query(Document).filter(Document.id.in_(doc_ids)).all()
-    doc_map = {d.id: d.filename for d in docs}
+PIPELINE_MODES = ("multi", "fast")
 
-    # 1) Grounded answer
-    answer_prompt = build_answer_prompt(question, contexts)
-    answer = chat_text(answer_prompt)
+QUERIES = counter("kb_queries_total", "Answered questions by pipeline mode and outcome (cached/answered/no_context).")
 
-    # 2) Citations (chunk refs + doc filename)
-    citations = []
-    for i, c in enumerate(chunks):
-        fname = doc_map.get(c.document_id, "unknown")
-        quote = c.text[:260].replace("\n", " ").strip()
-        if len(c.text) > 260:
-            quote += "..."
-        citations.append({
-            "document_id": c.document_id,
-            "filename": fname,
-            "chunk_id": c.id,
+
+class EnrichmentSuggestion(BaseModel):
+    type: str
+    suggestion: str
+
+
+class StructuredAnswer(BaseModel):
+    """
+    Schema of the single-call ("fast") completion.
+    """
+    answer: str = Field(min_length=1)
+    confidence: float = Field(ge=0.0, le=1.0)
+    missing_info: list[str] = []
+    enrichment_suggestions: list[EnrichmentSuggestion] = []
+
+def _db_chunks(db: Session, fids: list[int]) -> dict[int, ChunkRecord]:
+    # Fallback for vectors whose segment has no chunk sidecar (indexed before sidecars)
+    rows = (
+        db.query(Chunk, Document.filename)
+        .outerjoin(Document, Document.id == Chunk.document_id)
+        .filter(Chunk.faiss_id.in_(fids))
+        .all()
+    )
+    return {
+        int(c.faiss_id): ChunkRecord(c.id, c.document_id, filename or "unknown", c.chunk_index, c.text)
+        for c, filename in rows
+    }
+
+
+def _resolve_chunks(db: Session, store: Collection, fids: list[int]) -> dict[int, ChunkRecord]:
+    # Text + citation fields come from the memory-mapped sidecars; SQL only for the rest
+    with span("query.chunk_lookup"):
+        chunk_by_fid = store.lookup_chunks(fids)
+    missing = [fid for fid in fids if fid not in chunk_by_fid]
+    if missing:
+        with span("query.chunk_sql"):
+            chunk_by_fid.update(_db_chunks(db, missing))
+    return chunk_by_fid
+
+
+Hits = tuple[list[int], list[ChunkRecord], list[float]]  # (vector ids, chunks, scores), best first
+
+
+def _ordered_hits(
+    chunk_by_fid: dict[int, ChunkRecord],
+    faiss_ids: list[int],
+    scores: list[float],
+) -> Hits:
+    # Filter invalid IDs (FAISS returns -1 if not enough results), keep rank order
+    fids = [fid for fid in faiss_ids if fid >= 0 and fid in chunk_by_fid]
+    by_fid = dict(zip(faiss_ids, scores))
+    return fids, [chunk_by_fid[fid] for fid in fids], [float(by_fid[fid]) for fid in fids]
+
+
+def _retrieve_chunks(
+    db: Session,
+    store: Collection,
+    question: str,
+    top_k: int,
+    qvec: np.ndarray | None = None,
+    allowed_ids: np.ndarray | None = None,
+) -> Hits:
+    if qvec is None:
+        with span("query.embed"):
+            qvec = embed_query(question)
+    with span("query.search"):
+        faiss_ids, scores = store.search(qvec, top_k=top_k, allowed_ids=allowed_ids)
+
+    fids = [fid for fid in faiss_ids if fid >= 0]
+    if not fids:
+        return [], [], []
+    return _ordered_hits(_resolve_chunks(db, store, fids), faiss_ids, scores)
+
+
+def filter_vector_ids(
+    db: Session,
+    store: Collection,
+    document_ids: list[str] | None = None,
+    source_types: list[str] | None = None,
+    created_from: datetime | None = None,
+    created_to: datetime | None = None,
+) -> np.ndarray | None:
+    """
+    Vector ids of the documents matching every given filter (None: no filter given).
+    Documents are matched in SQL (small table); their vector ids come from the chunk
+    sidecars, and from the chunks table only for segments without one.
+    """
+    if not (document_ids or source_types or created_from or created_to):
+        return None
+
+    q = db.query(Document.id).filter(Document.collection == store.name)
+    if document_ids:
+        q = q.filter(Document.id.in_(document_ids))
+    if source_types:
+        q = q.filter(Document.source_type.in_(source_types))
+    if created_from:
+        q = q.filter(Document.created_at >= created_from)
+    if created_to:
+        q = q.filter(Document.created_at <= created_to)
+    doc_ids = {doc_id for (doc_id,) in q.all()}
+    if not doc_ids:
+        return np.zeros(0, dtype=np.int64)
+
+    ids, complete = store.ids_for_documents(doc_ids)
+    if not complete:
+        rows = db.query(Chunk.faiss_id).filter(Chunk.document_id.in_(doc_ids)).all()
+        ids = np.union1d(ids, np.fromiter((fid for (fid,) in rows), dtype=np.int64, count=len(rows)))
+    return ids
+
+
+def search_chunks(
+    db: Session,
+    store: Collection,
+    query: str,
+    top_k: int,
+    allowed_ids: np.ndarray | None = None,
+) -> list[dict]:
+    """
+    Retrieval only (no LLM): ranked chunks with their scores and document info.
+    `allowed_ids` (see filter_vector_ids) restricts the FAISS search itself.
+    """
+    _, chunks, scores = _retrieve_chunks(db, store, query, top_k, allowed_ids=allowed_ids)
+    doc_ids = list({c.document_id for c in chunks})
+    docs = {d.id: d for d in db.query(Document).filter(Document.id.in_(doc_ids)).all()} if doc_ids else {}
+
+    results = []
+    for rank, (c, score) in enumerate(zip(chunks, scores), start=1):
+        doc = docs.get(c.document_id)
+        results.append({
+            "rank": rank,
+            "score": round(score, 4),
+            "chunk_id": c.chunk_id,
             "chunk_index": c.chunk_index,
-            "context_ref": f"Context #{i+1}",
-            "similarity": round(float(scores[i]) if i < len(scores) else 0.0, 4),
-            "quote": quote
+            "text": c.text,
+            "document": {
+                "id": c.document_id,
+                "filename": c.filename,
+                "source_type": doc.source_type if doc else None,
+                "created_at": doc.created_at.isoformat() if doc and doc.created_at else None,
+            },
         })
+    return results
 
+
+def _no_context_result() -> dict:
+    return {
+        "answer": "I don’t have enough indexed context to answer that yet. Please upload relevant documents.",
+        "confidence": 0.0,
+        "citations": [],
+        "missing_info": ["Relevant documents or sections that contain the answer."],
+        "enrichment_suggestions": [
+            {"type": "document", "suggestion": "Upload documents that cover this topic (policies, SOPs, specs, FAQs)."}
+        ],
+    }
+
+
+def _build_citations(blocks: list[ContextBlock]) -> list[dict]:
+    # One citation per chunk; chunks merged into one context share its context_ref
+    citations = []
+    for i, block in enumerate(blocks):
+        for c, score in zip(block.chunks, block.scores):
+            quote = c.text[:260].replace("\n", " ").strip()
+            if len(c.text) > 260:
+                quote += "..."
+            citations.append({
+                "document_id": c.document_id,
+                "filename": c.filename,
+                "chunk_id": c.chunk_id,
+                "chunk_index": c.chunk_index,
+                "context_ref": f"Context #{i+1}",
+                "similarity": round(float(score), 4),
+                "quote": quote
+            })
+    return citations
+
+
+def _context(store: Collection, hits: Hits, assemble: bool = True) -> dict | None:
+    """
+    Prompt contexts for ranked hits. With `assemble` (and CONTEXT_ASSEMBLY_ENABLED) they go
+    through assemble_context: MMR over the hits' stored vectors, adjacent-chunk merging and
+    the CONTEXT_TOKEN_BUDGET; its report is kept as "assembly". Otherwise one context per hit.
+    """
+    fids, chunks, scores = hits
+    if not chunks:
+        return None
+    report = None
+    if assemble and settings.CONTEXT_ASSEMBLY_ENABLED:
+        with span("query.assemble"):
+            vectors = None
+            if settings.CONTEXT_MMR_LAMBDA < 1.0 and len(fids) > 1:
+                by_fid = store.lookup_vectors(fids)
+                # Segments that are not loaded have no vectors: keep the retrieval order then
+                if len(by_fid) == len(fids):
+                    vectors = np.stack([by_fid[fid] for fid in fids])
+            blocks, report = assemble_context(chunks, scores, vectors)
+    else:
+        blocks = [ContextBlock(c.text, [c], [s]) for c, s in zip(chunks, scores)]
+    return {
+        "contexts": [b.text for b in blocks],
+        "scores": [max(b.scores) for b in blocks],
+        "citations": _build_citations(blocks),
+        "assembly": report,
+    }
+
+
+def prepare_context(
+    db: Session,
+    store: Collection,
+    question: str,
+    top_k: int,
+    qvec: np.ndarray | None = None,
+) -> dict | None:
+    """
+    Retrieval + citation lookup (chunk sidecars; the DB session only for legacy segments),
+    then context assembly (see _context).
+    Returns {"contexts", "scores", "citations", "assembly"} or None when nothing relevant
+    is indexed. Pass `qvec` when the question is already embedded.
+    """
+    return _context(store, _retrieve_chunks(db, store, question, top_k, qvec=qvec))
+
+
+def _adjust_confidence(confidence: float, scores: list[float]) -> float:
+    # Light confidence adjustment based on retrieval strength
+    if scores:
+        best = max(scores)
+        if best < 0.20:
+            confidence = min(confidence, 0.55)
+        if best < 0.10:
+            confidence = min(confidence, 0.40)
+
+    # Clamp
+    return round(max(0.0, min(1.0, confidence)), 2)
+
+
+def assess_answer(
+    question: str,
+    answer: str,
+    contexts: list[str],
+    scores: list[float],
+    usage: Usage | None = None,
+) -> dict:
+    """
+    Completeness check + enrichment suggestions for a finished answer.
+    Returns {"confidence", "missing_info", "enrichment_suggestions"}.
+    """
     # 3) Completeness check
     completeness_prompt = build_completeness_prompt(question, answer, contexts)
-    completeness = chat_json(completeness_prompt)
+    with span("llm.completeness"):
+        completeness = chat_json(completeness_prompt, usage=usage)
 
     confidence = float(completeness.get("confidence", 0.5))
     missing_info = completeness.get("missing_info", []) or []
@@ -81,24 +287,266 @@ def answer_question(db: Session, store: FaissStore, question: str, top_k: int):
     enrichment_suggestions = []
     if missing_info:
         enrichment_prompt = build_enrichment_prompt(missing_info)
-        enrich = chat_json(enrichment_prompt)
+        with span("llm.enrichment"):
+            enrich = chat_json(enrichment_prompt, usage=usage)
         enrichment_suggestions = enrich.get("enrichment_suggestions", []) or []
 
-    # 5) Light confidence adjustment based on retrieval strength
-    if scores:
-        best = max(scores)
-        if best < 0.20:
-            confidence = min(confidence, 0.55)
-        if best < 0.10:
-            confidence = min(confidence, 0.40)
+    # 5) Retrieval-strength cap + clamp
+    return {
+        "confidence": _adjust_confidence(confidence, scores),
+        "missing_info": missing_info,
+        "enrichment_suggestions": enrichment_suggestions,
+    }
 
-    # Clamp
-    confidence = max(0.0, min(1.0, confidence))
+
+def _answer_multi(question: str, ctx: dict, usage: Usage) -> dict:
+    # 1) Grounded answer
+    answer_prompt = build_answer_prompt(question, ctx["contexts"])
+    with span("llm.answer"):
+        answer = chat_text(answer_prompt, usage=usage)
+
+    # 2) Citations (chunk refs + doc filename) were built during retrieval
+    assessment = assess_answer(question, answer, ctx["contexts"], ctx["scores"], usage=usage)
+    return {"answer": answer, **assessment}
+
+
+def _answer_fast(question: str, ctx: dict, usage: Usage) -> dict | None:
+    """
+    Answer, confidence, missing info and enrichment from one JSON completion.
+    Returns None when the output does not match StructuredAnswer.
+    """
+    with span("llm.structured"):
+        text = chat_text(build_structured_answer_prompt(question, ctx["contexts"]), usage=usage, json_mode=True)
+    try:
+        parsed = StructuredAnswer.model_validate(parse_json_object(text))
+    except (ValueError, ValidationError) as e:
+        print(f"[QUERY][WARN] Structured answer invalid, falling back to multi-call. Reason: {e}")
+        return None
 
     return {
-        "answer": answer,
-        "confidence": round(confidence, 2),
-        "citations": citations,
-        "missing_info": missing_info,
-        "enrichment_suggestions": enrichment_suggestions
+        "answer": parsed.answer.strip(),
+        "confidence": _adjust_confidence(parsed.confidence, ctx["scores"]),
+        "missing_info": parsed.missing_info,
+        "enrichment_suggestions": [s.model_dump() for s in parsed.enrichment_suggestions],
+    }
+
+
+def lookup_cached_answer(
+    store: Collection,
+    question: str,
+    top_k: int,
+    mode: str,
+) -> tuple[dict | None, np.ndarray | None, Scope]:
+    """
+    Answer-cache lookup: exact normalized question first, then (after embedding the
+    question) near-duplicates. Returns (cached result or None, question vector or None, scope);
+    the vector is reused for retrieval on a miss.
+    """
+    scope = (store.name, store.content_version, mode, top_k)
+    if not settings.ANSWER_CACHE_ENABLED:
+        return None, None, scope
+
+    cached = answer_cache.get(scope, question)
+    if cached is not None:
+        return copy.deepcopy(cached), None, scope
+
+    with span("query.embed"):
+        qvec = embed_query(question)
+    cached = answer_cache.get_similar(scope, qvec)
+    return (copy.deepcopy(cached) if cached is not None else None), qvec, scope
+
+
+def remember_answer(scope: Scope, question: str, result: dict, qvec: np.ndarray | None) -> None:
+    if settings.ANSWER_CACHE_ENABLED:
+        answer_cache.put(scope, question, copy.deepcopy(result), qvec)
+
+
+def _pipeline_mode(mode: str | None) -> str:
+    mode = (mode or settings.RAG_PIPELINE_MODE).lower()
+    return mode if mode in PIPELINE_MODES else "multi"
+
+
+def generate_answer(question: str, ctx: dict | None, mode: str) -> dict:
+    """
+    LLM stages for an already retrieved context (no DB access, safe on worker threads).
+    """
+    if ctx is None:
+        return _no_context_result()
+
+    usage = new_usage()
+    t = time.perf_counter()
+
+    result = _answer_fast(question, ctx, usage) if mode == "fast" else None
+    fallback = mode == "fast" and result is None
+    if result is None:
+        result = _answer_multi(question, ctx, usage)
+
+    # A fallback's extra calls count against the mode that needed them
+    pipeline_stats.record(mode, usage, time.perf_counter() - t, fallback)
+
+    return {
+        "answer": result["answer"],
+        "confidence": result["confidence"],
+        "citations": ctx["citations"],
+        "missing_info": result["missing_info"],
+        "enrichment_suggestions": result["enrichment_suggestions"],
     }
+
+
+def answer_question(db: Session, store: Collection, question: str, top_k: int, mode: str | None = None):
+    """
+    Retrieval + answer. `mode` (default RAG_PIPELINE_MODE):
+    - "multi": answer, then completeness check, then enrichment (up to 3 LLM calls)
+    - "fast": one structured-JSON call; invalid output falls back to "multi"
+
+    Results are served from / stored in the answer cache (see lookup_cached_answer).
+    """
+    mode = _pipeline_mode(mode)
+
+    with span("query.total"):
+        cached, qvec, scope = lookup_cached_answer(store, question, top_k, mode)
+        if cached is not None:
+            QUERIES.inc(mode=mode, outcome="cached")
+            return cached
+
+        ctx = prepare_context(db, store, question, top_k, qvec=qvec)
+        if ctx is None:
+            QUERIES.inc(mode=mode, outcome="no_context")
+            return _no_context_result()
+
+        result = generate_answer(question, ctx, mode)
+        remember_answer(scope, question, result, qvec)
+        QUERIES.inc(mode=mode, outcome="answered")
+        return result
+
+
+def answer_batch(
+    db: Session,
+    store: Collection,
+    questions: list[str],
+    top_k: int,
+    mode: str | None = None,
+    retrieval_only: bool = False,
+    concurrency: int | None = None,
+) -> list[dict]:
+    """
+    Answers many questions with shared retrieval work:
+    1) one embed_texts call for all questions (batched/concurrent inside the embedder)
+    2) answer-cache lookups, then one matrix search for the misses
+    3) one chunk lookup for every hit of every question
+    4) LLM stages on up to `concurrency` (QUERY_BATCH_CONCURRENCY) threads
+
+    Returns one item per question, in order: {"index", "question", "cached", "result"}
+    on success or {"index", "question", "error"} if that question's LLM stage failed.
+    With `retrieval_only`, results hold just the citations and no LLM call is made.
+    """
+    mode = _pipeline_mode(mode)
+    use_cache = settings.ANSWER_CACHE_ENABLED and not retrieval_only
+    scope: Scope = (store.name, store.content_version, mode, top_k)
+    items: list[dict] = [{"index": i, "question": q, "cached": False} for i, q in enumerate(questions)]
+
+    with span("query.batch_embed"):
+        qvecs = embed_texts(questions, is_query=True)
+
+    todo: list[int] = []
+    for i, q in enumerate(questions):
+        cached = answer_cache.get(scope, q) if use_cache else None
+        if cached is None and use_cache:
+            cached = answer_cache.get_similar(scope, qvecs[i])
+        if cached is not None:
+            items[i].update(cached=True, result=copy.deepcopy(cached))
+            QUERIES.inc(mode=mode, outcome="cached")
+        else:
+            todo.append(i)
+    if not todo:
+        return items
+
+    with span("query.batch_search"):
+        scores, ids = store.search_matrix(qvecs[todo], top_k)
+    fids = np.unique(ids[ids >= 0]).tolist()
+    chunk_by_fid = _resolve_chunks(db, store, fids) if fids else {}
+    # Retrieval-only results cite every hit, so they skip assembly
+    ctxs = {
+        i: _context(store, _ordered_hits(chunk_by_fid, ids[r].tolist(), scores[r].tolist()), assemble=not retrieval_only)
+        for r, i in enumerate(todo)
+    }
+
+    if retrieval_only:
+        for i in todo:
+            items[i]["result"] = {"citations": ctxs[i]["citations"] if ctxs[i] else []}
+        return items
+
+    def run(i: int) -> None:
+        try:
+            result = generate_answer(questions[i], ctxs[i], mode)
+        except Exception as e:
+            print(f"[QUERY][ERROR] Batch item {i} failed: {e}")
+            items[i].pop("cached")
+            items[i]["error"] = str(e)
+            QUERIES.inc(mode=mode, outcome="error")
+            return
+        items[i]["result"] = result
+        QUERIES.inc(mode=mode, outcome="answered" if ctxs[i] is not None else "no_context")
+        if ctxs[i] is not None:
+            remember_answer(scope, questions[i], result, qvecs[i])
+
+    workers = max(1, min(int(concurrency or settings.QUERY_BATCH_CONCURRENCY), len(todo)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="query-batch") as pool:
+        list(pool.map(run, todo))
+    return items
+
+
+def replay_answer(result: dict) -> Iterator[tuple[str, dict]]:
+    """
+    The stream_answer event sequence for an already complete (e.g. cached) result.
+    """
+    yield "citations", {"citations": result["citations"]}
+    yield "answer", {"answer": result["answer"]}
+    yield "assessment", {k: result[k] for k in ("confidence", "missing_info", "enrichment_suggestions")}
+    yield "done", {}
+
+
+def stream_answer(
+    question: str,
+    ctx: dict | None,
+    on_result: Callable[[dict], None] | None = None,
+) -> Iterator[tuple[str, dict]]:
+    """
+    Yields (event, payload) pairs for a streamed answer, given `prepare_context` output:
+    - "citations" right away (retrieval is already done)
+    - "token" for each answer delta as the model produces it
+    - "answer" with the full text, then "assessment" (confidence, missing info, enrichment)
+    - "done" last; an "error" event replaces the rest if the LLM fails midway
+
+    Needs no DB session, so it can run after the request's session is closed.
+    `on_result` receives the complete result (same shape as answer_question) on success.
+    """
+    if ctx is None:
+        yield from replay_answer(_no_context_result())
+        return
+
+    yield "citations", {"citations": ctx["citations"]}
+
+    usage = new_usage()
+    t = time.perf_counter()
+    try:
+        parts: list[str] = []
+        with span("llm.answer_stream"):
+            for delta in chat_text_stream(build_answer_prompt(question, ctx["contexts"]), usage=usage):
+                parts.append(delta)
+                yield "token", {"text": delta}
+        answer = "".join(parts).strip()
+        yield "answer", {"answer": answer}
+
+        assessment = assess_answer(question, answer, ctx["contexts"], ctx["scores"], usage=usage)
+        yield "assessment", assessment
+        pipeline_stats.record("stream", usage, time.perf_counter() - t)
+        QUERIES.inc(mode="stream", outcome="answered")
+        if on_result is not None:
+            on_result({"answer": answer, "citations": ctx["citations"], **assessment})
+    except Exception as e:
+        print(f"[QUERY][ERROR] Streaming answer failed: {e}")
+        yield "error", {"detail": str(e)}
+        return
+
+    yield "done", {}
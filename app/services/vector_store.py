@@ -1,66 +1,1218 @@
+from __future__ import annotations
+
 import os
+import json
+import shutil
+import time
+import uuid
+import threading
+from typing import Callable
 import numpy as np
-import faiss
 from app.core.config import settings
+from app.core.lazy import lazy_import
+from app.services.chunk_store import ChunkRecord, ChunkSidecar, write_sidecar
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are serialized within one process only
+    fcntl = None
+
+# Imported on first index access (warmup or the first query/upload), not at app import
+faiss = lazy_import("faiss")
+
+# Files inside one index directory (settings.FAISS_DIR, or a collection shard's dir).
+# Pre-segment single-file layout (still read; becomes the first segment):
+INDEX_FILE = "index.faiss"
+TOMBSTONES_FILE = "tombstones.npy"
+
+MANIFEST_FILE = "manifest.json"
+SEGMENTS_SUBDIR = "segments"
+VERSION_FILE = "index.version"
+# In settings.FAISS_DIR: held by the one process currently writing any index dir
+WRITER_LOCK_FILE = "writer.lock"
+
+INDEX_TYPES = ("flat", "ivf", "hnsw")
+# Vector codes: float32 | 8-bit scalar | float16 | product quantization (FAISS_PQ_M bytes)
+QUANTIZATIONS = ("none", "sq8", "fp16", "pq")
+
+# A PQ codebook has 2**8 centroids per sub-quantizer, so it needs at least that many training points
+_PQ_MIN_TRAIN = 256
+
+# Stable IDs are drawn from [2**32, 2**63) so they can never collide with the
+# positional IDs (0..ntotal) handed out by indexes created before ID mapping.
+_MIN_STABLE_ID = 1 << 32
+
+
+def new_vector_ids(n: int) -> np.ndarray:
+    """
+    Random 63-bit chunk ids. Allocation needs no coordination between workers;
+    a collision among 2**63 values is not a practical concern.
+    """
+    raw = np.frombuffer(os.urandom(8 * n), dtype=np.uint64) >> np.uint64(1)
+    return (raw | np.uint64(_MIN_STABLE_ID)).astype(np.int64)
+
+
+def _ivf_nlist(n_vectors: int) -> int:
+    if settings.FAISS_IVF_NLIST > 0:
+        return settings.FAISS_IVF_NLIST
+    # Rule of thumb: ~4*sqrt(n) lists, with enough points per list to train on
+    return max(1, min(int(4 * np.sqrt(max(n_vectors, 1))), n_vectors // 39 or 1))
+
+
+def _pq_m(dim: int) -> int:
+    if settings.FAISS_PQ_M > 0:
+        return settings.FAISS_PQ_M
+    # ~16 dims per sub-quantizer (96 bytes/vector at 1536 dims), rounded down to a divisor of dim
+    m = max(1, dim // 16)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def _codec(dim: int, quant: str) -> str:
+    return {"sq8": "SQ8", "fp16": "SQfp16", "pq": f"PQ{_pq_m(dim)}"}[quant]
+
+
+def build_index(
+    dim: int,
+    index_type: str,
+    vectors: np.ndarray | None = None,
+    ids: np.ndarray | None = None,
+    quant: str = "none",
+) -> faiss.IndexIDMap2:
+    """
+    Creates an ID-mapped inner-product index of `index_type` and adds `vectors`
+    (already L2-normalized) under `ids` (default: 0..n-1).
+    IVF is trained on the given vectors; without vectors it falls back to flat.
+
+    `quant` compresses the stored vectors (QUANTIZATIONS); sq8/pq are trained on the
+    given vectors too, so without vectors they fall back to float32.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type '{index_type}'. Supported: {list(INDEX_TYPES)}")
+    if quant not in QUANTIZATIONS:
+        raise ValueError(f"Unknown FAISS quantization '{quant}'. Supported: {list(QUANTIZATIONS)}")
+
+    n = 0 if vectors is None else int(vectors.shape[0])
+    if quant in ("sq8", "pq") and n == 0:
+        quant = "none"
+    if quant == "pq" and index_type == "hnsw":
+        # FAISS's HNSW-PQ only supports L2 distance; SQ8 is the closest inner-product codec
+        print("[FAISS][WARN] HNSW does not support PQ with inner product; using SQ8 instead")
+        quant = "sq8"
+
+    if quant != "none":
+        codec = _codec(dim, quant)
+        if index_type == "hnsw":
+            desc = f"HNSW{settings.FAISS_HNSW_M},{codec}"
+        elif index_type == "ivf" and n > 0:
+            desc = f"IVF{_ivf_nlist(n)},{codec}"
+        else:
+            desc = codec
+        inner = faiss.index_factory(dim, desc, faiss.METRIC_INNER_PRODUCT)
+        if isinstance(inner, faiss.IndexHNSW):
+            inner.hnsw.efConstruction = settings.FAISS_HNSW_EF_CONSTRUCTION
+        if isinstance(inner, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+            # Polysemous codes only help Hamming-distance search, which we never use
+            inner.do_polysemous_training = False
+        if not inner.is_trained:
+            inner.train(vectors)
+    elif index_type == "hnsw":
+        inner = faiss.IndexHNSWFlat(dim, settings.FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        inner.hnsw.efConstruction = settings.FAISS_HNSW_EF_CONSTRUCTION
+    elif index_type == "ivf" and n > 0:
+        quantizer = faiss.IndexFlatIP(dim)
+        inner = faiss.IndexIVFFlat(quantizer, dim, _ivf_nlist(n), faiss.METRIC_INNER_PRODUCT)
+        inner.train(vectors)
+    else:
+        inner = faiss.IndexFlatIP(dim)
+
+    index = faiss.IndexIDMap2(inner)
+    if n > 0:
+        if ids is None:
+            ids = np.arange(n, dtype=np.int64)
+        index.add_with_ids(vectors, np.ascontiguousarray(ids, dtype=np.int64))
+    apply_search_params(index)
+    return index
+
+
+def _inner(index: faiss.Index) -> faiss.Index:
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def apply_search_params(index: faiss.Index) -> None:
+    """
+    Applies query-time knobs (nprobe / efSearch); these are not persisted by FAISS.
+    """
+    inner = _inner(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = settings.FAISS_HNSW_EF_SEARCH
+        return
+    ivf = faiss.try_extract_index_ivf(inner)
+    if ivf is not None:
+        ivf.nprobe = min(settings.FAISS_IVF_NPROBE, ivf.nlist)
+
+
+def index_kind(index: faiss.Index | None) -> str:
+    if index is None:
+        return "none"
+    inner = _inner(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if faiss.try_extract_index_ivf(inner) is not None:
+        return "ivf"
+    return "flat"
+
+
+def index_quantization(index: faiss.Index | None) -> str:
+    """
+    Vector codec of `index` (one of QUANTIZATIONS).
+    """
+    if index is None:
+        return "none"
+    inner = _inner(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner = faiss.downcast_index(inner.storage)
+    ivf = faiss.try_extract_index_ivf(inner)
+    if ivf is not None:
+        inner = faiss.downcast_index(ivf)
+    if isinstance(inner, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "fp16" if inner.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    if isinstance(inner, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    return "none"
+
+
+def search_params(index: faiss.Index, sel: faiss.IDSelector | None) -> faiss.SearchParameters | None:
+    """
+    SearchParameters carrying an ID selector. Type-specific params must restate
+    nprobe/efSearch, because passing params replaces the index defaults.
+    """
+    if sel is None:
+        return None
+    inner = _inner(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = inner.hnsw.efSearch
+    elif faiss.try_extract_index_ivf(inner) is not None:
+        params = faiss.SearchParametersIVF()
+        params.nprobe = faiss.try_extract_index_ivf(inner).nprobe
+    else:
+        params = faiss.SearchParameters()
+    params.sel = sel
+    return params
+
+
+def _mmap_flags(kind: str | None) -> int:
+    """
+    faiss.read_index flags mapping a segment's vector data instead of reading it:
+    IVF inverted lists map with IO_FLAG_MMAP; flat codes (flat/SQ/PQ, HNSW storage) with
+    IO_FLAG_MMAP_IFC. The two cannot be combined on one IVF file.
+    """
+    flag = faiss.IO_FLAG_MMAP if kind == "ivf" else faiss.IO_FLAG_MMAP_IFC
+    return flag | faiss.IO_FLAG_READ_ONLY
+
+
+class WriterLock:
+    """
+    Serializes index writers (ingestion, deletes, maintenance, CLI rebuilds): a thread
+    lock within the process plus an exclusive flock on FAISS_DIR/writer.lock across
+    processes, so with several uvicorn workers exactly one commits manifests at a time
+    while every worker keeps serving searches from its read-only mapped segments.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fd: int | None = None
+
+    def acquire(self) -> None:
+        self._lock.acquire()
+        if fcntl is None:
+            return
+        try:
+            os.makedirs(settings.FAISS_DIR, exist_ok=True)
+            fd = os.open(os.path.join(settings.FAISS_DIR, WRITER_LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            self._fd = fd
+        except BaseException:
+            self._lock.release()
+            raise
+
+    def release(self) -> None:
+        fd, self._fd = self._fd, None
+        try:
+            if fd is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+        finally:
+            self._lock.release()
+
+    def __enter__(self) -> "WriterLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+# The process-wide writer lock; hold it from loading a writer's store through save()
+writer_lock = WriterLock()
+
+
+def _fsync_file(path: str) -> None:
+    with open(path, "rb+") as f:
+        os.fsync(f.fileno())
+
+
+def _write_atomic_json(path: str, payload: dict) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# Resolves chunk records for vector ids a segment has no sidecar for (see merge())
+ChunkLookup = Callable[[list[int]], dict[int, ChunkRecord]]
+
+
+def _segment_kind(index_type: str, n_vectors: int) -> str:
+    """
+    Index kind for a segment of `n_vectors`: IVF only pays off (and only trains
+    well) past FAISS_IVF_TRAIN_THRESHOLD, so smaller "ivf" segments stay flat.
+    """
+    if index_type == "ivf" and n_vectors < settings.FAISS_IVF_TRAIN_THRESHOLD:
+        return "flat"
+    return index_type
+
+
+def _segment_quant(quant: str, n_vectors: int, explicit: bool = False) -> str:
+    """
+    Codec for a segment of `n_vectors`. fp16 needs no training; sq8/pq are trained
+    per segment, so below FAISS_QUANTIZE_MIN_VECTORS (unless `explicit`, e.g. a
+    migration) they stay float32: too little to train on, too little RAM to save.
+    """
+    if quant in ("sq8", "pq"):
+        if not explicit and n_vectors < settings.FAISS_QUANTIZE_MIN_VECTORS:
+            return "none"
+        if n_vectors < (_PQ_MIN_TRAIN if quant == "pq" else 1):
+            return "none"
+    return quant
+
+
+class Segment:
+    """
+    One immutable index file listed in the manifest (or an in-memory segment not yet
+    saved, file=None). `index` is None when a writer opened the store without data.
+
+    Alongside it, an optional chunk sidecar (`chunks_file`, memory-mapped as `chunks`)
+    holds the text and citation fields of its vectors. An in-memory segment collects
+    them in `records`; None there means some vector came without one (no sidecar).
+
+    A quantized segment (`quant` != "none") also keeps its float32 vectors, in id_map
+    order, in `vectors_file` (memory-mapped as `vectors`): merges stay lossless and
+    search can rescore the compressed index's candidates exactly.
+    """
+    __slots__ = (
+        "file", "index", "count", "kind", "quant", "chunks_file", "chunks", "records",
+        "vectors_file", "vectors", "_rows",
+    )
+
+    def __init__(
+        self,
+        file: str | None,
+        index: faiss.Index | None,
+        count: int,
+        kind: str | None = None,
+        chunks_file: str | None = None,
+        records: dict[int, ChunkRecord] | None = None,
+        quant: str | None = None,
+        vectors_file: str | None = None,
+        vectors: np.ndarray | None = None,
+    ):
+        self.file = file
+        self.index = index
+        self.count = int(count)
+        self.kind = index_kind(index) if index is not None else kind
+        self.quant = index_quantization(index) if index is not None else (quant or "none")
+        self.chunks_file = chunks_file
+        self.chunks: ChunkSidecar | None = None
+        self.records = records
+        self.vectors_file = vectors_file
+        self.vectors = vectors
+        self._rows: tuple[np.ndarray, np.ndarray] | None = None
+
+    def ids(self) -> np.ndarray:
+        return faiss.vector_to_array(self.index.id_map).astype(np.int64)
+
+    def _row_index(self) -> tuple[np.ndarray, np.ndarray]:
+        # (sorted ids, their rows in id_map order), built on first use
+        if self._rows is None:
+            seg_ids = self.ids()
+            order = np.argsort(seg_ids, kind="stable")
+            self._rows = (seg_ids[order], order)
+        return self._rows
+
+    def full_vectors(self, ids: np.ndarray) -> np.ndarray:
+        """
+        float32 vectors of `ids` (all stored in this segment) from `vectors`.
+        """
+        sorted_ids, order = self._row_index()
+        rows = order[np.searchsorted(sorted_ids, ids)]
+        return np.asarray(self.vectors[rows], dtype=np.float32)
+
+    def lookup_vectors(self, ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        (those of `ids` stored in this segment, their vectors): exact from `vectors`
+        when there is a float32 copy, otherwise reconstructed from the index.
+        """
+        sorted_ids, order = self._row_index()
+        pos = np.minimum(np.searchsorted(sorted_ids, ids), max(sorted_ids.size - 1, 0))
+        hit = sorted_ids[pos] == ids if sorted_ids.size else np.zeros(ids.shape, dtype=bool)
+        found, rows = ids[hit], order[pos[hit]]
+        if found.size == 0:
+            return found, np.zeros((0, self.index.d), dtype=np.float32)
+        if self.vectors is not None:
+            return found, np.asarray(self.vectors[rows], dtype=np.float32)
+        return found, _reconstruct_rows(self.index, rows)
+
+    def rescore(self, queries: np.ndarray, ids: np.ndarray, top_k: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Exact inner products of `queries` with candidate `ids` (nq, k) from the
+        compressed index; keeps the best `top_k` per query.
+        """
+        valid = ids >= 0
+        scores = np.full(ids.shape, -np.inf, dtype=np.float32)
+        if valid.any():
+            rows = np.nonzero(valid)[0]
+            scores[valid] = np.einsum("ij,ij->i", self.full_vectors(ids[valid]), queries[rows])
+        order = np.argsort(-scores, axis=1, kind="stable")[:, :top_k]
+        return np.take_along_axis(scores, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+    def ids_for_documents(self, document_ids: set[str]) -> np.ndarray | None:
+        """
+        Ids of this segment's vectors belonging to `document_ids`; None without chunk records.
+        """
+        if self.chunks is not None:
+            return self.chunks.ids_for_documents(document_ids)
+        if self.records is not None:
+            return np.fromiter(
+                (i for i, rec in self.records.items() if rec.document_id in document_ids), dtype=np.int64
+            )
+        return None
+
+    def lookup(self, ids: np.ndarray) -> dict[int, ChunkRecord]:
+        if self.chunks is not None:
+            return self.chunks.records(ids)
+        if self.records is not None:
+            return {i: self.records[i] for i in ids.tolist() if i in self.records}
+        return {}
 
-INDEX_PATH = os.path.join(settings.FAISS_DIR, "index.faiss")
 
 class FaissStore:
     """
     Uses cosine similarity by:
     - L2 normalizing vectors
-    - IndexFlatIP (inner product)
+    - inner-product indexes: IndexFlatIP (exact), IVF-flat or HNSW (FAISS_INDEX_TYPE)
+    - optionally compressed codes (FAISS_QUANTIZATION: SQ8, fp16 or PQ) in merged
+      segments, rescored against float32 copies memory-mapped from disk
+
+    Vectors are keyed by stable 64-bit chunk ids (IndexIDMap2), so documents can be
+    deleted/replaced: removed ids become tombstones that searches skip via an ID
+    selector, and compact() later rewrites the affected segments without them.
+
+    Persistence is segmented and append-only:
+    - each save() writes only the vectors added since the last save, as a new
+      immutable segment file, plus the tombstone set if it changed
+    - manifest.json lists the live segments; it is replaced atomically (rename)
+      as the single commit point, so a crash mid-write never corrupts the index
+    - search runs over all segments and merges the top-k
+    - merge()/compact() fold small or tombstone-heavy segments together in the background
+
+    Readers may open the store read-only with `mmap=True`: segment data stays in the OS
+    page cache, shared by every process mapping the same immutable files, instead of
+    being read into each process's heap. Writers load their own (unmapped) copy under
+    `writer_lock`.
     """
-    def __init__(self, dim: int):
+    def __init__(self, dim: int, index_type: str | None = None, path: str | None = None):
         self.dim = int(dim)
-        self.index: faiss.Index | None = None
-
-    def load_or_create(self) -> "FaissStore":
-        os.makedirs(settings.FAISS_DIR, exist_ok=True)
-
-        if os.path.exists(INDEX_PATH):
-            self.index = faiss.read_index(INDEX_PATH)
-            # Validate dim
-            if getattr(self.index, "d", None) != self.dim:
-                raise RuntimeError(
-                    f"FAISS index dim ({self.index.d}) does not match expected dim ({self.dim}). "
-                    f"Delete data/faiss_index/index.faiss and re-upload documents."
-                )
+        # Directory holding the manifest and segments (default: settings.FAISS_DIR)
+        self.path = path or settings.FAISS_DIR
+        self.index_type = (index_type or settings.FAISS_INDEX_TYPE).lower()
+        self.segments: list[Segment] = []
+        self.tombstones: set[int] = set()
+        self._tomb_sel: faiss.IDSelector | None = None
+        self._tomb_file: str | None = None
+        self._tomb_dirty = False
+        self._open: Segment | None = None
+        # Files dropped from the manifest; retired once the next manifest is committed
+        self._retired: list[str] = []
+        # What merge()/compact() changed since loading, so rebase() can replay it
+        self._merged_files: list[str] = []
+        self._dropped: set[int] = set()
+        # Bumped only when searchable content changes (adds/removes), not by merges or
+        # compaction, so caches of query results can key on it
+        self.content_version = 0
+        self._content_dirty = False
+        # Set by load_or_create(mmap=True): segments are mapped read-only, writes refused
+        self.read_only = False
+
+    # -------------------------
+    # Loading
+    # -------------------------
+    @property
+    def index(self) -> faiss.Index | None:
+        """
+        The single loaded index when the store has exactly one segment (tools/tests).
+        """
+        loaded = [seg.index for seg in self.segments if seg.index is not None]
+        return loaded[0] if len(loaded) == 1 else None
+
+    def _read_segment(self, file: str, kind: str | None = None) -> faiss.IndexIDMap2:
+        path = os.path.join(self.path, file)
+        index = None
+        if self.read_only and file != INDEX_FILE:
+            try:
+                index = faiss.read_index(path, _mmap_flags(kind))
+            except RuntimeError as e:
+                print(f"[FAISS][WARN] Cannot map {file} ({e}); reading it into memory")
+        if index is None:
+            index = faiss.read_index(path)
+        # Validate dim
+        if getattr(index, "d", None) != self.dim:
+            raise RuntimeError(
+                f"FAISS index dim ({index.d}) does not match expected dim ({self.dim}). "
+                f"Delete {self.path} and re-upload documents."
+            )
+        if not isinstance(index, faiss.IndexIDMap2):
+            # Legacy positional index: wrap it with ids 0..ntotal-1 (== Chunk.faiss_id)
+            index = build_index(self.dim, index_kind(index), _raw_vectors(index), quant=index_quantization(index))
+        apply_search_params(index)
+        return index
+
+    def load_or_create(
+        self,
+        previous: "FaissStore | None" = None,
+        load_segments: bool = True,
+        mmap: bool = False,
+    ) -> "FaissStore":
+        """
+        Loads the manifest, tombstones and (with `load_segments`) the segment indexes.
+
+        - `previous`: a loaded store whose in-memory segments are reused by file name;
+          segment files are immutable, so a reload only reads what is new.
+        - `load_segments=False`: metadata only, enough to append/tombstone and save.
+        - `mmap=True`: read-only store whose segments are memory-mapped (IVF lists / flat
+          codes); only id maps and graph links are read into RAM.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        self.read_only = mmap
+        reuse: dict[str, Segment] = {}
+        if previous is not None and previous.read_only == self.read_only:
+            reuse = {seg.file: seg for seg in previous.segments if seg.file and seg.index is not None}
+
+        manifest = read_manifest(self.path)
+        self.content_version = int((manifest or {}).get("content_version", 0))
+        if manifest is not None:
+            entries = manifest.get("segments", [])
+            self._tomb_file = manifest.get("tombstones")
+            tomb_path = os.path.join(self.path, self._tomb_file) if self._tomb_file else None
+        elif os.path.exists(os.path.join(self.path, INDEX_FILE)):
+            # Pre-segment layout: the monolithic index.faiss becomes the first segment
+            entries = [{"file": INDEX_FILE, "count": None}]
+            tomb_path = os.path.join(self.path, TOMBSTONES_FILE)
         else:
-            self.index = faiss.IndexFlatIP(self.dim)
+            entries, tomb_path = [], None
 
+        self.segments = []
+        for entry in entries:
+            old = reuse.get(entry["file"])
+            index = old.index if old is not None else None
+            if index is None and (load_segments or entry.get("count") is None):
+                index = self._read_segment(entry["file"], entry.get("kind"))
+            count = index.ntotal if index is not None else entry["count"]
+            seg = Segment(
+                entry["file"], index, count, entry.get("kind"), chunks_file=entry.get("chunks"),
+                quant=entry.get("quant"), vectors_file=entry.get("vectors"),
+            )
+            if old is not None and old.chunks is not None and old.chunks_file == seg.chunks_file:
+                seg.chunks = old.chunks
+            elif load_segments and seg.chunks_file:
+                seg.chunks = _open_sidecar(self.path, seg.chunks_file)
+            if old is not None and old.vectors is not None and old.vectors_file == seg.vectors_file:
+                seg.vectors, seg._rows = old.vectors, old._rows
+            elif load_segments and seg.vectors_file:
+                seg.vectors = _open_vectors(self.path, seg.vectors_file)
+            self.segments.append(seg)
+
+        self.tombstones = set()
+        if tomb_path and os.path.exists(tomb_path):
+            self.tombstones = set(np.load(tomb_path).tolist())
+        self._refresh_selector()
         return self
 
-    def add(self, vectors: np.ndarray) -> list[int]:
-        if self.index is None:
-            raise RuntimeError("FAISS index not loaded.")
+    # -------------------------
+    # Writes (in memory until save())
+    # -------------------------
+    def add(
+        self,
+        vectors: np.ndarray,
+        ids: np.ndarray | list[int] | None = None,
+        records: list[ChunkRecord] | None = None,
+    ) -> list[int]:
+        """
+        Adds vectors under `ids` (default: freshly allocated stable ids) to the open
+        in-memory segment and returns the ids. `records` (one per vector) go into the
+        segment's chunk sidecar on save().
+        """
+        self._require_writable()
         if vectors.ndim != 2 or vectors.shape[1] != self.dim:
             raise ValueError(f"Expected vectors shape (n, {self.dim}), got {vectors.shape}")
 
         vecs = vectors.astype(np.float32)
         faiss.normalize_L2(vecs)
 
-        start_id = self.index.ntotal
-        self.index.add(vecs)
-        return list(range(start_id, start_id + vecs.shape[0]))
+        id_arr = new_vector_ids(vecs.shape[0]) if ids is None else np.asarray(ids, dtype=np.int64)
+        if id_arr.shape[0] != vecs.shape[0]:
+            raise ValueError(f"Got {id_arr.shape[0]} ids for {vecs.shape[0]} vectors")
+        if records is not None and len(records) != vecs.shape[0]:
+            raise ValueError(f"Got {len(records)} chunk records for {vecs.shape[0]} vectors")
+
+        if self._open is None:
+            self._open = Segment(None, build_index(self.dim, _segment_kind(self.index_type, 0)), 0, records={})
+            self.segments.append(self._open)
+        self._open.index.add_with_ids(vecs, np.ascontiguousarray(id_arr))
+        self._open.count = self._open.index.ntotal
+        if records is None:
+            self._open.records = None
+        elif self._open.records is not None:
+            self._open.records.update(zip(id_arr.tolist(), records))
+        self._content_dirty = True
+        return id_arr.tolist()
+
+    def remove(self, ids: list[int]) -> int:
+        """
+        Tombstones `ids`: they stop appearing in search results immediately and are
+        physically dropped by the next compact(). Returns how many were new tombstones.
+        """
+        self._require_writable()
+        new = {int(i) for i in ids} - self.tombstones
+        if new:
+            self.tombstones |= new
+            self._tomb_dirty = True
+            self._content_dirty = True
+            self._refresh_selector()
+        return len(new)
+
+    def restore(self, ids: list[int]) -> int:
+        """
+        Revives tombstoned `ids` (undoes remove() while they are not compacted away).
+        Returns how many were tombstones.
+        """
+        self._require_writable()
+        back = {int(i) for i in ids} & self.tombstones
+        if back:
+            self.tombstones -= back
+            self._tomb_dirty = True
+            self._content_dirty = True
+            self._refresh_selector()
+        return len(back)
+
+    def _refresh_selector(self) -> None:
+        if self.tombstones:
+            batch = faiss.IDSelectorBatch(np.array(sorted(self.tombstones), dtype=np.int64))
+            sel = faiss.IDSelectorNot(batch)
+            sel._batch_ref = batch  # the C++ selector does not own `batch`
+            self._tomb_sel = sel
+        else:
+            self._tomb_sel = None
+
+    # -------------------------
+    # Maintenance
+    # -------------------------
+    def _require_writable(self) -> None:
+        if self.read_only:
+            raise RuntimeError("Store was opened read-only (mmap); writers load their own copy.")
+
+    def _require_loaded(self, segments: list[Segment]) -> None:
+        if any(seg.index is None for seg in segments):
+            raise RuntimeError("Segment data not loaded; open the store with load_segments=True.")
+
+    def id_vectors(self, include_removed: bool = False) -> tuple[np.ndarray, np.ndarray]:
+        """
+        (ids, vectors) for every stored vector; tombstoned ids are skipped unless asked for.
+        """
+        return self._live_vectors(self.segments, include_removed)
+
+    def _live_vectors(self, segments: list[Segment], include_removed: bool = False) -> tuple[np.ndarray, np.ndarray]:
+        self._require_loaded(segments)
+        all_ids, all_vecs = [], []
+        for seg in segments:
+            all_ids.append(seg.ids())
+            # Quantized codes only reconstruct approximately; prefer the float32 copy
+            all_vecs.append(np.asarray(seg.vectors) if seg.vectors is not None else _raw_vectors(seg.index))
+        if not all_ids:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, self.dim), dtype=np.float32)
+
+        ids, vecs = np.concatenate(all_ids), np.concatenate(all_vecs)
+        if self.tombstones and not include_removed:
+            keep = ~np.isin(ids, np.fromiter(self.tombstones, dtype=np.int64))
+            ids, vecs = ids[keep], vecs[keep]
+        return ids, vecs
+
+    def merge(
+        self,
+        files: list[str | None] | None = None,
+        index_type: str | None = None,
+        lookup: ChunkLookup | None = None,
+        quant: str | None = None,
+    ) -> int:
+        """
+        Replaces the chosen segments (default: all) by one new in-memory segment holding
+        their live vectors, built as `index_type` and compressed as `quant` (defaults: by
+        size and the configured type/quantization). Tombstones of the merged vectors are
+        dropped. Returns the number of vectors reclaimed. Call save() to persist.
+
+        Chunk records are carried over from the merged segments; `lookup` fills in those
+        of segments without a sidecar (e.g. from the DB), so merging backfills sidecars.
+        """
+        self._require_writable()
+        chosen = [seg for seg in self.segments if files is None or seg.file in files]
+        if not chosen:
+            return 0
+        self._require_loaded(chosen)
+
+        merged_ids = np.concatenate([seg.ids() for seg in chosen])
+        ids, vecs = self._live_vectors(chosen)
+        kind = index_type or _segment_kind(self.index_type, len(ids))
+        if quant is None:
+            quant = _segment_quant(settings.FAISS_QUANTIZATION, len(ids))
+        else:
+            quant = _segment_quant(quant, len(ids), explicit=True)
+
+        records: dict[int, ChunkRecord] | None = {}
+        for seg in chosen:
+            records.update(seg.lookup(ids))
+        missing = [i for i in ids.tolist() if i not in records]
+        if missing and lookup is not None:
+            records.update(lookup(missing))
+        if any(i not in records for i in missing):
+            records = None
+
+        new_seg = Segment(
+            None, build_index(self.dim, kind, vecs, ids, quant), len(ids), records=records,
+            vectors=vecs if quant != "none" else None,
+        )
+        self.segments = [seg for seg in self.segments if seg not in chosen] + [new_seg]
+        self._retired += [seg.file for seg in chosen if seg.file]
+        self._retired += [seg.chunks_file for seg in chosen if seg.chunks_file]
+        self._retired += [seg.vectors_file for seg in chosen if seg.vectors_file]
+        self._merged_files += [seg.file for seg in chosen if seg.file]
+        if self._open in chosen:
+            self._open = None
+
+        dropped = self.tombstones & set(merged_ids.tolist())
+        if dropped:
+            self._dropped |= dropped
+            self.tombstones -= dropped
+            self._tomb_dirty = True
+            self._refresh_selector()
+        return len(dropped)
+
+    def merge_candidates(self) -> list[str]:
+        """
+        Saved segments below FAISS_SEGMENT_SMALL_VECTORS, once there are at least
+        FAISS_SEGMENT_MERGE_MIN of them (tiered merging keeps the segment count bounded).
+        """
+        small = [
+            seg.file for seg in self.segments
+            if seg.file and seg.count < settings.FAISS_SEGMENT_SMALL_VECTORS
+        ]
+        return small if len(small) >= settings.FAISS_SEGMENT_MERGE_MIN else []
+
+    def needs_training(self) -> bool:
+        """
+        True for an "ivf" store past FAISS_IVF_TRAIN_THRESHOLD without an IVF segment yet.
+        """
+        return (
+            self.index_type == "ivf"
+            and self.count() >= settings.FAISS_IVF_TRAIN_THRESHOLD
+            and not any(seg.kind == "ivf" for seg in self.segments)
+        )
+
+    def maybe_train(self, lookup: ChunkLookup | None = None) -> bool:
+        """
+        Moves an "ivf" store from its bootstrap flat segments to one trained IVF segment
+        once the corpus reaches FAISS_IVF_TRAIN_THRESHOLD. Returns True if it rebuilt.
+        """
+        if self.needs_training():
+            print(f"[FAISS] Training IVF on {self.count()} vectors (threshold reached)")
+            self.rebuild("ivf", lookup=lookup)
+            return True
+        return False
+
+    def rebuild(
+        self,
+        index_type: str | None = None,
+        lookup: ChunkLookup | None = None,
+        quant: str | None = None,
+    ) -> "FaissStore":
+        """
+        Re-creates the whole index as one segment of `index_type` (default: the configured
+        type) from the live vectors, keeping their ids and dropping tombstones.
+        `quant` forces a codec (e.g. migrating to sq8) regardless of the size threshold.
+        """
+        self.merge(None, (index_type or self.index_type).lower(), lookup=lookup, quant=quant)
+        return self
+
+    def compact(self, lookup: ChunkLookup | None = None) -> int:
+        """
+        Rewrites the segments that contain tombstoned vectors without them.
+        Returns the number of reclaimed vectors.
+        """
+        if not self.tombstones:
+            return 0
+        self._require_loaded(self.segments)
+        tomb = np.fromiter(self.tombstones, dtype=np.int64)
+        affected = [seg.file for seg in self.segments if np.isin(seg.ids(), tomb).any()]
+        reclaimed = self.merge(affected, lookup=lookup) if affected else 0
+
+        # Tombstones matching no stored vector (already gone) are just forgotten
+        if self.tombstones and not affected:
+            self._dropped |= self.tombstones
+            self.tombstones = set()
+            self._tomb_dirty = True
+            self._refresh_selector()
+        return reclaimed
 
-    def search(self, query_vec: np.ndarray, top_k: int) -> tuple[list[int], list[float]]:
-        if self.index is None:
-            raise RuntimeError("FAISS index not loaded.")
+    def rebase(self) -> bool:
+        """
+        Moves the result of merge()/compact()/maybe_train(), built without `writer_lock`,
+        onto the latest manifest (the caller now holds the lock): segments and tombstones
+        other writers committed meanwhile are kept. Returns False, and the result must be
+        dropped, when a merged segment is no longer listed (another merge got there first).
+        """
+        self._require_writable()
+        latest = FaissStore(self.dim, self.index_type, self.path).load_or_create(previous=self, load_segments=False)
+        merged = set(self._merged_files)
+        if not merged <= {seg.file for seg in latest.segments}:
+            return False
+        self.segments = [seg for seg in latest.segments if seg.file not in merged] + [
+            seg for seg in self.segments if seg.file is None
+        ]
+        # Tombstones of vectors the merge dropped go; those added meanwhile stay
+        tombstones = latest.tombstones - self._dropped
+        self._tomb_dirty = tombstones != latest.tombstones
+        self.tombstones = tombstones
+        self._tomb_file = latest._tomb_file
+        self.content_version = latest.content_version
+        self._merged_files, self._dropped = [], set()
+        self._refresh_selector()
+        return True
+
+    def kinds(self) -> dict[str, int]:
+        """
+        {index kind: segment count}, e.g. {"flat": 3, "ivf+sq8": 1}.
+        """
+        out: dict[str, int] = {}
+        for seg in self.segments:
+            kind = seg.kind or "unknown"
+            if seg.quant != "none":
+                kind = f"{kind}+{seg.quant}"
+            out[kind] = out.get(kind, 0) + 1
+        return out
+
+    def tombstone_ratio(self) -> float:
+        total = sum(seg.count for seg in self.segments)
+        return len(self.tombstones) / total if total else 0.0
+
+    # -------------------------
+    # Reads
+    # -------------------------
+    def search(
+        self,
+        query_vec: np.ndarray,
+        top_k: int,
+        allowed_ids: np.ndarray | None = None,
+    ) -> tuple[list[int], list[float]]:
         q = query_vec.astype(np.float32).reshape(1, -1)
-        if q.shape[1] != self.dim:
-            raise ValueError(f"Expected query dim {self.dim}, got {q.shape[1]}")
+        scores, ids = self.search_matrix(q, top_k, allowed_ids=allowed_ids)
+        return ids[0].tolist(), scores[0].tolist()
+
+    def _selector(self, allowed_ids: np.ndarray | None) -> faiss.IDSelector | None:
+        if allowed_ids is None:
+            return self._tomb_sel
+        allow = faiss.IDSelectorBatch(np.ascontiguousarray(allowed_ids, dtype=np.int64))
+        if self._tomb_sel is None:
+            return allow
+        sel = faiss.IDSelectorAnd(allow, self._tomb_sel)
+        sel._refs = (allow, self._tomb_sel)  # the C++ selector does not own its operands
+        return sel
+
+    def search_matrix(
+        self,
+        queries: np.ndarray,
+        top_k: int,
+        allowed_ids: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Searches every loaded segment and merges per-query top-k by score.
+        Returns (scores, ids), each (nq, top_k); missing results are id -1.
+
+        `allowed_ids` restricts the search to those vectors (metadata filters): it is
+        applied inside FAISS as an ID selector, so top_k is filled from matching vectors.
+
+        Quantized segments with float32 copies return exact scores (FAISS_RESCORE):
+        they are searched for top_k * FAISS_RESCORE_FACTOR candidates, which are rescored.
+        """
+        q = np.ascontiguousarray(queries, dtype=np.float32).copy()
+        if q.ndim != 2 or q.shape[1] != self.dim:
+            raise ValueError(f"Expected query dim {self.dim}, got {q.shape[-1]}")
         faiss.normalize_L2(q)
 
-        scores, ids = self.index.search(q, top_k)
-        return ids[0].tolist(), scores[0].tolist()
+        nq = q.shape[0]
+        if allowed_ids is not None and len(allowed_ids) == 0:
+            return np.full((nq, top_k), -np.inf, dtype=np.float32), np.full((nq, top_k), -1, dtype=np.int64)
+        sel = self._selector(allowed_ids)
+
+        all_scores, all_ids = [], []
+        for seg in self.segments:
+            if seg.index is None or seg.index.ntotal == 0:
+                continue
+            rescore = settings.FAISS_RESCORE and seg.quant != "none" and seg.vectors is not None
+            k = top_k * max(1, settings.FAISS_RESCORE_FACTOR) if rescore else top_k
+            scores, ids = seg.index.search(q, k, params=search_params(seg.index, sel))
+            if rescore:
+                scores, ids = seg.rescore(q, ids, top_k)
+            all_scores.append(scores)
+            all_ids.append(ids)
+
+        if not all_scores:
+            return np.full((nq, top_k), -np.inf, dtype=np.float32), np.full((nq, top_k), -1, dtype=np.int64)
+        if len(all_scores) == 1:
+            return all_scores[0], all_ids[0]
+
+        scores = np.concatenate(all_scores, axis=1)
+        ids = np.concatenate(all_ids, axis=1)
+        scores = np.where(ids >= 0, scores, -np.inf)
+        order = np.argsort(-scores, axis=1, kind="stable")[:, :top_k]
+        return np.take_along_axis(scores, order, axis=1), np.take_along_axis(ids, order, axis=1)
 
     def count(self) -> int:
-        if self.index is None:
-            return 0
-        return int(self.index.ntotal)
+        return sum(seg.count for seg in self.segments) - len(self.tombstones)
+
+    def ids_for_documents(self, document_ids: set[str]) -> tuple[np.ndarray, bool]:
+        """
+        (vector ids of `document_ids`, complete): read from the chunk sidecars. `complete`
+        is False when some segment has no sidecar, so the caller must add those from the DB.
+        """
+        found, complete = [], True
+        for seg in self.segments:
+            ids = seg.ids_for_documents(document_ids)
+            if ids is None:
+                complete = False
+            elif ids.size:
+                found.append(ids)
+        return (np.concatenate(found) if found else np.zeros(0, dtype=np.int64)), complete
 
+    def lookup_chunks(self, ids: list[int]) -> dict[int, ChunkRecord]:
+        """
+        Chunk text + citation fields for vector `ids`, read from the segment sidecars
+        (memory-mapped, no DB round trip). Ids in segments without a sidecar are absent.
+        """
+        wanted = np.asarray([i for i in ids if i >= 0], dtype=np.int64)
+        out: dict[int, ChunkRecord] = {}
+        for seg in self.segments:
+            if wanted.size == 0:
+                break
+            found = seg.lookup(wanted)
+            if found:
+                out.update(found)
+                wanted = wanted[~np.isin(wanted, np.fromiter(found, dtype=np.int64))]
+        return out
+
+    def lookup_vectors(self, ids: list[int]) -> dict[int, np.ndarray]:
+        """
+        float32 vectors of `ids` (e.g. search hits, for diversity reranking); ids in
+        segments that are not loaded are absent.
+        """
+        wanted = np.asarray([i for i in ids if i >= 0], dtype=np.int64)
+        out: dict[int, np.ndarray] = {}
+        for seg in self.segments:
+            if wanted.size == 0:
+                break
+            if seg.index is None:
+                continue
+            found, vecs = seg.lookup_vectors(wanted)
+            if found.size:
+                out.update(zip(found.tolist(), vecs))
+                wanted = wanted[~np.isin(wanted, found)]
+        return out
+
+    # -------------------------
+    # Persistence
+    # -------------------------
     def save(self) -> None:
-        if self.index is None:
-            raise RuntimeError("FAISS index not loaded.")
-        faiss.write_index(self.index, INDEX_PATH)
+        """
+        Commits in-memory changes: new segments and tombstones are written as new files,
+        then the manifest is atomically replaced. Existing segment files are never rewritten.
+        Callers hold `writer_lock`.
+        """
+        self._require_writable()
+        os.makedirs(os.path.join(self.path, SEGMENTS_SUBDIR), exist_ok=True)
+        version = get_index_version(self.path) + 1
+        tag = f"{version:08d}-{uuid.uuid4().hex[:8]}"
+
+        for i, seg in enumerate(self.segments):
+            if seg.file is not None:
+                continue
+            if seg.index.ntotal == 0:
+                continue
+            rel = os.path.join(SEGMENTS_SUBDIR, f"seg-{tag}-{i}.faiss")
+            path = os.path.join(self.path, rel)
+            faiss.write_index(seg.index, f"{path}.tmp")
+            _fsync_file(f"{path}.tmp")
+            os.replace(f"{path}.tmp", path)
+            seg.file = rel
+            if seg.records is not None:
+                chunks_rel = os.path.join(SEGMENTS_SUBDIR, f"seg-{tag}-{i}.chunks")
+                ids = seg.ids()
+                write_sidecar(os.path.join(self.path, chunks_rel), ids, [seg.records[i] for i in ids.tolist()])
+                seg.chunks_file = chunks_rel
+                seg.chunks = _open_sidecar(self.path, chunks_rel)
+                seg.records = None
+            if seg.vectors is not None:
+                vectors_rel = os.path.join(SEGMENTS_SUBDIR, f"seg-{tag}-{i}.f32.npy")
+                vectors_path = os.path.join(self.path, vectors_rel)
+                np.save(f"{vectors_path}.tmp.npy", np.ascontiguousarray(seg.vectors, dtype=np.float32))
+                _fsync_file(f"{vectors_path}.tmp.npy")
+                os.replace(f"{vectors_path}.tmp.npy", vectors_path)
+                seg.vectors_file = vectors_rel
+                # Swap the in-RAM copy for the memory-mapped file
+                seg.vectors = _open_vectors(self.path, vectors_rel)
+        self.segments = [seg for seg in self.segments if seg.file is not None]
+        self._open = None
+
+        if self._tomb_dirty or (self.tombstones and self._tomb_file is None):
+            if self._tomb_file:
+                self._retired.append(self._tomb_file)
+            self._tomb_file = None
+            if self.tombstones:
+                rel = os.path.join(SEGMENTS_SUBDIR, f"tomb-{tag}.npy")
+                path = os.path.join(self.path, rel)
+                np.save(f"{path}.tmp.npy", np.array(sorted(self.tombstones), dtype=np.int64))
+                _fsync_file(f"{path}.tmp.npy")
+                os.replace(f"{path}.tmp.npy", path)
+                self._tomb_file = rel
+            self._tomb_dirty = False
+
+        if self._content_dirty:
+            self.content_version += 1
+            self._content_dirty = False
+
+        # Commit point
+        _write_atomic_json(os.path.join(self.path, MANIFEST_FILE), {
+            "format": 1,
+            "dim": self.dim,
+            "version": version,
+            "content_version": self.content_version,
+            "segments": [
+                {
+                    "file": seg.file, "count": seg.count, "kind": seg.kind, "quant": seg.quant,
+                    "chunks": seg.chunks_file, "vectors": seg.vectors_file,
+                }
+                for seg in self.segments
+            ],
+            "tombstones": self._tomb_file,
+        })
+        bump_index_version(self.path)
+
+        # The legacy tombstones file is superseded by the manifest's own
+        if os.path.exists(os.path.join(self.path, TOMBSTONES_FILE)):
+            self._retired.append(TOMBSTONES_FILE)
+        # Readers in other processes may still be loading the previous manifest: retired
+        # segment files are only marked, and gc_orphans() deletes them once they are old
+        now = time.time()
+        for rel in self._retired:
+            path = os.path.join(self.path, rel)
+            if os.path.dirname(rel) == SEGMENTS_SUBDIR:
+                try:
+                    os.utime(path, (now, now))
+                except OSError:
+                    pass
+            else:
+                _remove_path(path)
+        self._retired = []
+        self.gc_orphans()
+        self._merged_files, self._dropped = [], set()
+
+    def gc_orphans(self, min_age_s: float = 600.0) -> int:
+        """
+        Deletes segment-dir files no manifest references (retired by save(), or left by
+        crashed writes). Only files older than `min_age_s` are touched; save() refreshes
+        the mtime of the files it retires, so readers of the previous manifest keep them
+        that long. Callers hold `writer_lock`.
+        """
+        segments_dir = os.path.join(self.path, SEGMENTS_SUBDIR)
+        if not os.path.isdir(segments_dir):
+            return 0
+        live = {os.path.basename(seg.file) for seg in self.segments if seg.file}
+        live |= {os.path.basename(seg.chunks_file) for seg in self.segments if seg.chunks_file}
+        live |= {os.path.basename(seg.vectors_file) for seg in self.segments if seg.vectors_file}
+        if self._tomb_file:
+            live.add(os.path.basename(self._tomb_file))
+        removed = 0
+        now = time.time()
+        for name in os.listdir(segments_dir):
+            path = os.path.join(segments_dir, name)
+            if name in live or now - os.path.getmtime(path) < min_age_s:
+                continue
+            removed += int(_remove_path(path))
+        return removed
+
+
+def _open_sidecar(base: str, rel: str) -> ChunkSidecar | None:
+    try:
+        return ChunkSidecar(os.path.join(base, rel))
+    except (OSError, ValueError) as e:
+        # Retrieval falls back to the DB for this segment's vectors
+        print(f"[FAISS][WARN] Chunk sidecar {rel} unreadable: {e}")
+        return None
+
+
+def _open_vectors(base: str, rel: str) -> np.ndarray | None:
+    try:
+        return np.load(os.path.join(base, rel), mmap_mode="r")
+    except (OSError, ValueError) as e:
+        # Search falls back to the quantized scores; merges reconstruct from the codes
+        print(f"[FAISS][WARN] Full-precision vectors {rel} unreadable: {e}")
+        return None
+
+
+def _remove_path(path: str) -> bool:
+    try:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+        return True
+    except OSError:
+        return False  # e.g. still open elsewhere on Windows; gc_orphans() retries
+
+
+def _raw_vectors(index: faiss.Index) -> np.ndarray:
+    inner = _inner(index)
+    ivf = faiss.try_extract_index_ivf(inner)
+    if ivf is not None:
+        ivf.make_direct_map()
+    if inner.ntotal == 0:
+        return np.zeros((0, inner.d), dtype=np.float32)
+    return inner.reconstruct_n(0, inner.ntotal)
+
+
+_direct_map_lock = threading.Lock()
+
+
+def _reconstruct_rows(index: faiss.Index, rows: np.ndarray) -> np.ndarray:
+    inner = _inner(index)
+    ivf = faiss.try_extract_index_ivf(inner)
+    if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+        # Built once per segment; searches running meanwhile do not use it
+        with _direct_map_lock:
+            if ivf.direct_map.type == faiss.DirectMap.NoMap:
+                ivf.make_direct_map()
+    return np.asarray(inner.reconstruct_batch(np.asarray(rows, dtype=np.int64)), dtype=np.float32)
+
+
+def read_manifest(path: str | None = None) -> dict | None:
+    try:
+        with open(os.path.join(path or settings.FAISS_DIR, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+# -------------------------
+# Process-wide shared store
+# -------------------------
+_shared_lock = threading.Lock()
+# index dir -> (signature, store); each pair is swapped as a single reference so
+# readers never see a mismatched pair
+_shared: dict[str, tuple[tuple, FaissStore]] = {}
+
+
+def get_index_version(path: str | None = None) -> int:
+    try:
+        with open(os.path.join(path or settings.FAISS_DIR, VERSION_FILE), "r", encoding="utf-8") as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def bump_index_version(path: str | None = None) -> int:
+    path = path or settings.FAISS_DIR
+    os.makedirs(path, exist_ok=True)
+    version = get_index_version(path) + 1
+    version_path = os.path.join(path, VERSION_FILE)
+    with open(f"{version_path}.tmp", "w", encoding="utf-8") as f:
+        f.write(str(version))
+    os.replace(f"{version_path}.tmp", version_path)
+    return version
+
+
+def _index_signature(dim: int, path: str) -> tuple:
+    """
+    Cheap fingerprint of the on-disk index: version counter + manifest (or legacy
+    index file) mtime/size. Either one changing means ingestion wrote new data.
+    """
+    file_sig = None
+    for name in (MANIFEST_FILE, INDEX_FILE):
+        try:
+            st = os.stat(os.path.join(path, name))
+            file_sig = (name, st.st_mtime_ns, st.st_size)
+            break
+        except FileNotFoundError:
+            continue
+    return (int(dim), get_index_version(path), file_sig)
+
+
+def get_store(dim: int, path: str | None = None) -> FaissStore:
+    """
+    Returns the process-wide FaissStore of index dir `path` (default: settings.FAISS_DIR),
+    loading it once and reloading only when the on-disk index changes.
+
+    The reload builds a brand-new FaissStore (reusing already-loaded immutable segments)
+    and swaps the reference in one assignment, so queries already holding the previous
+    store keep searching it undisturbed.
+    The returned store is shared and read-only: with FAISS_MMAP its segments are mapped
+    from the page cache, so uvicorn workers share one copy of the index data and a
+    (re)load costs little more than reading the manifest. Writers load their own copy.
+    """
+    path = path or settings.FAISS_DIR
+    sig = _index_signature(dim, path)
+    current = _shared.get(path)
+    if current is not None and current[0] == sig:
+        return current[1]
+
+    with _shared_lock:
+        # Another thread may have reloaded while we waited
+        current = _shared.get(path)
+        if current is not None and current[0] == sig:
+            return current[1]
+
+        previous = current[1] if current is not None and current[1].dim == dim else None
+        for attempt in range(3):
+            try:
+                fresh = FaissStore(dim=dim, path=path).load_or_create(previous=previous, mmap=settings.FAISS_MMAP)
+                break
+            except (OSError, RuntimeError) as e:
+                # A file vanished because a writer committed meanwhile: load the new manifest
+                new_sig = _index_signature(dim, path)
+                if attempt == 2 or new_sig == sig:
+                    raise
+                print(f"[FAISS][WARN] Index changed while loading ({e}); reloading")
+                sig = new_sig
+        _shared[path] = (sig, fresh)
+        return fresh
@@ -0,0 +1,44 @@
+import threading
+
+from app.core import startup
+from app.core.config import settings
+
+
+def warmup() -> None:
+    """
+    Pays the cold-start costs up front: deferred imports, the OpenAI clients (when a
+    key is set) and the shared index of every collection. Each step is recorded as a
+    startup phase; a failing step is logged and skipped (the request path retries it).
+    """
+    from app.services import embedder, extractor, llm, vector_store
+    from app.services.collections import get_collection, read_registry
+
+    def step(name: str, fn) -> None:
+        try:
+            with startup.phase(f"warmup.{name}"):
+                fn()
+        except Exception as e:
+            print(f"[STARTUP][WARN] Warmup step '{name}' failed: {e}")
+
+    step("faiss", vector_store.faiss.load)
+    step("parsers", lambda: (extractor.pypdf.load(), extractor.docx.load()))
+    if settings.OPENAI_API_KEY:
+        step("openai", lambda: (llm._client(), embedder.is_local_model() or embedder._client()))
+
+    def load_indexes() -> None:
+        dim = embedder.get_embedding_dim()
+        for name in read_registry():
+            get_collection(name, dim)
+
+    step("index", load_indexes)
+    print(f"[STARTUP] Warmup done {startup.since_start():.2f}s after import")
+
+
+def start_warmup() -> threading.Thread:
+    def run() -> None:
+        with startup.phase("warmup"):
+            warmup()
+
+    thread = threading.Thread(target=run, name="warmup", daemon=True)
+    thread.start()
+    return thread
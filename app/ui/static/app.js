@@ -73,8 +73,16 @@ uploadBtn.onclick = async () => {
     for (const f of input.files) form.append("files", f);
 
     const res = await fetch("/v1/documents/upload", { method: "POST", body: form });
-    const data = await res.json();
+    let data = await res.json();
     uploadOut.textContent = JSON.stringify(data, null, 2);
+
+    // Ingestion runs in the background; poll the job until it finishes
+    while (res.ok && data?.job_id && !["completed", "failed"].includes(data.status)) {
+      await new Promise(r => setTimeout(r, 1000));
+      const jobRes = await fetch(`/v1/jobs/${data.job_id}`);
+      data = await jobRes.json();
+      uploadOut.textContent = JSON.stringify(data, null, 2);
+    }
   } catch (e) {
     uploadOut.textContent = `Upload failed: ${e}`;
   } finally {
@@ -98,15 +106,51 @@ askBtn.onclick = async () => {
   prettyAnswer.innerHTML = `<p>Thinking...</p>`;
 
   try {
-    const res = await fetch("/v1/query", {
+    const res = await fetch("/v1/query/stream", {
       method: "POST",
       headers: { "Content-Type": "application/json" },
       body: JSON.stringify({ question, top_k })
     });
 
-    const data = await res.json();
+    if (!res.ok) {
+      const err = await res.json();
+      answerOut.textContent = JSON.stringify(err, null, 2);
+      prettyAnswer.innerHTML = `<p>Query failed: ${esc(err?.detail)}</p>`;
+      return;
+    }
+
+    // Server-sent events: citations first, answer tokens as they arrive, assessment last
+    const data = { answer: "", citations: [], missing_info: [], enrichment_suggestions: [], confidence: 0 };
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let sep;
+      while ((sep = buffer.indexOf("\n\n")) !== -1) {
+        const block = buffer.slice(0, sep);
+        buffer = buffer.slice(sep + 2);
+
+        let event = "message";
+        let payload = "";
+        for (const line of block.split("\n")) {
+          if (line.startsWith("event: ")) event = line.slice(7);
+          else if (line.startsWith("data: ")) payload += line.slice(6);
+        }
+        const msg = payload ? JSON.parse(payload) : {};
+
+        if (event === "token") data.answer += msg.text;
+        else if (event === "error") throw new Error(msg.detail);
+        else Object.assign(data, msg);
+
+        renderResult(data);
+      }
+    }
     answerOut.textContent = JSON.stringify(data, null, 2);
-    renderResult(data);
   } catch (e) {
     prettyAnswer.innerHTML = `<p>Query failed: ${esc(e)}</p>`;
   } finally {
@@ -0,0 +1,54 @@
+"""
+Embedding throughput (chunks/sec) against the local stub server.
+
+    python -m benchmarks.bench_embeddings --chunks 2000 --latency-ms 80 --concurrency 1 2 4 8
+"""
+import argparse
+import time
+
+from benchmarks.stub_openai import StubConfig, start_stub_server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--chunk-chars", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    parser.add_argument("--per-item-ms", type=float, default=0.2)
+    parser.add_argument("--batch-items", type=int, default=256)
+    parser.add_argument("--batch-tokens", type=int, default=60000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    cfg = StubConfig(latency_ms=args.latency_ms, per_item_ms=args.per_item_ms)
+    server = start_stub_server(cfg)
+
+    from app.core.config import settings
+    from app.services import embedder
+
+    settings.OPENAI_API_KEY = "stub"
+    settings.OPENAI_BASE_URL = f"http://127.0.0.1:{server.server_port}/v1"
+    settings.EMBED_CACHE_ENABLED = False
+    settings.EMBED_BATCH_MAX_ITEMS = args.batch_items
+    settings.EMBED_BATCH_MAX_TOKENS = args.batch_tokens
+
+    base = "lorem ipsum dolor sit amet " * (args.chunk_chars // 27 + 1)
+    texts = [f"{i} {base[:args.chunk_chars]}" for i in range(args.chunks)]
+
+    print(f"chunks={args.chunks} chunk_chars={args.chunk_chars} latency_ms={args.latency_ms}")
+    for conc in args.concurrency:
+        settings.EMBED_CONCURRENCY = conc
+        cfg.requests = 0
+        t = time.perf_counter()
+        vectors = embedder.embed_texts(texts)
+        dt = time.perf_counter() - t
+        print(
+            f"concurrency={conc:<3} requests={cfg.requests:<4} "
+            f"time={dt:.2f}s throughput={len(vectors) / dt:,.0f} chunks/s"
+        )
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
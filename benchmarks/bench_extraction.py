@@ -0,0 +1,73 @@
+"""
+Document extraction throughput: sequential vs process-pool page ranges.
+
+    python -m benchmarks.bench_extraction --pages 100 500 --workers 1 2 4
+    python -m benchmarks.bench_extraction --files sample_docs/*.pdf
+
+Runs the files in sample_docs/ plus synthetic PDFs of the given page counts.
+"""
+import argparse
+import glob
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic_docs import write_synthetic_pdf
+
+
+def _run(path: str) -> tuple[float, int, int]:
+    from app.services.extractor import iter_blocks
+
+    t = time.perf_counter()
+    blocks = chars = 0
+    for block in iter_blocks(path):
+        blocks += 1
+        chars += len(block)
+    return time.perf_counter() - t, blocks, chars
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", nargs="*", default=None, help="documents to extract (default: sample_docs/*)")
+    parser.add_argument("--pages", type=int, nargs="*", default=[100, 500], help="synthetic PDF page counts")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--pages-per-task", type=int, default=16, help="minimum pages per task")
+    args = parser.parse_args()
+
+    from app.core.config import settings
+    from app.services import extractor
+
+    files = args.files if args.files is not None else sorted(glob.glob("sample_docs/*"))
+    tmp = tempfile.mkdtemp(prefix="bench-extract-")
+    for n in args.pages:
+        path = os.path.join(tmp, f"synthetic_{n}p.pdf")
+        write_synthetic_pdf(path, n)
+        files.append(path)
+
+    settings.EXTRACT_PAGES_PER_TASK = args.pages_per_task
+    print(f"cpus={os.cpu_count()} pages_per_task={args.pages_per_task}")
+    for path in files:
+        name = os.path.basename(path)
+
+        # Sequential baseline: parallel threshold above any page count
+        settings.EXTRACT_PARALLEL_MIN_PAGES = 10 ** 9
+        dt, blocks, chars = _run(path)
+        print(f"{name:<40} sequential   time={dt:7.2f}s blocks={blocks:<6} chars={chars:,}")
+        if not path.lower().endswith(".pdf"):
+            continue
+
+        settings.EXTRACT_PARALLEL_MIN_PAGES = 1
+        for workers in args.workers:
+            settings.EXTRACT_WORKERS = workers
+            extractor.shutdown_pool()
+            _run(path)  # warm the pool (process spawn + imports) outside the timing
+            dt_par, blocks_par, _ = _run(path)
+            print(
+                f"{name:<40} workers={workers:<4} time={dt_par:7.2f}s blocks={blocks_par:<6} "
+                f"speedup={dt / dt_par:4.2f}x"
+            )
+        extractor.shutdown_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""
+End-to-end ingestion throughput and query latency against the local stub server.
+
+    python -m benchmarks.bench_pipeline --docs 50 --sections 40 --queries 200 --out bench.json
+    python -m benchmarks.bench_pipeline --docs 50 --compare bench.json --max-regression 0.15
+
+Builds a synthetic corpus (txt/md/pdf/docx mix, fixed seeds) in a throwaway data dir,
+runs every document through the real ingest path (extract -> chunk -> embed -> FAISS
+add/save -> DB rows), then the query path (embed -> retrieve -> LLM stages) and
+retrieval-only search. Reports docs/s, chunks/s and p50/p95/p99 per stage as JSON;
+--compare diffs against an earlier report and exits 1 on a p95/throughput regression.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.stub_openai import StubConfig, start_stub_server
+from benchmarks.synthetic_docs import synthetic_text, write_synthetic_docx, write_synthetic_pdf
+
+FORMATS = ("txt", "md", "pdf", "docx")
+
+
+def _summary(samples_s: list[float]) -> dict:
+    if not samples_s:
+        return {"n": 0}
+    ms = np.asarray(samples_s) * 1000.0
+    return {
+        "n": int(ms.size),
+        "mean_ms": round(float(ms.mean()), 2),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        "max_ms": round(float(ms.max()), 2),
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _write_corpus(root: str, n_docs: int, sections: int, formats: list[str], seed: int) -> list[str]:
+    os.makedirs(root, exist_ok=True)
+    paths = []
+    for i in range(n_docs):
+        fmt = formats[i % len(formats)]
+        path = os.path.join(root, f"doc_{i:05d}.{fmt}")
+        if fmt == "pdf":
+            # ~5 sentences per line block; 2 pages per section keeps sizes comparable
+            write_synthetic_pdf(path, pages=max(1, sections * 2 // 3), seed=seed + i)
+        elif fmt == "docx":
+            write_synthetic_docx(path, sections, seed=seed + i)
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(synthetic_text(sections, seed=seed + i))
+        paths.append(path)
+    return paths
+
+
+def _bench_ingest(paths: list[str], workers: int) -> dict:
+    from app.db.models import Document
+    from app.db.session import SessionLocal
+    from app.services.ingest import ingest_document
+
+    stages: dict[str, list[float]] = {}
+    totals: list[float] = []
+    chunks = 0
+
+    def one(path: str) -> int:
+        with SessionLocal() as db:
+            doc = Document(id=str(uuid.uuid4()), filename=os.path.basename(path), source_type="benchmark")
+            db.add(doc)
+            db.commit()
+
+            marks: list[tuple[str, float]] = []
+            t0 = time.perf_counter()
+            n = ingest_document(db, doc, path, on_stage=lambda name: marks.append((name, time.perf_counter())))
+            end = time.perf_counter()
+
+        # Stage duration = time until the next stage starts (the last one runs to the end)
+        for (name, start), (_, nxt) in zip(marks, marks[1:] + [("end", end)]):
+            stages.setdefault(name, []).append(nxt - start)
+        totals.append(end - t0)
+        return n
+
+    t = time.perf_counter()
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            chunks = sum(pool.map(one, paths))
+    else:
+        chunks = sum(one(p) for p in paths)
+    wall = time.perf_counter() - t
+
+    return {
+        "docs": len(paths),
+        "chunks": chunks,
+        "workers": workers,
+        "wall_s": round(wall, 3),
+        "docs_per_s": round(len(paths) / wall, 2),
+        "chunks_per_s": round(chunks / wall, 1),
+        "stages": {name: _summary(v) for name, v in stages.items()},
+        "per_doc": _summary(totals),
+    }
+
+
+def _questions(n: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    words = synthetic_text(4, seed=seed).split()
+    return [f"What does the document say about {' '.join(rng.sample(words, 3))}?" for _ in range(n)]
+
+
+def _bench_query(questions: list[str], top_k: int, mode: str, concurrency: int) -> dict:
+    from app.db.session import SessionLocal
+    from app.services.embedder import embed_query, get_embedding_dim
+    from app.services.collections import DEFAULT_COLLECTION, get_collection
+    from app.services.context_assembly import assembly_stats
+    from app.services.rag import generate_answer, prepare_context, search_chunks
+
+    store = get_collection(DEFAULT_COLLECTION, get_embedding_dim())
+    stages: dict[str, list[float]] = {"embed": [], "retrieve": [], "llm": [], "total": []}
+    search_lat: list[float] = []
+
+    def one(question: str) -> None:
+        with SessionLocal() as db:
+            t0 = time.perf_counter()
+            qvec = embed_query(question)
+            t1 = time.perf_counter()
+            ctx = prepare_context(db, store, question, top_k, qvec=qvec)
+            t2 = time.perf_counter()
+            generate_answer(question, ctx, mode)
+            t3 = time.perf_counter()
+        stages["embed"].append(t1 - t0)
+        stages["retrieve"].append(t2 - t1)
+        stages["llm"].append(t3 - t2)
+        stages["total"].append(t3 - t0)
+
+    t = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        list(pool.map(one, questions))
+    wall = time.perf_counter() - t
+
+    # Retrieval-only path (/v1/search), query embedding included (caches are off)
+    with SessionLocal() as db:
+        for question in questions:
+            ts = time.perf_counter()
+            search_chunks(db, store, question, top_k)
+            search_lat.append(time.perf_counter() - ts)
+
+    return {
+        "queries": len(questions),
+        "mode": mode,
+        "concurrency": concurrency,
+        "wall_s": round(wall, 3),
+        "queries_per_s": round(len(questions) / wall, 2),
+        "stages": {name: _summary(v) for name, v in stages.items()},
+        "search": _summary(search_lat),
+        "context": assembly_stats.stats(),
+    }
+
+
+def _flatten(report: dict) -> dict[str, float]:
+    """
+    Comparable metrics as {dotted path: value}: throughputs (*_per_s) and p95 latencies.
+    """
+    out = {}
+    for section in ("ingest", "query"):
+        data = report.get(section) or {}
+        for key in ("docs_per_s", "chunks_per_s", "queries_per_s"):
+            if key in data:
+                out[f"{section}.{key}"] = float(data[key])
+        for name, summary in (data.get("stages") or {}).items():
+            if "p95_ms" in summary:
+                out[f"{section}.{name}.p95_ms"] = float(summary["p95_ms"])
+        if "p95_ms" in (data.get("search") or {}):
+            out[f"{section}.search.p95_ms"] = float(data["search"]["p95_ms"])
+    return out
+
+
+def compare(current: dict, baseline: dict, max_regression: float, min_delta_ms: float = 5.0) -> list[str]:
+    """
+    Lines describing each metric's change; those worse by more than `max_regression`
+    (relative) start with "REGRESSION". Latencies must also have grown by `min_delta_ms`,
+    so sub-millisecond stages do not flag on noise.
+    """
+    cur, base = _flatten(current), _flatten(baseline)
+    lines = []
+    for key in sorted(cur.keys() & base.keys()):
+        old, new = base[key], cur[key]
+        if old <= 0:
+            continue
+        change = (new - old) / old
+        higher_is_better = key.endswith("_per_s")
+        worse = -change if higher_is_better else change
+        regressed = worse > max_regression and (higher_is_better or new - old >= min_delta_ms)
+        tag = "REGRESSION" if regressed else "ok"
+        lines.append(f"{tag:<10} {key:<40} {old:>10.2f} -> {new:>10.2f} ({change:+.1%})")
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=20)
+    parser.add_argument("--sections", type=int, default=20, help="sections per document (~20 sentences each)")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--ingest-workers", type=int, default=1, help="documents ingested at once")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--query-concurrency", type=int, default=4)
+    parser.add_argument("--top-k", type=int, default=6)
+    parser.add_argument("--mode", choices=["multi", "fast"], default="multi")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="stub embeddings latency per request")
+    parser.add_argument("--per-item-ms", type=float, default=0.2)
+    parser.add_argument("--chat-latency-ms", type=float, default=300.0)
+    parser.add_argument("--token-ms", type=float, default=2.0)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="write the JSON report here (default: stdout only)")
+    parser.add_argument("--compare", default=None, help="baseline JSON report to diff against")
+    parser.add_argument("--max-regression", type=float, default=0.15, help="allowed relative slowdown")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="ignore latency changes below this")
+    args = parser.parse_args()
+
+    # Paths are read from the environment at import time: point them at a throwaway dir
+    # before anything from `app` is imported
+    data_dir = tempfile.mkdtemp(prefix="bench-pipeline-")
+    os.environ.update({
+        "DATA_DIR": data_dir,
+        "UPLOAD_DIR": os.path.join(data_dir, "uploads"),
+        "FAISS_DIR": os.path.join(data_dir, "faiss_index"),
+        "DB_URL": f"sqlite:///{os.path.join(data_dir, 'app.db')}",
+    })
+
+    cfg = StubConfig(
+        dim=args.dim,
+        latency_ms=args.latency_ms,
+        per_item_ms=args.per_item_ms,
+        chat_latency_ms=args.chat_latency_ms,
+        token_ms=args.token_ms,
+    )
+    server = start_stub_server(cfg)
+
+    from app.core.config import settings
+    from app.db.models import Base
+    from app.db.session import engine
+
+    settings.OPENAI_API_KEY = "stub"
+    settings.OPENAI_BASE_URL = f"http://127.0.0.1:{server.server_port}/v1"
+    # Measure the pipeline, not the caches
+    settings.EMBED_CACHE_ENABLED = False
+    settings.ANSWER_CACHE_ENABLED = False
+    Base.metadata.create_all(bind=engine)
+
+    paths = _write_corpus(os.path.join(data_dir, "corpus"), args.docs, args.sections, args.formats, args.seed)
+    print(f"[BENCH] corpus docs={len(paths)} bytes={sum(os.path.getsize(p) for p in paths):,} dir={data_dir}",
+          file=sys.stderr)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+            "settings": {
+                "FAISS_INDEX_TYPE": settings.FAISS_INDEX_TYPE,
+                "CHUNK_MAX_TOKENS": settings.CHUNK_MAX_TOKENS,
+                "INGEST_EMBED_GROUP": settings.INGEST_EMBED_GROUP,
+                "EMBED_CONCURRENCY": settings.EMBED_CONCURRENCY,
+                "EMBED_BATCH_MAX_ITEMS": settings.EMBED_BATCH_MAX_ITEMS,
+            },
+        },
+    }
+    report["ingest"] = _bench_ingest(paths, args.ingest_workers)
+    report["query"] = _bench_query(_questions(args.queries, args.seed), args.top_k, args.mode, args.query_concurrency)
+    server.shutdown()
+
+    from app.services.extractor import shutdown_pool
+    shutdown_pool()
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        lines = compare(report, baseline, args.max_regression, args.min_delta_ms)
+        print("\n".join(lines), file=sys.stderr)
+        if any(line.startswith("REGRESSION") for line in lines):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
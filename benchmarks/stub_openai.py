@@ -0,0 +1,205 @@
+"""
+Minimal OpenAI-compatible stub server for benchmarks (stdlib only).
+
+Serves POST /v1/embeddings with deterministic vectors and POST /v1/chat/completions
+(plain or streamed) with canned answers after configurable delays, so the pipeline
+can be measured without network noise or API spend.
+
+Usage:
+    python -m benchmarks.stub_openai --port 8765 --latency-ms 80 --per-item-ms 0.5
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stub uv run uvicorn app.main:app
+"""
+import argparse
+import base64
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+class StubConfig:
+    def __init__(
+        self,
+        dim: int = 1536,
+        latency_ms: float = 50.0,
+        per_item_ms: float = 0.0,
+        chat_latency_ms: float = 300.0,
+        token_ms: float = 5.0,
+    ):
+        self.dim = dim
+        self.latency_ms = latency_ms
+        self.per_item_ms = per_item_ms
+        # Chat: delay before the first token, then per generated token
+        self.chat_latency_ms = chat_latency_ms
+        self.token_ms = token_ms
+
+        self.requests = 0
+        self.items = 0
+        self._lock = threading.Lock()
+
+    def record(self, n_items: int) -> None:
+        with self._lock:
+            self.requests += 1
+            self.items += n_items
+
+
+def _vector(text: str, dim: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vec = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vec / np.linalg.norm(vec)
+
+
+_ANSWER = (
+    "Based on the provided context, the documents describe the requested topic. "
+    "The relevant details are summarized from Context #1 and Context #2."
+)
+
+
+def _chat_content(prompt: str) -> str:
+    # The completeness/enrichment prompts ask for strict JSON; everything else gets prose
+    if "Return STRICT JSON" not in prompt:
+        return _ANSWER
+    schema = prompt.split("Return STRICT JSON")[-1]
+    if "- answer:" in schema:
+        return json.dumps({
+            "answer": _ANSWER,
+            "confidence": 0.8,
+            "missing_info": ["Exact effective date."],
+            "enrichment_suggestions": [{"type": "document", "suggestion": "Upload the missing policy."}],
+        })
+    if "enrichment_suggestions" in schema:
+        return json.dumps({"enrichment_suggestions": [{"type": "document", "suggestion": "Upload the missing policy."}]})
+    return json.dumps({"confidence": 0.8, "missing_info": ["Exact effective date."]})
+
+
+def _usage(prompt: str, tokens: list[str]) -> dict:
+    prompt_tokens = len(prompt) // 4 + 1
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens + len(tokens)}
+
+
+def _make_handler(cfg: StubConfig):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):  # keep benchmark output clean
+            pass
+
+        def _send(self, status: int, payload: dict) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            req = json.loads(self.rfile.read(length) or b"{}")
+
+            if self.path.rstrip("/").endswith("/embeddings"):
+                return self._embeddings(req)
+            if self.path.rstrip("/").endswith("/chat/completions"):
+                return self._chat(req)
+            self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+
+        def _embeddings(self, req: dict) -> None:
+            inputs = req.get("input") or []
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            cfg.record(len(inputs))
+            time.sleep((cfg.latency_ms + cfg.per_item_ms * len(inputs)) / 1000.0)
+
+            as_base64 = req.get("encoding_format") == "base64"
+            data = []
+            for i, text in enumerate(inputs):
+                vec = _vector(str(text), cfg.dim)
+                emb = base64.b64encode(vec.tobytes()).decode("ascii") if as_base64 else vec.tolist()
+                data.append({"object": "embedding", "index": i, "embedding": emb})
+
+            tokens = sum(len(str(t)) // 4 + 1 for t in inputs)
+            self._send(200, {
+                "object": "list",
+                "data": data,
+                "model": req.get("model", "stub"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            })
+
+        def _chat(self, req: dict) -> None:
+            prompt = "\n".join(str(m.get("content", "")) for m in req.get("messages") or [])
+            content = _chat_content(prompt)
+            tokens = content.split(" ")
+            cfg.record(1)
+            time.sleep(cfg.chat_latency_ms / 1000.0)
+
+            base = {"id": "chatcmpl-stub", "created": int(time.time()), "model": req.get("model", "stub")}
+            if not req.get("stream"):
+                time.sleep(cfg.token_ms * len(tokens) / 1000.0)
+                return self._send(200, {
+                    **base,
+                    "object": "chat.completion",
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": _usage(prompt, tokens),
+                })
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for i, tok in enumerate(tokens):
+                time.sleep(cfg.token_ms / 1000.0)
+                chunk = {
+                    **base,
+                    "object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "delta": {"content": tok if i == 0 else " " + tok}, "finish_reason": None}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            done = {**base, "object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            self.wfile.write(f"data: {json.dumps(done)}\n\n".encode("utf-8"))
+            if (req.get("stream_options") or {}).get("include_usage"):
+                final = {**base, "object": "chat.completion.chunk", "choices": [], "usage": _usage(prompt, tokens)}
+                self.wfile.write(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            self.close_connection = True
+
+    return Handler
+
+
+def start_stub_server(cfg: StubConfig, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """
+    Starts the stub in a daemon thread. Use port=0 for a free port; the bound
+    base URL is f"http://{host}:{server.server_port}/v1".
+    """
+    server = ThreadingHTTPServer((host, port), _make_handler(cfg))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="fixed delay per request")
+    parser.add_argument("--per-item-ms", type=float, default=0.0, help="extra delay per input")
+    parser.add_argument("--chat-latency-ms", type=float, default=300.0, help="chat delay before the first token")
+    parser.add_argument("--token-ms", type=float, default=5.0, help="chat delay per generated token")
+    args = parser.parse_args()
+
+    cfg = StubConfig(dim=args.dim, latency_ms=args.latency_ms, per_item_ms=args.per_item_ms,
+                     chat_latency_ms=args.chat_latency_ms, token_ms=args.token_ms)
+    server = ThreadingHTTPServer((args.host, args.port), _make_handler(cfg))
+    print(f"Stub OpenAI server on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Synthetic documents for benchmarks: text-only PDFs written directly (no PDF library
+needed), DOCX via python-docx, and plain text, all from a seeded vocabulary.
+"""
+import random
+
+_WORDS = (
+    "policy procedure widget invoice refund shipping warranty customer account security "
+    "access review approval budget vendor contract deadline escalation incident report "
+    "training onboarding compliance audit retention backup network storage service level"
+).split()
+
+
+def _sentences(rng: random.Random, n: int) -> list[str]:
+    out = []
+    for _ in range(n):
+        words = [rng.choice(_WORDS) for _ in range(rng.randint(8, 18))]
+        out.append(" ".join(words).capitalize() + ".")
+    return out
+
+
+def synthetic_text(n_sections: int, sentences_per_section: int = 20, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    parts = []
+    for i in range(n_sections):
+        parts.append(f"SECTION {i + 1} {rng.choice(_WORDS).upper()}")
+        parts.append(" ".join(_sentences(rng, sentences_per_section)))
+    return "\n\n".join(parts) + "\n"
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_synthetic_pdf(path: str, pages: int, lines_per_page: int = 40, seed: int = 0) -> None:
+    """
+    Writes a `pages`-page PDF with Helvetica text lines (a heading + sentence lines per page).
+    """
+    rng = random.Random(seed)
+    objects: list[bytes] = []
+
+    # 1: catalog, 2: page tree, 3: font; then (page, content) pairs
+    page_ids = [4 + 2 * i for i in range(pages)]
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    for i in range(pages):
+        lines = [f"SECTION {i + 1} {rng.choice(_WORDS).upper()}"] + _sentences(rng, lines_per_page - 1)
+        ops = ["BT", "/F1 9 Tf", "11 TL", "40 800 Td"]
+        ops += [f"({_pdf_escape(line[:110])}) Tj T*" for line in lines]
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_ids[i] + 1} 0 R >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for num, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % num + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for off in offsets:
+        out += b"%010d 00000 n \n" % off
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def write_synthetic_docx(path: str, n_sections: int, sentences_per_section: int = 20, seed: int = 0) -> None:
+    from docx import Document
+
+    rng = random.Random(seed)
+    doc = Document()
+    for i in range(n_sections):
+        doc.add_heading(f"Section {i + 1} {rng.choice(_WORDS)}", level=1)
+        for sentence in _sentences(rng, sentences_per_section):
+            doc.add_paragraph(sentence)
+    doc.save(path)
@@ -0,0 +1,15 @@
+import os
+import tempfile
+
+# Point every path/DB setting at a throwaway dir before `app` is imported anywhere
+_TMP = tempfile.mkdtemp(prefix="kb-rag-tests-")
+os.environ.setdefault("DATA_DIR", _TMP)
+os.environ.setdefault("UPLOAD_DIR", os.path.join(_TMP, "uploads"))
+os.environ.setdefault("FAISS_DIR", os.path.join(_TMP, "faiss_index"))
+os.environ.setdefault("DB_URL", f"sqlite:///{os.path.join(_TMP, 'app.db')}")
+os.environ["OPENAI_API_KEY"] = ""
+
+from app.db.models import Base  # noqa: E402
+from app.db.session import engine  # noqa: E402
+
+Base.metadata.create_all(bind=engine)
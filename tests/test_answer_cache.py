@@ -0,0 +1,47 @@
+import numpy as np
+
+from app.services.answer_cache import AnswerCache
+
+
+def _unit(v):
+    v = np.asarray(v, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+def test_exact_and_semantic_tiers_within_scope():
+    cache = AnswerCache(max_items=4, ttl_s=60, threshold=0.95)
+    scope = ("default", 1, "multi", 6)
+    cache.put(scope, "What is the refund policy?", {"answer": "30 days"}, _unit([1, 0, 0]))
+
+    assert cache.get(scope, "  what is the REFUND policy ") == {"answer": "30 days"}
+    assert cache.get(scope, "Refund policy please") is None
+    assert cache.get_similar(scope, _unit([1, 0.1, 0])) == {"answer": "30 days"}
+    assert cache.get_similar(scope, _unit([1, 1, 0])) is None
+    assert cache.get_similar(("default", 1, "fast", 6), _unit([1, 0, 0])) is None
+
+    stats = cache.stats()
+    assert (stats["exact_hits"], stats["semantic_hits"], stats["misses"]) == (1, 1, 2)
+
+
+def test_new_index_version_invalidates_and_lru_evicts():
+    cache = AnswerCache(max_items=2, ttl_s=60, threshold=0.95)
+    for i, q in enumerate(["a?", "b?", "c?"]):
+        cache.put(("default", 1, "multi", 6), q, {"answer": q}, _unit([1, i, 0]))
+    assert cache.get(("default", 1, "multi", 6), "a") is None
+    assert cache.get(("default", 1, "multi", 6), "c") == {"answer": "c?"}
+    assert cache.stats()["evictions"] == 1
+
+    # Another collection's version moving on leaves these entries alone
+    cache.put(("hr", 1, "multi", 6), "d?", {"answer": "d?"})
+    assert cache.get(("hr", 2, "multi", 6), "d") is None
+    assert cache.get(("default", 1, "multi", 6), "c") == {"answer": "c?"}
+
+    assert cache.get(("default", 2, "multi", 6), "c") is None
+    assert cache.stats()["items"] == 0 and cache.stats()["invalidations"] == 2
+
+
+def test_expired_entries_are_not_served():
+    cache = AnswerCache(max_items=2, ttl_s=-1, threshold=0.95)
+    cache.put(("default", 1, "multi", 6), "q", {"answer": "x"}, _unit([1, 0]))
+    assert cache.get(("default", 1, "multi", 6), "q") is None
+    assert cache.get_similar(("default", 1, "multi", 6), _unit([1, 0])) is None
@@ -0,0 +1,58 @@
+from app.services.chunker import iter_chunks
+from app.services.embedder import estimate_tokens
+
+
+def test_chunks_respect_budget_and_sentence_boundaries():
+    sentences = [f"Sentence number {i} says something about widgets." for i in range(400)]
+    pages = [" ".join(sentences[i:i + 40]) for i in range(0, 400, 40)]
+
+    chunks = list(iter_chunks(iter(pages), max_tokens=100, overlap_tokens=20))
+
+    assert all(estimate_tokens(c) <= 100 + 16 for c in chunks)
+    assert all(c.rstrip().endswith(".") for c in chunks)
+    # Nothing is dropped: the last sentence of the last page is indexed
+    assert "Sentence number 399" in chunks[-1]
+    # Consecutive chunks overlap by whole sentences
+    assert chunks[1].splitlines()[0] in chunks[0]
+
+
+def test_headings_start_new_chunks_without_overlap():
+    blocks = [
+        "# Refunds\n" + "Refunds take thirty days. " * 30,
+        "# Shipping\n" + "Shipping is free over fifty dollars. " * 5,
+    ]
+    chunks = list(iter_chunks(blocks, max_tokens=120, overlap_tokens=20))
+
+    shipping = [c for c in chunks if c.startswith("# Shipping")]
+    assert len(shipping) == 1
+    assert "Refunds" not in shipping[0]
+
+
+def test_oversized_sentence_is_split():
+    chunks = list(iter_chunks(["word " * 1000], max_tokens=50, overlap_tokens=0))
+    assert len(chunks) > 1 and all(estimate_tokens(c) <= 50 for c in chunks)
+
+
+def test_consecutive_and_heading_only_content_is_kept():
+    chunks = list(iter_chunks(["# Chapter 1\n## Section 1.1\nThe body sentence is here. Another one."]))
+    assert len(chunks) == 1 and chunks[0].startswith("# Chapter 1\n## Section 1.1\n")
+
+    assert list(iter_chunks(["TITLE ONE\nTITLE TWO\n"])) == ["TITLE ONE\nTITLE TWO"]
+
+
+def test_wrapped_lines_starting_with_numbers_or_keywords_are_not_headings():
+    text = (
+        "Revenue was reported in the annual filing and\n"
+        "2019 revenue grew by five percent over the prior year while\n"
+        "part of the system was replaced.\n"
+        "\n"
+        "2019 revenue grew again\n"
+        "\n"
+        "Section 4 Scope\n"
+        "The scope is narrow."
+    )
+    chunks = list(iter_chunks([text], max_tokens=500, overlap_tokens=0))
+    assert chunks[0].startswith("Revenue was reported in the annual filing and 2019 revenue grew")
+    assert "while part of the system was replaced." in chunks[0]
+    assert "2019 revenue grew again" in chunks[0]
+    assert "\nSection 4 Scope\n" in chunks[0]
@@ -0,0 +1,67 @@
+import numpy as np
+
+from app.services.chunk_store import ChunkRecord
+from app.services.collections import (
+    collection_dirs,
+    create_collection,
+    get_collection,
+    open_collection,
+    reshard_collection,
+)
+from app.services.vector_store import FaissStore
+
+
+def _vectors(n: int, dim: int = 16, seed: int = 0) -> np.ndarray:
+    vecs = np.random.default_rng(seed).random((n, dim), dtype=np.float32)
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+def _records(n: int) -> list[ChunkRecord]:
+    return [ChunkRecord(f"chunk-{i:04d}".ljust(36, "x"), f"doc-{i % 7}", "a.md", i, f"text {i}") for i in range(n)]
+
+
+def test_sharded_collection_routes_by_id_and_merges_topk():
+    create_collection("sharded", shards=3)
+    vecs = _vectors(90)
+
+    w = open_collection("sharded", 16)
+    ids = w.add(vecs, records=_records(90))
+    w.save()
+    assert all(int(i) % 3 == shard for shard, store in enumerate(w.stores) for i in store.id_vectors()[0])
+
+    coll = get_collection("sharded", 16)
+    assert coll.count() == 90 and len(coll.stores) == 3
+
+    # Same ranking as one exact index over everything
+    single = FaissStore(dim=16)
+    single.add(vecs, np.array(ids, dtype=np.int64))
+    for q in (vecs[5], vecs[61]):
+        assert coll.search(q, 8)[0] == single.search(q, 8)[0]
+
+    allowed = np.array(ids[:4], dtype=np.int64)
+    assert set(coll.search(vecs[50], 3, allowed_ids=allowed)[0]) <= set(ids[:4])
+    assert coll.lookup_chunks([ids[17]])[ids[17]].text == "text 17"
+
+    w = open_collection("sharded", 16)
+    assert w.remove([ids[5]]) == 1
+    w.save()
+    assert ids[5] not in get_collection("sharded", 16).search(vecs[5], 5)[0]
+
+
+def test_reshard_keeps_ids_records_and_bumps_content_version():
+    create_collection("resharded", shards=1)
+    vecs = _vectors(40, seed=1)
+    w = open_collection("resharded", 16)
+    ids = w.add(vecs, records=_records(40))
+    w.save()
+    before = get_collection("resharded", 16)
+    old_dirs = collection_dirs("resharded")
+
+    new = reshard_collection("resharded", 16, 4)
+    assert len(collection_dirs("resharded")) == 4 and not set(old_dirs) & set(collection_dirs("resharded"))
+
+    after = get_collection("resharded", 16)
+    assert after.count() == 40 and after.content_version > before.content_version
+    assert sorted(i for s in new.stores for i in s.id_vectors()[0].tolist()) == sorted(ids)
+    assert after.search(vecs[9], 1)[0][0] == ids[9]
+    assert after.lookup_chunks([ids[9]])[ids[9]].chunk_index == 9
@@ -0,0 +1,39 @@
+import numpy as np
+
+from app.services.chunk_store import ChunkRecord
+from app.services.context_assembly import assemble_context, assembly_stats, mmr_order
+
+
+def _chunk(doc: str, index: int, text: str) -> ChunkRecord:
+    return ChunkRecord(f"{doc}-{index}", doc, f"{doc}.md", index, text)
+
+
+def test_mmr_prefers_a_diverse_chunk_over_a_near_duplicate():
+    vectors = np.array([[1.0, 0.0], [0.999, 0.045], [0.6, 0.8]], dtype=np.float32)
+    scores = np.array([0.9, 0.89, 0.7], dtype=np.float32)
+    assert mmr_order(scores, vectors, 1.0) == [0, 1, 2]
+    assert mmr_order(scores, vectors, 0.5) == [0, 2, 1]
+
+
+def test_adjacent_chunks_merge_once_and_the_budget_drops_the_rest():
+    line = "x" * 396
+    chunks = [
+        _chunk("a", 1, f"A1 {line}\nA2 {line}"),
+        _chunk("b", 0, f"B0 {line}\nB1 {line}"),
+        _chunk("a", 2, f"A2 {line}\nA3 {line}"),  # starts with chunk a-1's last line
+        _chunk("c", 5, f"C5 {line}\nC6 {line}"),
+    ]
+    scores = [0.9, 0.8, 0.7, 0.6]
+    before = assembly_stats.stats()["tokens_saved"]
+
+    blocks, report = assemble_context(chunks, scores, token_budget=400, lambda_=1.0)
+    # b-0 does not fit next to a-1, but a-2 only adds one line to it
+    assert [b.text for b in blocks] == [f"A1 {line}\nA2 {line}\nA3 {line}"]
+    assert [c.chunk_id for c in blocks[0].chunks] == ["a-1", "a-2"] and blocks[0].scores == [0.9, 0.7]
+    assert report["chunks_packed"] == 2 and report["contexts"] == 1
+    assert report["tokens_saved"] == report["tokens_retrieved"] - report["tokens_packed"] > 0
+    assert assembly_stats.stats()["tokens_saved"] - before == report["tokens_saved"]
+
+    blocks, report = assemble_context(chunks, scores, token_budget=0, lambda_=1.0)
+    assert [b.chunks[0].chunk_id for b in blocks] == ["a-1", "b-0", "c-5"]
+    assert report["chunks_packed"] == 4
@@ -0,0 +1,16 @@
+from app.core.config import settings
+from app.db.session import engine
+
+
+def _pragma(conn, name: str):
+    return conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+
+
+def test_sqlite_pragmas_are_applied_on_connect():
+    with engine.connect() as conn:
+        assert str(_pragma(conn, "journal_mode")).upper() == settings.SQLITE_JOURNAL_MODE.upper()
+        levels = {"OFF": 0, "NORMAL": 1, "FULL": 2, "EXTRA": 3}
+        assert _pragma(conn, "synchronous") == levels[settings.SQLITE_SYNCHRONOUS.upper()]
+        assert _pragma(conn, "cache_size") == -settings.SQLITE_CACHE_MB * 1024  # negative = KiB
+        assert _pragma(conn, "busy_timeout") == settings.SQLITE_BUSY_TIMEOUT_MS
+        assert _pragma(conn, "temp_store") == 2  # MEMORY
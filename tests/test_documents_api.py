@@ -0,0 +1,69 @@
+import os
+
+from fastapi.testclient import TestClient
+
+from app.api import documents
+from app.core.config import settings
+from app.db.models import Document
+from app.db.session import SessionLocal
+from app.main import app
+
+
+def _upload_files() -> set[str]:
+    return set(os.listdir(settings.UPLOAD_DIR)) if os.path.isdir(settings.UPLOAD_DIR) else set()
+
+
+def test_upload_to_a_full_queue_leaves_no_documents_or_files(monkeypatch):
+    monkeypatch.setattr(settings, "INGEST_MAX_PENDING", 0)
+    with SessionLocal() as db:
+        docs_before = db.query(Document).count()
+    files_before = _upload_files()
+
+    res = TestClient(app).post("/v1/documents/upload", files=[("files", ("full.txt", b"Widgets are blue."))])
+    assert res.status_code == 503
+
+    with SessionLocal() as db:
+        assert db.query(Document).count() == docs_before
+    assert _upload_files() == files_before
+
+
+def test_replace_with_a_full_queue_keeps_the_document_untouched(monkeypatch):
+    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+    old_path = os.path.join(settings.UPLOAD_DIR, "keep-doc_old.txt")
+    with open(old_path, "w") as f:
+        f.write("Widgets are blue.")
+    with SessionLocal() as db:
+        db.add(Document(id="keep-doc", filename="old.txt", source_type="upload"))
+        db.commit()
+
+    monkeypatch.setattr(settings, "INGEST_MAX_PENDING", 0)
+    res = TestClient(app).put("/v1/documents/keep-doc", files={"file": ("new.txt", b"Widgets are red.")})
+    assert res.status_code == 503
+
+    with SessionLocal() as db:
+        assert db.get(Document, "keep-doc").filename == "old.txt"
+    assert os.path.exists(old_path)
+    assert not os.path.exists(os.path.join(settings.UPLOAD_DIR, "keep-doc_new.txt"))
+
+
+def test_failed_same_name_replace_keeps_the_old_upload(monkeypatch):
+    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+    old_path = os.path.join(settings.UPLOAD_DIR, "same-doc_notes.txt")
+    with open(old_path, "w") as f:
+        f.write("Widgets are blue.")
+    with SessionLocal() as db:
+        db.add(Document(id="same-doc", filename="notes.txt", source_type="upload"))
+        db.commit()
+    files_before = _upload_files()
+
+    def failing_copy(src, dst, *args):
+        dst.write(b"Widgets are")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(documents.shutil, "copyfileobj", failing_copy)
+    res = TestClient(app).put("/v1/documents/same-doc", files={"file": ("notes.txt", b"Widgets are red.")})
+    assert res.status_code == 500
+
+    with open(old_path) as f:
+        assert f.read() == "Widgets are blue."
+    assert _upload_files() == files_before
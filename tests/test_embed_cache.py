@@ -0,0 +1,67 @@
+import numpy as np
+
+from app.core.config import settings
+from app.services import embedder
+from app.services.embed_cache import EmbeddingCache, embedding_cache
+
+
+def test_lru_evicts_by_bytes():
+    vec = np.ones(4, dtype=np.float32)  # 16 bytes
+    cache = EmbeddingCache(max_bytes=32)
+    cache._db_put = lambda model, items: None
+    cache.put_many("m", {"a": vec, "b": vec})
+    cache.put_many("m", {"c": vec})
+
+    with cache._lock:
+        assert list(k[1] for k in cache._lru) == ["b", "c"]
+        assert cache._bytes == 32
+
+
+def test_embed_texts_only_sends_distinct_misses(monkeypatch):
+    sent: list[list[str]] = []
+
+    def fake_openai(texts):
+        sent.append(list(texts))
+        return [np.full(8, len(t), dtype=np.float32) for t in texts]
+
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", "test")
+    monkeypatch.setattr(embedder, "_embed_openai", fake_openai)
+    embedding_cache.clear_memory()
+
+    first = embedder.embed_texts(["alpha", "beta", "alpha"])
+    second = embedder.embed_texts(["beta", "gamma!"])
+
+    assert sent == [["alpha", "beta"], ["gamma!"]]
+    assert np.array_equal(first[0], first[2])
+    assert np.array_equal(first[1], second[0])
+    assert embedding_cache.stats()["memory_hits"] >= 1
+
+
+def test_db_tier_survives_memory_clear(monkeypatch):
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", "test")
+    monkeypatch.setattr(embedder, "_embed_openai", lambda texts: [np.ones(8, dtype=np.float32) for _ in texts])
+    embedder.embed_texts(["persisted paragraph"])
+    embedding_cache.clear_memory()
+
+    def fail(texts):
+        raise AssertionError("should have been served from the DB tier")
+
+    monkeypatch.setattr(embedder, "_embed_openai", fail)
+    before = embedding_cache.stats()["db_hits"]
+    embedder.embed_texts(["persisted paragraph"])
+    assert embedding_cache.stats()["db_hits"] == before + 1
+
+
+def test_queries_stay_out_of_the_db_tier(monkeypatch):
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", "test")
+    monkeypatch.setattr(embedder, "_embed_openai", lambda texts: [np.ones(8, dtype=np.float32) for _ in texts])
+
+    def no_db(*args):
+        raise AssertionError("query embeddings must not touch the DB tier")
+
+    monkeypatch.setattr(embedding_cache, "_db_get", no_db)
+    monkeypatch.setattr(embedding_cache, "_db_put", no_db)
+    embedder.embed_query("what colour are widgets?")
+    before = embedding_cache.stats()["memory_hits"]
+    embedder.embed_texts(["what colour are widgets?", "and gadgets?"], is_query=True)
+    assert embedding_cache.stats()["memory_hits"] == before + 1
@@ -0,0 +1,58 @@
+import numpy as np
+
+from app.core.config import settings
+from app.services import embedder
+
+
+def test_pack_batches_respects_token_and_item_budgets():
+    texts = ["x" * 40] * 5 + ["y" * 400] + ["z"]  # ~11 tokens each, then ~101, then 1
+    batches = embedder.pack_batches(texts, max_tokens=40, max_items=3)
+
+    assert [i for b in batches for i in b] == list(range(len(texts)))
+    assert batches[0] == [0, 1, 2]
+    assert [5] in batches  # oversized text gets its own batch
+    assert all(len(b) <= 3 for b in batches)
+
+
+def test_failed_batch_falls_back_without_losing_order(monkeypatch):
+    def fake_request(client, texts):
+        if any(t.startswith("bad") for t in texts):
+            raise RuntimeError("rate limited")
+        return np.stack([np.full(8, float(t[-1]), dtype=np.float32) for t in texts])
+
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", "test")
+    monkeypatch.setattr(settings, "EMBED_CACHE_ENABLED", False)
+    monkeypatch.setattr(settings, "EMBED_BATCH_MAX_ITEMS", 2)
+    monkeypatch.setattr(settings, "EMBED_MAX_RETRIES", 0)
+    monkeypatch.setattr(embedder, "_client", lambda: object())
+    monkeypatch.setattr(embedder, "_request_embeddings", fake_request)
+
+    vectors = embedder.embed_texts(["ok1", "ok2", "bad3", "bad4", "ok5"])
+
+    assert vectors.shape == (5, 8)
+    assert vectors[0, 0] == 1 and vectors[1, 0] == 2 and vectors[4, 0] == 5
+    # Only the failed batch used the local fallback (unit-norm, non-constant)
+    assert np.isclose(np.linalg.norm(vectors[2]), 1.0)
+
+
+def test_local_embedder_is_stateless_batch_independent_and_semantic():
+    from app.services.local_embedder import BLOCK_SIZE, LocalHashEmbedder
+
+    engine = LocalHashEmbedder(dim=256)
+    docs = [
+        "Refunds are accepted within 30 days of purchase with a receipt.",
+        "Remote employees must connect through the corporate VPN.",
+    ]
+    doc_vecs = engine.embed(docs)
+
+    alone = engine.embed([docs[1]])
+    batched = engine.embed(["something else entirely", docs[1]])
+    assert np.allclose(alone[0], batched[1], atol=1e-6)
+    assert np.allclose(np.linalg.norm(doc_vecs, axis=1), 1.0, atol=1e-5)
+
+    # Same vectors from a fresh engine after a lot more text went through this one
+    engine.embed([f"filler document {i} about other things" for i in range(BLOCK_SIZE * 2 + 3)])
+    assert np.array_equal(LocalHashEmbedder(dim=256).embed(docs), engine.embed(docs))
+
+    q = engine.embed(["how many days do I have to get a refund"])[0]
+    assert q @ doc_vecs[0] > q @ doc_vecs[1]
@@ -0,0 +1,40 @@
+from pypdf import PdfReader
+
+from app.core.config import settings
+from app.services import extractor
+from benchmarks.synthetic_docs import write_synthetic_pdf
+
+
+def test_parallel_pdf_extraction_streams_pages_in_order(tmp_path, monkeypatch):
+    path = str(tmp_path / "manual.pdf")
+    write_synthetic_pdf(path, pages=30)
+    expected = [page.extract_text() for page in PdfReader(path).pages]
+
+    monkeypatch.setattr(settings, "EXTRACT_PARALLEL_MIN_PAGES", 1)
+    monkeypatch.setattr(settings, "EXTRACT_WORKERS", 2)
+    monkeypatch.setattr(settings, "EXTRACT_PAGES_PER_TASK", 4)
+    try:
+        assert list(extractor.iter_blocks(path)) == expected
+    finally:
+        extractor.shutdown_pool()
+
+
+def test_pool_reset_by_another_document_resubmits_instead_of_failing(tmp_path, monkeypatch):
+    path = str(tmp_path / "manual.pdf")
+    write_synthetic_pdf(path, pages=30)
+    expected = [page.extract_text() for page in PdfReader(path).pages]
+
+    monkeypatch.setattr(settings, "EXTRACT_PARALLEL_MIN_PAGES", 1)
+    monkeypatch.setattr(settings, "EXTRACT_WORKERS", 2)
+    monkeypatch.setattr(settings, "EXTRACT_PAGES_PER_TASK", 4)
+    try:
+        pages = extractor.iter_blocks(path)
+        got = [next(pages)]
+        # Another document's stuck range tears the shared pool down mid-stream
+        extractor._reset_pool(extractor._get_pool())
+        resets = []
+        monkeypatch.setattr(extractor, "_reset_pool", resets.append)
+        got.extend(pages)
+        assert got == expected and resets == []
+    finally:
+        extractor.shutdown_pool()
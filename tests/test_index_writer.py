@@ -0,0 +1,157 @@
+import pytest
+import numpy as np
+
+from app.db.models import Chunk, Document
+from app.db.session import SessionLocal
+from app.services.chunk_store import ChunkRecord
+from app.services.collections import create_collection, get_collection
+from app.services.index_writer import IndexWriter
+from app.services.vector_store import new_vector_ids, writer_lock
+
+
+def _doc(n: int, doc_id: str, seed: int) -> tuple[np.ndarray, list[int], list[ChunkRecord]]:
+    vecs = np.random.default_rng(seed).random((n, 16), dtype=np.float32)
+    ids = new_vector_ids(n).tolist()
+    records = [ChunkRecord(f"{doc_id}-{i}".ljust(36, "x"), doc_id, f"{doc_id}.md", i, f"{doc_id} {i}") for i in range(n)]
+    return vecs, ids, records
+
+
+def test_queued_commands_apply_as_one_batch_and_replace_tombstones():
+    create_collection("writer", shards=2)
+    with SessionLocal() as db:
+        db.add_all([Document(id=f"w-doc-{i}", filename=f"w-doc-{i}.md", source_type="upload", collection="writer")
+                    for i in range(4)])
+        db.commit()
+
+    writer = IndexWriter()
+    docs = [_doc(5, f"w-doc-{i}", i) for i in range(4)]
+    # Commands queued while another writer holds the lock land in a single batch
+    with writer_lock:
+        futures = [writer.add_document("writer", f"w-doc-{i}", *docs[i]) for i in range(4)]
+        assert not any(f.done() for f in futures)
+    assert [f.result(timeout=10) for f in futures] == [0, 0, 0, 0]
+
+    coll = get_collection("writer", 16)
+    assert coll.count() == 20
+    assert all(len(store.segments) <= 1 for store in coll.stores)  # one save for all four
+
+    vecs, ids, records = _doc(3, "w-doc-0", 9)
+    assert writer.add_document("writer", "w-doc-0", vecs, ids, records, replace=True).result(timeout=10) == 5
+    assert writer.delete_document("writer", "w-doc-1").result(timeout=10) == 5
+    writer.stop()
+
+    coll = get_collection("writer", 16)
+    assert coll.count() == 13
+    assert coll.search(vecs[1], 1)[0][0] == ids[1]
+    with SessionLocal() as db:
+        counts = {i: db.query(Chunk).filter(Chunk.document_id == f"w-doc-{i}").count() for i in range(4)}
+    assert counts == {0: 3, 1: 0, 2: 5, 3: 5}
+
+
+def test_ingest_indexes_group_by_group_and_removes_partial_documents(tmp_path, monkeypatch):
+    from app.services import ingest
+
+    create_collection("stream")
+    path = tmp_path / "doc.txt"
+    path.write_text(" ".join(f"Sentence {i} is about widgets and gadgets." for i in range(60)))
+    monkeypatch.setattr(ingest.settings, "INGEST_EMBED_GROUP", 2)
+    monkeypatch.setattr(ingest.settings, "CHUNK_MAX_TOKENS", 40)
+    monkeypatch.setattr(ingest.settings, "CHUNK_OVERLAP_TOKENS", 0)
+    monkeypatch.setattr(ingest, "persist_embedding_dim", lambda dim: None)
+    embeds = []
+
+    def embed(texts):
+        embeds.append(len(texts))
+        if len(embeds) == fail_at:
+            raise RuntimeError("embedding down")
+        return np.random.default_rng(len(embeds)).random((len(texts), 16), dtype=np.float32)
+
+    fail_at = 0
+    monkeypatch.setattr(ingest, "embed_texts", embed)
+    calls = []
+    monkeypatch.setattr(ingest.index_writer, "add_document", lambda *a, **kw: calls.append(len(a[3])) or
+                        IndexWriter.add_document(ingest.index_writer, *a, **kw))
+
+    with SessionLocal() as db:
+        doc = Document(id="s-doc", filename="doc.txt", source_type="upload", collection="stream")
+        other = Document(id="s-doc-2", filename="doc.txt", source_type="upload", collection="stream")
+        db.add_all([doc, other])
+        db.commit()
+        n = ingest.ingest_document(db, doc, str(path))
+        assert n > 4 and len(calls) == (n + 1) // 2 and max(calls) == 2
+        first = {c.id for c in db.query(Chunk).filter(Chunk.document_id == "s-doc")}
+        indexes = sorted(c.chunk_index for c in db.query(Chunk).filter(Chunk.document_id == "s-doc"))
+        assert indexes == list(range(n))
+
+        assert ingest.ingest_document(db, doc, str(path), replace=True) == n
+        rows = db.query(Chunk).filter(Chunk.document_id == "s-doc").all()
+        assert len(rows) == n and not first & {c.id for c in rows}
+        assert sorted(c.chunk_index for c in rows) == list(range(n))
+        current = {(c.id, c.chunk_index, c.faiss_id) for c in rows}
+
+        # A replacement failing after two groups leaves the previous version in place
+        embeds.clear()
+        fail_at = 3
+        with pytest.raises(RuntimeError):
+            ingest.ingest_document(db, doc, str(path), replace=True)
+        db.expire_all()
+        rows = db.query(Chunk).filter(Chunk.document_id == "s-doc").all()
+        assert {(c.id, c.chunk_index, c.faiss_id) for c in rows} == current
+        assert get_collection("stream", 16).count() == n
+
+        # Fails after two groups were indexed: they are removed again
+        embeds.clear()
+        with pytest.raises(RuntimeError):
+            ingest.ingest_document(db, other, str(path))
+        assert len(embeds) == 3
+        assert db.query(Chunk).filter(Chunk.document_id == "s-doc-2").count() == 0
+    assert get_collection("stream", 16).count() == n
+
+
+def test_failed_db_commit_after_the_index_save_reverts_the_index_changes(monkeypatch):
+    from app.services import index_writer as iw
+
+    create_collection("commit-fail")
+    with SessionLocal() as db:
+        db.add(Document(id="cf-doc", filename="cf-doc.md", source_type="upload", collection="commit-fail"))
+        db.commit()
+
+    def failing_session():
+        db = SessionLocal()
+        db.commit = lambda: (_ for _ in ()).throw(RuntimeError("database is locked"))
+        return db
+
+    writer = IndexWriter()
+    vecs, ids, records = _doc(4, "cf-doc", 3)
+    assert writer.add_document("commit-fail", "cf-doc", vecs, ids, records).result(timeout=10) == 0
+
+    monkeypatch.setattr(iw, "SessionLocal", failing_session)
+    future = writer.add_document("commit-fail", "cf-doc", *_doc(3, "cf-doc", 4), replace=True)
+    with pytest.raises(RuntimeError, match="database is locked"):
+        future.result(timeout=10)
+    writer.stop()
+
+    # The new vectors are tombstoned again, the replaced ones revived
+    coll = get_collection("commit-fail", 16)
+    assert coll.count() == 4 and coll.search(vecs[2], 1)[0][0] == ids[2]
+    with SessionLocal() as db:
+        assert db.query(Chunk).filter(Chunk.document_id == "cf-doc").count() == 4
+
+
+def test_bulk_insert_writes_every_chunk_row_with_its_64_bit_id():
+    create_collection("bulk")
+    with SessionLocal() as db:
+        db.add(Document(id="bulk-doc", filename="bulk-doc.md", source_type="upload", collection="bulk"))
+        db.commit()
+
+    vecs, ids, records = _doc(50, "bulk-doc", 3)
+    assert all(i >= 2 ** 32 for i in ids)
+    writer = IndexWriter()
+    writer.add_document("bulk", "bulk-doc", vecs, ids, records).result(timeout=10)
+    writer.stop()
+
+    with SessionLocal() as db:
+        rows = db.query(Chunk).filter(Chunk.document_id == "bulk-doc").order_by(Chunk.chunk_index).all()
+    assert [(r.id, r.chunk_index, r.faiss_id, r.text) for r in rows] == [
+        (rec.chunk_id, rec.chunk_index, fid, rec.text) for rec, fid in zip(records, ids)
+    ]
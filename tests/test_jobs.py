@@ -0,0 +1,80 @@
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import jobs
+
+
+def _wait_for(client: TestClient, job_id: str, ready, timeout_s: float = 5.0) -> dict:
+    deadline = time.monotonic() + timeout_s
+    while True:
+        job = client.get(f"/v1/jobs/{job_id}").json()
+        if ready(job) or time.monotonic() > deadline:
+            return job
+        time.sleep(0.01)
+
+
+def test_job_reports_stages_then_completes(monkeypatch):
+    release = threading.Event()
+
+    def fake_ingest(db, doc, path, on_stage=None, **kwargs):
+        on_stage("extract")
+        release.wait(5)
+        on_stage("embed")
+        return 3
+
+    monkeypatch.setattr(jobs, "ingest_document", fake_ingest)
+    client = TestClient(app)
+    res = client.post("/v1/documents/upload", files=[("files", ("notes.txt", b"Widgets are blue."))])
+    assert res.status_code == 202
+    body = res.json()
+    assert body["status"] == "queued" and body["status_url"] == f"/v1/jobs/{body['job_id']}"
+
+    job = _wait_for(client, body["job_id"], lambda j: j["files"][0]["stage"] == "extract")
+    assert job["status"] == "running" and job["processed_files"] == 0
+
+    release.set()
+    job = _wait_for(client, body["job_id"], lambda j: j["status"] == "completed")
+    assert job["status"] == "completed" and job["processed_files"] == job["total_files"] == 1
+    entry = job["files"][0]
+    assert entry["stage"] == "done" and entry["chunks"] == 3 and entry["error"] is None
+    assert set(entry["timings"]) == {"extract", "embed"}
+
+
+def test_failed_file_fails_the_job(monkeypatch):
+    def fake_ingest(db, doc, path, on_stage=None, **kwargs):
+        on_stage("extract")
+        raise ValueError("no text found")
+
+    monkeypatch.setattr(jobs, "ingest_document", fake_ingest)
+    client = TestClient(app)
+    res = client.post("/v1/documents/upload", files=[("files", ("empty.txt", b" "))])
+    job = _wait_for(client, res.json()["job_id"], lambda j: j["status"] in ("completed", "failed"))
+    assert job["status"] == "failed" and job["files"][0]["stage"] == "failed"
+    assert job["error"] == "empty.txt: no text found"
+    assert client.get("/v1/jobs/no-such-job").status_code == 404
+
+
+def test_delete_is_refused_while_the_document_is_ingesting(monkeypatch):
+    release = threading.Event()
+
+    def fake_ingest(db, doc, path, on_stage=None, **kwargs):
+        on_stage("extract")
+        release.wait(5)
+        return 1
+
+    monkeypatch.setattr(jobs, "ingest_document", fake_ingest)
+    client = TestClient(app)
+    body = client.post("/v1/documents/upload", files=[("files", ("busy.txt", b"Widgets are blue."))]).json()
+    doc_id = body["documents"][0]["document_id"]
+
+    res = client.delete(f"/v1/documents/{doc_id}")
+    assert res.status_code == 409
+
+    release.set()
+    job = _wait_for(client, body["job_id"], lambda j: j["status"] == "completed")
+    assert job["status"] == "completed"
+    res = client.delete(f"/v1/documents/{doc_id}")
+    assert res.status_code == 200 and res.json()["deleted"] is True
@@ -0,0 +1,26 @@
+from app.services import metrics
+
+
+def test_spans_feed_histogram_and_active_trace():
+    with metrics.trace() as tr:
+        with metrics.span("test.outer"):
+            with metrics.span("test.inner"):
+                pass
+    with metrics.span("test.inner"):  # outside any trace: histogram only
+        pass
+
+    assert [s["stage"] for s in tr.breakdown()] == ["test.outer", "test.inner"]
+    text = metrics.render()
+    assert 'kb_stage_seconds_count{stage="test.inner"} 2' in text
+    assert 'kb_stage_seconds_bucket{stage="test.outer",le="+Inf"} 1' in text
+
+
+def test_counter_and_collector_render_prometheus_text():
+    c = metrics.counter("kb_test_total", "Test counter.")
+    c.inc(2, kind='a"b')
+    metrics.register_collector(lambda: [("kb_test_gauge", "gauge", "Test gauge.", [({}, 3)])])
+
+    text = metrics.render()
+    assert "# TYPE kb_test_total counter" in text
+    assert 'kb_test_total{kind="a\\"b"} 2' in text
+    assert "# TYPE kb_test_gauge gauge\nkb_test_gauge 3" in text
@@ -0,0 +1,97 @@
+from types import SimpleNamespace
+
+from app.services import rag
+
+
+def test_stream_answer_sends_citations_then_tokens_then_assessment(monkeypatch):
+    monkeypatch.setattr(rag, "chat_text_stream", lambda prompt, **kw: iter(["Widgets ", "are ", "blue."]))
+    monkeypatch.setattr(rag, "chat_json", lambda prompt, **kw: {"confidence": 0.9, "missing_info": []})
+
+    ctx = {"contexts": ["Widgets are blue."], "scores": [0.8], "citations": [{"context_ref": "Context #1"}]}
+    events = list(rag.stream_answer("What color are widgets?", ctx))
+
+    names = [name for name, _ in events]
+    assert names == ["citations", "token", "token", "token", "answer", "assessment", "done"]
+    assert events[4][1] == {"answer": "Widgets are blue."}
+    assert events[5][1]["confidence"] == 0.9
+
+
+def test_stream_answer_reports_llm_failure_as_error_event(monkeypatch):
+    def broken(prompt, **kw):
+        raise RuntimeError("upstream down")
+        yield  # pragma: no cover
+
+    monkeypatch.setattr(rag, "chat_text_stream", broken)
+    ctx = {"contexts": ["x"], "scores": [0.5], "citations": []}
+    events = list(rag.stream_answer("q?", ctx))
+    assert [name for name, _ in events] == ["citations", "error"]
+
+
+def test_fast_mode_uses_one_call_and_falls_back_on_invalid_json(monkeypatch):
+    ctx = {"contexts": ["Widgets are blue."], "scores": [0.8], "citations": []}
+    monkeypatch.setattr(rag.settings, "ANSWER_CACHE_ENABLED", False)
+    monkeypatch.setattr(rag, "prepare_context", lambda db, store, q, k, qvec=None: ctx)
+
+    calls = []
+
+    def fake_chat_text(prompt, usage=None, json_mode=False, **kw):
+        calls.append("json" if json_mode else "text")
+        usage["calls"] += 1
+        if json_mode:
+            return replies.pop(0)
+        return "Widgets are blue [Context #1]."
+
+    monkeypatch.setattr(rag, "chat_text", fake_chat_text)
+    monkeypatch.setattr(rag, "chat_json", lambda prompt, usage=None: {"confidence": 0.7, "missing_info": []})
+
+    replies = ['{"answer": "Blue [Context #1].", "confidence": 0.9, "missing_info": [], "enrichment_suggestions": []}']
+    out = rag.answer_question(None, SimpleNamespace(name="default", content_version=0), "What color are widgets?", 3, mode="fast")
+    assert out["answer"] == "Blue [Context #1]." and out["confidence"] == 0.9
+    assert calls == ["json"]
+
+    calls.clear()
+    replies = ['{"answer": "Blue", "confidence": 7}']
+    out = rag.answer_question(None, SimpleNamespace(name="default", content_version=0), "What color are widgets?", 3, mode="fast")
+    assert out["answer"] == "Widgets are blue [Context #1]." and out["confidence"] == 0.7
+    assert calls == ["json", "text"]
+
+    fast = rag.pipeline_stats.stats()["fast"]
+    assert fast["requests"] == 2 and fast["fallbacks"] == 1
+
+
+def test_answer_batch_searches_once_and_keeps_order_with_item_errors(monkeypatch):
+    import numpy as np
+
+    from app.services.chunk_store import ChunkRecord
+
+    monkeypatch.setattr(rag.settings, "ANSWER_CACHE_ENABLED", False)
+    monkeypatch.setattr(rag, "embed_texts", lambda texts, is_query=False: np.eye(3, dtype=np.float32)[: len(texts)])
+
+    searches = []
+
+    class Store:
+        name = "default"
+        content_version = 0
+
+        def search_matrix(self, q, k):
+            searches.append(q.shape)
+            return np.array([[0.9], [0.8], [0.7]], dtype=np.float32), np.array([[11], [12], [-1]])
+
+        def lookup_chunks(self, ids):
+            return {i: ChunkRecord(f"c{i}", "d", "a.md", 0, f"text {i}") for i in ids}
+
+    def fake_answer(question, ctx, mode):
+        if question == "boom?":
+            raise RuntimeError("llm down")
+        return {"answer": ctx["contexts"][0], "citations": ctx["citations"]}
+
+    monkeypatch.setattr(rag, "generate_answer", fake_answer)
+    out = rag.answer_batch(None, Store(), ["one?", "boom?", "none?"], 1)
+    assert searches == [(3, 3)]
+    assert [item["index"] for item in out] == [0, 1, 2]
+    assert out[0]["result"]["answer"] == "text 11"
+    assert out[1]["error"] == "llm down" and "result" not in out[1]
+
+    retrieval = rag.answer_batch(None, Store(), ["one?", "two?", "none?"], 1, retrieval_only=True)
+    assert retrieval[1]["result"]["citations"][0]["chunk_id"] == "c12"
+    assert retrieval[2]["result"] == {"citations": []}
@@ -0,0 +1,29 @@
+import os
+import subprocess
+import sys
+
+from app.core.lazy import lazy_import, lazy_modules
+
+
+def test_lazy_module_imports_on_first_attribute_access():
+    mod = lazy_import("json.tool")
+    assert lazy_import("json.tool") is mod
+    assert not mod.loaded and lazy_modules()["json.tool"] is None
+
+    assert callable(mod.main)
+    assert mod.loaded and lazy_modules()["json.tool"] >= 0
+
+
+def test_app_and_cli_imports_defer_heavy_modules():
+    code = (
+        "import sys, app.main, app.cli, app.services.index_eval; "
+        "from app.core import startup; "
+        "print(','.join(m for m in ('faiss.loader', 'pypdf._reader', 'docx.api', 'openai._client') if m in sys.modules)); "
+        "print('numpy' in sys.modules, 'import.numpy' in startup.report()['phases'])"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=root, check=True)
+    deferred, numpy = out.stdout.split("\n")[:2]
+    assert deferred == ""
+    # numpy is the deliberate exception: eager, and timed in the startup report
+    assert numpy == "True True"
@@ -0,0 +1,251 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.services.vector_store import FaissStore, index_kind
+
+
+def _vectors(n: int, dim: int = 16, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).random((n, dim), dtype=np.float32)
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw"])
+def test_remove_hides_vectors_and_compact_keeps_ids(index_type):
+    store = FaissStore(dim=16, index_type=index_type)
+    vecs = _vectors(50)
+    ids = store.add(vecs)
+
+    assert len(set(ids)) == 50 and min(ids) >= 1 << 32
+    assert store.search(vecs[7], 1)[0][0] == ids[7]
+
+    store.remove([ids[7]])
+    assert ids[7] not in store.search(vecs[7], 5)[0]
+    assert store.count() == 49
+
+    assert store.compact() == 1
+    assert store.index.ntotal == 49 and not store.tombstones
+    assert index_kind(store.index) == index_type
+    assert store.search(vecs[8], 1)[0][0] == ids[8]
+
+
+def test_ivf_store_trains_once_threshold_is_reached(monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "FAISS_IVF_TRAIN_THRESHOLD", 400)
+    store = FaissStore(dim=16, index_type="ivf")
+
+    ids = store.add(_vectors(300))
+    assert not store.maybe_train() and index_kind(store.index) == "flat"
+    ids += store.add(_vectors(200, seed=1))
+    assert store.maybe_train() and index_kind(store.index) == "ivf"
+
+    stored_ids, _ = store.id_vectors()
+    assert sorted(stored_ids.tolist()) == sorted(ids)
+
+
+def test_saves_append_segments_and_merge_folds_them(monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "FAISS_SEGMENT_MERGE_MIN", 3)
+    writer = FaissStore(dim=16).load_or_create(load_segments=False)
+    assert writer.count() == 0
+
+    vecs = [_vectors(20, seed=i) for i in range(3)]
+    ids = []
+    for v in vecs:
+        w = FaissStore(dim=16).load_or_create(load_segments=False)
+        ids.append(w.add(v))
+        w.save()
+    w = FaissStore(dim=16).load_or_create(load_segments=False)
+    w.remove(ids[0][:5])
+    w.save()
+
+    reader = FaissStore(dim=16).load_or_create()
+    assert len(reader.segments) == 3 and reader.count() == 55
+    assert reader.search(vecs[2][3], 1)[0][0] == ids[2][3]
+    assert ids[0][0] not in reader.search(vecs[0][0], 5)[0]
+
+    # A reload reuses the already-loaded immutable segments
+    again = FaissStore(dim=16).load_or_create(previous=reader)
+    assert all(a.index is b.index for a, b in zip(again.segments, reader.segments))
+
+    files = reader.merge_candidates()
+    assert len(files) == 3
+    reader.merge(files)
+    reader.save()
+
+    merged = FaissStore(dim=16).load_or_create()
+    assert len(merged.segments) == 1 and not merged.tombstones
+    assert merged.count() == 55 and merged.index.ntotal == 55
+    assert merged.search(vecs[1][4], 1)[0][0] == ids[1][4]
+    # Retired files outlive the save (readers may still be loading the old manifest)
+    segments_dir = os.path.join(settings.FAISS_DIR, "segments")
+    assert len(os.listdir(segments_dir)) > 1
+    assert merged.gc_orphans(min_age_s=0) > 0
+    assert sorted(os.listdir(segments_dir)) == [merged.segments[0].file.split(os.sep)[-1]]
+
+
+def test_chunk_sidecars_follow_segments_through_save_and_merge():
+    import shutil
+
+    from app.core.config import settings
+    from app.services.chunk_store import ChunkRecord
+
+    shutil.rmtree(settings.FAISS_DIR, ignore_errors=True)  # start from an empty index
+
+    def records(n: int, doc: str) -> list[ChunkRecord]:
+        return [ChunkRecord(f"{doc}-chunk-{i:04d}".ljust(36, "x"), doc, f"{doc}.md", i, f"{doc} text {i} ü") for i in range(n)]
+
+    w = FaissStore(dim=16).load_or_create(load_segments=False)
+    ids_a = w.add(_vectors(10), records=records(10, "a"))
+    w.save()
+    w = FaissStore(dim=16).load_or_create(load_segments=False)
+    ids_b = w.add(_vectors(5, seed=1))  # no records: e.g. indexed before sidecars
+    w.save()
+
+    reader = FaissStore(dim=16).load_or_create()
+    found = reader.lookup_chunks([ids_a[3], ids_b[0], -1])
+    assert list(found) == [ids_a[3]]
+    assert found[ids_a[3]].text == "a text 3 ü" and found[ids_a[3]].filename == "a.md"
+
+    # Merging carries records over and backfills the rest through `lookup`
+    backfill = dict(zip(ids_b, records(5, "b")))
+    reader.remove([ids_a[0]])
+    reader.merge(None, lookup=lambda ids: {i: backfill[i] for i in ids if i in backfill})
+    reader.save()
+
+    merged = FaissStore(dim=16).load_or_create()
+    assert merged.segments[0].chunks is not None
+    found = merged.lookup_chunks(ids_a + ids_b)
+    assert ids_a[0] not in found and len(found) == 14
+    assert found[ids_b[4]].chunk_index == 4 and found[ids_a[9]].document_id == "a"
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw"])
+def test_allowed_ids_filter_inside_search(index_type):
+    store = FaissStore(dim=16, index_type=index_type)
+    vecs = _vectors(100)
+    ids = store.add(vecs)
+    store.remove([ids[1]])
+
+    allowed = np.array(ids[:10], dtype=np.int64)
+    found, _ = store.search(vecs[50], 5, allowed_ids=allowed)
+    assert len(found) == 5 and set(found) <= set(ids[:10]) - {ids[1]}
+
+    assert store.search(vecs[0], 3, allowed_ids=np.zeros(0, dtype=np.int64))[0] == [-1, -1, -1]
+
+
+@pytest.mark.parametrize("quant", ["sq8", "pq"])
+def test_quantized_merge_keeps_float32_copies_for_rescoring(monkeypatch, quant):
+    import shutil
+
+    from app.core.config import settings
+
+    shutil.rmtree(settings.FAISS_DIR, ignore_errors=True)
+    monkeypatch.setattr(settings, "FAISS_QUANTIZATION", quant)
+    monkeypatch.setattr(settings, "FAISS_QUANTIZE_MIN_VECTORS", 500)
+    monkeypatch.setattr(settings, "FAISS_PQ_M", 4)
+
+    w = FaissStore(dim=16).load_or_create(load_segments=False)
+    vecs = _vectors(600)
+    ids = w.add(vecs)
+    w.save()
+    assert w.kinds() == {"flat": 1}  # appended segments stay float32
+
+    store = FaissStore(dim=16).load_or_create()
+    store.merge(None)
+    store.save()
+    assert store.kinds() == {f"flat+{quant}": 1}
+
+    reader = FaissStore(dim=16).load_or_create()
+    seg = reader.segments[0]
+    assert seg.quant == quant and seg.vectors.shape == (600, 16)
+    # Rescored scores are exact inner products
+    found, scores = reader.search(vecs[42], 3)
+    assert found[0] == ids[42] and scores[0] == pytest.approx(1.0, abs=1e-6)
+
+    # Merging a quantized segment reads the float32 copy, not the lossy codes
+    got_ids, got = reader.id_vectors()
+    assert got_ids.tolist() == ids
+    np.testing.assert_allclose(got, vecs / np.linalg.norm(vecs, axis=1, keepdims=True), atol=1e-6)
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf", "hnsw"])
+def test_mmap_reader_matches_writer_and_refuses_writes(tmp_path, index_type):
+    w = FaissStore(dim=16, path=str(tmp_path)).load_or_create(load_segments=False)
+    vecs = _vectors(400)
+    ids = w.add(vecs)
+    w.rebuild(index_type)
+    w.save()
+
+    reader = FaissStore(dim=16, path=str(tmp_path)).load_or_create(mmap=True)
+    assert reader.read_only and reader.kinds() == {index_type: 1}
+    for q in (vecs[3], vecs[250]):
+        assert reader.search(q, 5) == w.search(q, 5)
+    got = reader.lookup_vectors([ids[7], -1, 12345, ids[300]])
+    assert list(got) == [ids[7], ids[300]]
+    unit = vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+    np.testing.assert_allclose(np.stack(list(got.values())), unit[[7, 300]], atol=1e-5)
+    with pytest.raises(RuntimeError):
+        reader.add(vecs[:1])
+    with pytest.raises(RuntimeError):
+        reader.remove([ids[0]])
+
+
+def test_merge_built_without_the_lock_rebases_onto_newer_writes(tmp_path):
+    w = FaissStore(dim=16, path=str(tmp_path)).load_or_create()
+    vecs = _vectors(60)
+    ids = w.add(vecs[:20])
+    w.save()
+    ids += w.add(vecs[20:40])
+    w.remove([ids[0]])
+    w.save()
+
+    # Maintenance copy merges both segments (dropping ids[0]) while another writer adds and deletes
+    m = FaissStore(dim=16, path=str(tmp_path)).load_or_create()
+    m.merge([seg.file for seg in m.segments])
+    other = FaissStore(dim=16, path=str(tmp_path)).load_or_create()
+    new_ids = other.add(vecs[40:])
+    other.remove([ids[5]])
+    other.save()
+
+    assert m.rebase()
+    m.save()
+    r = FaissStore(dim=16, path=str(tmp_path)).load_or_create()
+    assert len(r.segments) == 2 and r.tombstones == {ids[5]}
+    assert r.count() == 60 - 2
+    assert r.search(vecs[45], 1)[0][0] == new_ids[5]
+    assert r.search(vecs[5], 1)[0][0] != ids[5]
+
+    # A second merge of segments that are gone by now is dropped
+    stale = FaissStore(dim=16, path=str(tmp_path)).load_or_create()
+    stale.merge([seg.file for seg in stale.segments])
+    again = FaissStore(dim=16, path=str(tmp_path)).load_or_create()
+    again.merge([seg.file for seg in again.segments])
+    again.save()
+    assert not stale.rebase()
+
+
+def test_get_store_is_cached_until_the_index_version_changes(tmp_path):
+    from app.services.vector_store import get_index_version, get_store
+
+    path = str(tmp_path / "index")
+    writer = FaissStore(dim=16, path=path).load_or_create()
+    ids = writer.add(_vectors(20))
+    writer.save()
+
+    shared = get_store(16, path)
+    assert get_store(16, path) is shared and shared.count() == 20
+
+    version = get_index_version(path)
+    more = writer.add(_vectors(5, seed=1))
+    writer.save()
+    assert get_index_version(path) == version + 1
+
+    reloaded = get_store(16, path)
+    assert reloaded is not shared and reloaded.count() == 25
+    assert reloaded.search(_vectors(5, seed=1)[0], 1)[0][0] == more[0]
+    # Readers still holding the previous store keep searching it undisturbed
+    assert shared.count() == 20 and shared.search(_vectors(20)[3], 1)[0][0] == ids[3]
+    assert get_store(16, path) is reloaded